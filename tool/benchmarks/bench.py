@@ -0,0 +1,176 @@
+"""Benchmarks for the generation pipeline, run from the tool directory: `python -m benchmarks.bench [--sizes 100,10000] [--json out.json]`.
+
+Each stage is timed on synthetic data (best of `--repeat` runs) and measured once more under
+tracemalloc for peak memory:
+
+  parse            raw main-code / spec text -> `_lines` -> main-product DataFrame (as the page does)
+  expand           `build_frame` without rules, once per `--workers` count
+  expand-pairwise  `build_frame_pairwise` with one combo per main product (cycling through the mix)
+  simplify         a freshly compiled rule set applied to every main code (no memo carried over)
+  export           `df.to_excel` into memory (skipped above `--max-export-rows`)
+
+The result memo is cleared before every timed generation. With `--workers 1,4` the expand stages are timed
+serially and with a 4-process pool (variant `mix/w4`), so the parallel path can be compared with the serial one.
+
+The equivalence of the engine with the row-by-row reference is checked by `python -m pytest tests`; run it
+before timing so the numbers are only reported for output that is still correct.
+
+`--baseline old.json` compares against an earlier `--json` result and exits with 1 when a stage
+is slower than `--tolerance` allows, so a regression can fail a script or CI step.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from combo_core.common import _lines
+from combo_core.engine import build_frame, build_frame_pairwise, clear_result_cache
+from combo_core.rules import CompiledRuleSet
+
+DEFAULT_SIZES = [100, 10_000, 100_000]
+STAGES = ["parse", "expand", "expand-pairwise", "simplify", "export"]
+
+# 模板组合：(组合数, 每个组合的副商品数范围)
+TEMPLATE_MIXES = {
+    "single": (1, (1, 1)),
+    "mixed": (3, (0, 3)),
+    "wide": (20, (1, 2)),
+}
+RULE_SETS = {
+    "literal": ([("_daizhuang", ""), ("wumailan", "wml"), ("-v", "V"), ("XL", "xl"), ("__", "_")], False, True),
+    "literal-ci": ([(f"tok{k}", f"T{k}") for k in range(12)] + [("_daizhuang", ""), ("WUMAILAN", "wml"), ("-V", "")], False, False),
+    "regex": ([(r"_v\d+$", ""), (r"(\d{3})(\d+)", r"\1-\2"), (r"[aeiou]{2,}", "")], True, True),
+}
+
+
+def synthetic_text(n: int, seed: int = 0) -> Tuple[str, str]:
+    r = random.Random(seed)
+    codes = [f"YJ{r.randint(0, 99999):05d}_{r.choice(['wumailan', 'heise', 'tok3'])}_daizhuang-v{r.randint(1, 9)}" for _ in range(n)]
+    specs = [f"{r.choice(['深蓝色', '黑色', '玫红'])}-{r.choice(['16', '18', 'XL'])}" for _ in range(n)]
+    return "\n".join(codes), "\n".join(specs)
+
+
+def synthetic_combos(mix: str, seed: int = 0) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    r = random.Random(seed)
+    n_combos, (lo, hi) = TEMPLATE_MIXES[mix]
+    return [
+        (f"P{c}_", [{"商品编码": f"S{c}_{j}", "数量": r.choice([1, 2]), "应占售价": r.choice([1, 2.5]), "基本售价": 1, "组合成本价": r.choice([0.8, 1])} for j in range(r.randint(lo, hi))])
+        for c in range(n_combos)
+    ]
+
+
+def parse_mains(codes_text: str, specs_text: str) -> pd.DataFrame:
+    codes, specs = _lines(codes_text), _lines(specs_text)
+    return pd.DataFrame([{"主商品编码": c, "主商品组合颜色规格": s, "数量": 1, "应占售价": 1.0, "基本售价": 1.0, "成本价": 1.0} for c, s in zip(codes, specs)])
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(best, 4), "peak_mb": round(peak / 2**20, 2)}
+
+
+def fresh(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """`fn` with the result memo cleared first, so every call really generates."""
+    def call():
+        clear_result_cache()
+        return fn()
+    return call
+
+
+def run(sizes: List[int], mixes: List[str], rule_sets: List[str], stages: List[str], repeat: int, max_export_rows: int,
+        workers: List[int] = (1,)) -> List[Dict[str, Any]]:
+    results = []
+    def record(stage, size, variant, rows, stats):
+        results.append({"stage": stage, "size": size, "variant": variant, "rows": rows, **stats})
+        print(f"{stage:<15} {size:>8} {variant:<11} {rows:>9} rows  {stats['seconds']:>8.4f}s  {stats['peak_mb']:>8.2f} MB", flush=True)
+
+    for size in sizes:
+        codes_text, specs_text = synthetic_text(size)
+        mains = parse_mains(codes_text, specs_text)
+        if "parse" in stages:
+            record("parse", size, "-", len(mains), measure(lambda: parse_mains(codes_text, specs_text), repeat))
+        if "simplify" in stages:
+            codes = mains["主商品编码"].tolist()
+            for name in rule_sets:
+                rules, use_regex, case_sensitive = RULE_SETS[name]
+                def simplify():
+                    apply = CompiledRuleSet(tuple(rules), use_regex, case_sensitive).apply
+                    return [apply(c) for c in codes]
+                record("simplify", size, name, len(codes), measure(simplify, repeat))
+        for mix in mixes:
+            combos = synthetic_combos(mix)
+            df = build_frame(mains, combos)
+            pairs = [combos[i % len(combos)] for i in range(len(mains))]
+            for w in workers:
+                variant = mix if w == 1 else f"{mix}/w{w}"
+                if "expand" in stages:
+                    record("expand", size, variant, len(df), measure(fresh(lambda: build_frame(mains, combos, workers=w)), repeat))
+                if "expand-pairwise" in stages:
+                    n_rows = len(build_frame_pairwise(mains, pairs))
+                    record("expand-pairwise", size, variant, n_rows, measure(fresh(lambda: build_frame_pairwise(mains, pairs, workers=w)), repeat))
+            if "export" in stages and len(df) <= max_export_rows:
+                record("export", size, mix, len(df), measure(lambda: df.to_excel(BytesIO(), index=False), 1))
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    key = lambda r: (r["stage"], r["size"], r["variant"])
+    old = {key(r): r for r in baseline}
+    slower = []
+    for r in results:
+        prev = old.get(key(r))
+        if prev and prev["seconds"] > 0 and r["seconds"] > prev["seconds"] * (1 + tolerance):
+            slower.append(f"{r['stage']} {r['size']} {r['variant']}: {prev['seconds']:.4f}s -> {r['seconds']:.4f}s")
+    return slower
+
+
+def _csv(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench", description="组合装生成流程性能基准")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="主商品数量，逗号分隔")
+    parser.add_argument("--mixes", default=",".join(TEMPLATE_MIXES), help=f"模板组合：{', '.join(TEMPLATE_MIXES)}")
+    parser.add_argument("--rules", default=",".join(RULE_SETS), help=f"规则集：{', '.join(RULE_SETS)}")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"阶段：{', '.join(STAGES)}")
+    parser.add_argument("--workers", default="1", help="生成阶段的进程数，逗号分隔，如 1,4（1 = 单进程）")
+    parser.add_argument("--repeat", type=int, default=3, help="每项计时重复次数（取最快）")
+    parser.add_argument("--max-export-rows", type=int, default=50_000, help="超过该行数的结果不做 Excel 序列化")
+    parser.add_argument("--json", help="结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之前的 JSON 结果对比")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的变慢比例，默认 0.25")
+    args = parser.parse_args(argv)
+
+    results = run([int(s) for s in _csv(args.sizes)], _csv(args.mixes), _csv(args.rules), _csv(args.stages), args.repeat, args.max_export_rows,
+                  [int(w) for w in _csv(args.workers)])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            slower = compare(results, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"⚠️ 变慢：{line}", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
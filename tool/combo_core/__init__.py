@@ -0,0 +1,62 @@
+"""Streamlit-free core of the combo tool: domain config, rules, main-product table, SKU master, template I/O (JSON or
+the SQLite store) and option groups, reverse ingestion of exported sheets, the expansion engine (eager or streamed), target-price
+allocation, export, delta export, session storage, background jobs, Douyin parsing and chart tick formatting.
+
+Importing the package has no side effects and loads no heavy dependencies; submodules (and pandas,
+numpy or requests behind them) are imported on first attribute access.
+"""
+import importlib
+
+_EXPORTS = {
+    "common": [
+        "TEMPLATE_COLUMNS", "TEMPLATE_FILE", "TEMPLATE_DB", "TEMPLATE_LIMIT", "COMBO_LIMIT_PER_TEMPLATE", "ADHOC_COMBO_LIMIT",
+        "GENERATE_WORKERS", "_lines", "_num", "resolve_env_number", "resolve_env_boolean",
+    ],
+    "rules": [
+        "CompiledRuleSet", "compile_rules", "_apply_rules_on_body", "apply_code_simplify", "apply_name_simplify",
+        "suggest_tokens_from_codes", "StagedRules", "invalid_regex",
+    ],
+    "mains": [
+        "MAIN_COLUMNS", "MainJoin", "read_table", "read_main_products", "join_main_products", "typed_main_products",
+        "sync_main_products", "clamp_quantity", "apply_batch",
+    ],
+    "sku": ["SkuMaster", "SKU_MASTER_FILE", "ITEM_PRICE_FIELDS", "MAIN_PRICE_FIELDS", "default_sku_master", "sub_item_codes"],
+    "templates": [
+        "OPTION_CHOICE_LIMIT", "OPTION_UI_ROW_LIMIT", "normalize_templates", "read_templates", "write_templates", "option_groups", "option_combo_count",
+        "template_size", "iter_option_combos", "iter_template_combos", "parse_items_block_codes_default1",
+    ],
+    "store": ["TemplateStore", "JsonTemplateFile", "template_library"],
+    "ingest": ["IngestResult", "infer_prefixes", "templates_from_export", "template_content_key", "merge_templates"],
+    "engine": [
+        "CompiledCombo", "GenerationCache", "combo_content_hash", "compile_combo", "compile_template",
+        "build_frame", "build_frame_pairwise", "iter_frames", "concat_frames", "build_rows", "build_rows_pairwise",
+        "is_compact_frame", "materialize_frame", "clear_result_cache", "block_starts",
+    ],
+    "export": [
+        "EXPORT_FORMATS", "EXCEL_SHEET_ROWS", "EXCEL_PART_ROWS", "ExportFormat", "available_formats", "format_for_path",
+        "part_bounds", "write_export", "write_export_stream", "frame_fingerprint", "export_bytes",
+    ],
+    "pricing": ["PRICE_DECIMALS", "round_half_up", "block_targets", "allocate_prices", "allocate_frames", "read_target_prices"],
+    "delta": ["Delta", "DEFAULT_WORKSPACE", "block_hashes", "diff_blocks", "delta_rows", "load_baseline", "save_baseline"],
+    "spill": ["SpillStore", "SESSION_ID_IN_URL", "get_spill_store", "estimate_size"],
+    "profiling": ["PROFILE_ENABLED", "PROFILE_LOG", "StageProfiler", "profile_stage", "append_profile_log"],
+    "jobs": ["Job", "JOB_WORKERS", "submit_job", "latest_job", "wait_job"],
+    "douyin": ["generate_fallback_urls", "try_multiple_video_urls", "requests_with_retry", "parse_douyin_url", "parse_douyin_url_method2"],
+    "charts": ["format_number_chinese", "update_xaxis_ticks", "update_yaxis_range", "apply_chinese_yaxis_format"],
+}
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULE_OF)
+
+
+def __getattr__(name):
+    module = _MODULE_OF.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,107 @@
+"""Axis/tick formatting for the chart page. Operates on an existing plotly figure; plotly itself is not imported here."""
+
+
+def format_number_chinese(value):
+    """将数字格式化为中文单位：万（w）、亿等"""
+    import pandas as pd
+    if pd.isna(value) or value == 0:
+        return "0"
+    
+    abs_value = abs(value)
+    sign = "-" if value < 0 else ""
+    
+    if abs_value >= 100000000:  # 1亿
+        return f"{sign}{abs_value/100000000:.2f}亿"
+    elif abs_value >= 10000:  # 1万
+        return f"{sign}{abs_value/10000:.2f}w"
+    elif abs_value >= 1000:  # 1千
+        return f"{sign}{abs_value/1000:.2f}k"
+    else:
+        return f"{sign}{abs_value:.2f}"
+
+
+def update_xaxis_ticks(fig, x_axis_data, angle, interval_threshold, interval_step):
+    import pandas as pd
+    x_labels = pd.unique(x_axis_data)
+    num_x_items = len(x_labels)
+
+    tickvals, ticktext = None, None
+    x_range = None # Initialize x_range
+
+    # Apply special tick logic only for categorical data when items are many
+    # For numerical data, let Plotly handle tick generation automatically
+    if x_axis_data.dtype == 'object' and num_x_items > interval_threshold:
+        tickvals = list(x_labels)
+        ticktext = [str(label) for label in x_labels]
+
+        for i in range(1, num_x_items - 1): # Keep first, check others
+            if i % interval_step != 0:
+                ticktext[i] = ""
+
+        # Ensure last is visible, and hide second-to-last to avoid crowding
+        if num_x_items > 1:
+            ticktext[-2] = ""
+            ticktext[-1] = str(x_labels[-1])
+    elif pd.api.types.is_numeric_dtype(x_axis_data):
+        # For numerical data, ensure the range covers the max value
+        x_min = x_axis_data.min()
+        x_max = x_axis_data.max()
+        x_range = [x_min, x_max * 1.05] # Add a 5% buffer to the max to ensure it's fully visible
+
+    fig.update_xaxes(tickangle=angle, tickvals=tickvals, ticktext=ticktext, automargin=True, range=x_range)
+    return fig
+
+def update_yaxis_range(fig, y_axis_data, use_chinese_format=True, yaxis_num=1):
+    """更新Y轴范围和格式"""
+    # Let Plotly's autorange handle the limits, but ensure the range extends to zero.
+    yaxis_key = 'yaxis' if yaxis_num == 1 else f'yaxis{yaxis_num}'
+    
+    if use_chinese_format:
+        # 获取Y轴数据的最大值来确定tickformat
+        max_val = y_axis_data.max() if hasattr(y_axis_data, 'max') else max(y_axis_data)
+        
+        # 创建自定义的tickvals和ticktext
+        fig.update_layout({
+            yaxis_key: dict(
+                rangemode="tozero",
+                autorange=True,
+                tickformat="",
+                tickmode="auto"
+            )
+        })
+        
+        # 使用tickformatstops来自定义格式
+        if yaxis_num == 1:
+            fig.update_yaxes(rangemode="tozero", autorange=True)
+        else:
+            fig.update_layout({yaxis_key: dict(rangemode="tozero", autorange=True)})
+    else:
+        if yaxis_num == 1:
+            fig.update_yaxes(rangemode="tozero", autorange=True)
+        else:
+            fig.update_layout({yaxis_key: dict(rangemode="tozero", autorange=True)})
+    
+    return fig
+
+
+def apply_chinese_yaxis_format(fig, yaxis_num=1):
+    """应用中文Y轴格式到图表"""
+    yaxis_key = 'yaxis' if yaxis_num == 1 else f'yaxis{yaxis_num}'
+    
+    # 使用自定义的tickformat函数
+    fig.update_layout({
+        yaxis_key: dict(
+            tickformat="",
+            tickmode="auto",
+        )
+    })
+    
+    # 获取当前的traces并更新hover模板
+    for trace in fig.data:
+        if hasattr(trace, 'y') and trace.y is not None:
+            # 更新hover模板以显示中文格式
+            if hasattr(trace, 'hovertemplate') and trace.hovertemplate:
+                # 保持现有的hovertemplate
+                pass
+    
+    return fig
@@ -0,0 +1,149 @@
+"""Headless combo generation: `python -m combo_core -i mains.xlsx -t 模板A -t 模板B -o 组合装导入模板.xlsx`."""
+import argparse
+import json
+import sys
+from typing import List, Optional, Tuple
+
+from .common import GENERATE_WORKERS, TEMPLATE_DB
+from .engine import build_frame, compile_template, iter_frames
+from .export import EXCEL_PART_ROWS, EXPORT_FORMATS, format_for_path, write_export, write_export_stream
+from .mains import read_main_products
+from .pricing import allocate_frames, allocate_prices, block_targets, read_target_prices
+from .sku import MAIN_PRICE_FIELDS, SKU_MASTER_FILE, SkuMaster, sub_item_codes
+from .store import template_library
+from .templates import iter_template_combos, option_combo_count, template_size
+
+DEFAULT_OUTPUT = "组合装导入模板.xlsx"
+
+
+class CliError(Exception):
+    pass
+
+
+def parse_rules(rule_args: List[str], rules_file: Optional[str]) -> List[Tuple[str, str]]:
+    """`--rule 查找=替换`（替换留空即删除）加上 `--rules-file` 中的 `[{"find": ..., "replace": ...}]`。"""
+    rules = []
+    if rules_file:
+        with open(rules_file, "r", encoding="utf-8") as f:
+            for r in json.load(f):
+                find, replace = (r.get("find", ""), r.get("replace", "")) if isinstance(r, dict) else (r[0], r[1] if len(r) > 1 else "")
+                if find:
+                    rules.append((find, replace))
+    for arg in rule_args:
+        if "=" not in arg:
+            raise CliError(f"规则格式应为 查找=替换：{arg}")
+        find, replace = arg.split("=", 1)
+        if find:
+            rules.append((find, replace))
+    return rules
+
+
+def resolve_templates(template_names: List[str], templates_file: str, sku: Optional[SkuMaster] = None):
+    """The named templates in order; with `sku`, sub-item prices (of combos and option choices) are filled from the master."""
+    templates = {t["name"]: t for t in template_library(templates_file).load()[0]}
+    unknown = [n for n in template_names if n not in templates]
+    if unknown:
+        raise CliError(f"模板不存在：{', '.join(unknown)}（可用：{', '.join(templates) or '无'}）")
+    resolved = []
+    for name in template_names:
+        tpl = templates[name]
+        if sku is not None:
+            fill = lambda entries: [{**c, "items": sku.fill_items(c.get("items", []))} for c in entries]
+            tpl = {**tpl, "combos": fill(tpl.get("combos", [])),
+                   "options": [{**g, "choices": fill(g.get("choices", []))} for g in tpl.get("options", [])]}
+        resolved.append(tpl)
+    return resolved
+
+
+def template_item_pairs(templates):
+    """(prefix, items) of every combo and option choice, for code checks without expanding option products."""
+    return [(c.get("prefix", ""), c.get("items", [])) for t in templates
+            for c in t.get("combos", []) + [ch for g in t.get("options", []) for ch in g.get("choices", [])]]
+
+
+def check_codes(sku: SkuMaster, mains, combos):
+    """Every main and sub-item code must exist in the SKU master."""
+    unknown = sku.unknown(list(mains["主商品编码"]) + sub_item_codes(combos))
+    if unknown:
+        shown = ", ".join(unknown[:20]) + (f" 等 {len(unknown)} 个" if len(unknown) > 20 else "")
+        raise CliError(f"以下编码不在 SKU 主数据中：{shown}（确认无误可加 --allow-unknown-codes）")
+
+
+def parse_template_prices(args_list: List[str], templates) -> Optional[List[float]]:
+    """`--target-price 模板=价格` as one target per combo in generation order (NaN for templates without one)."""
+    if not args_list:
+        return None
+    prices = {}
+    for arg in args_list:
+        name, sep, value = arg.rpartition("=")
+        try:
+            prices[name] = float(value)
+        except ValueError:
+            raise CliError(f"目标售价格式应为 模板=价格：{arg}")
+        if not sep or name not in {t["name"] for t in templates}:
+            raise CliError(f"--target-price 的模板未选择：{name or arg}")
+    combo_prices = []
+    for t in templates:
+        combo_prices.extend([prices.get(t["name"], float("nan"))] * template_size(t)[0])
+    return combo_prices
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m combo_core", description="按模板批量生成组合装导入模板（无需打开页面）")
+    parser.add_argument("-i", "--input", required=True, help="主商品表（.csv/.xlsx），列：主商品编码、主商品组合颜色规格，可选 数量、应占售价、基本售价、成本价")
+    parser.add_argument("-t", "--template", action="append", required=True, dest="templates", help="模板名称，可重复指定，按顺序生成；含选项组的模板边展开边写出")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help=f"输出文件（.xlsx / .zip / .csv / .parquet），默认 {DEFAULT_OUTPUT}")
+    parser.add_argument("-f", "--format", choices=list(EXPORT_FORMATS), help="导出格式，默认按输出文件扩展名；大结果可用 xlsx-stream 节省内存，超过单表行数用 xlsx-sheets / xlsx-zip")
+    parser.add_argument("--part-rows", type=int, default=EXCEL_PART_ROWS, help=f"分表/分文件时每个分片最多行数，默认 {EXCEL_PART_ROWS}")
+    parser.add_argument("--templates-file", default=TEMPLATE_DB, help=f"模板库路径（.json 为旧版模板文件），默认 {TEMPLATE_DB}")
+    parser.add_argument("--rule", action="append", default=[], help="编码简化规则 查找=替换（替换留空=删除），可重复")
+    parser.add_argument("--rules-file", help='规则 JSON：[{"find": "...", "replace": "..."}]')
+    parser.add_argument("--regex", action="store_true", help="规则按正则表达式处理")
+    parser.add_argument("--ignore-case", action="store_true", help="规则匹配不区分大小写")
+    parser.add_argument("--apply-to-name", action="store_true", help="同时对组合商品名称应用规则（前缀不改）")
+    parser.add_argument("--sku-master", default=SKU_MASTER_FILE, help="SKU 主数据（.csv/.xlsx/.parquet，列：商品编码，可选 商品名称、基本售价、成本价），生成前校验所有编码；默认取 COMBO_SKU_MASTER")
+    parser.add_argument("--fill-prices", action="store_true", help="按 SKU 主数据填充主商品和副商品的基本售价、成本价")
+    parser.add_argument("--allow-unknown-codes", action="store_true", help="编码不在 SKU 主数据中时仍然生成")
+    parser.add_argument("--target-price", action="append", default=[], help="按模板设置组合目标售价 模板=价格，按基本售价比例分摊到主商品和副商品的 应占售价，可重复")
+    parser.add_argument("--target-prices", help="按主商品设置组合目标售价的表（列：主商品编码、目标售价），优先于 --target-price")
+    parser.add_argument("-j", "--workers", type=int, default=GENERATE_WORKERS, help=f"并行进程数（大批量时分片生成，结果顺序不变），默认 {GENERATE_WORKERS}")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        mains = read_main_products(args.input)
+        sku = SkuMaster.load(args.sku_master) if args.sku_master else None
+        if args.fill_prices and sku is None:
+            raise CliError("--fill-prices 需要 --sku-master")
+        templates = resolve_templates(args.templates, args.templates_file, sku if args.fill_prices else None)
+        if sku is not None and not args.allow_unknown_codes:
+            check_codes(sku, mains, template_item_pairs(templates))
+        if args.fill_prices:
+            mains = sku.fill_frame(mains, "主商品编码", MAIN_PRICE_FIELDS)
+        rules = parse_rules(args.rule, args.rules_file)
+        options = dict(simplify_rules=rules, use_regex=args.regex, case_sensitive=not args.ignore_case, apply_to_name=args.apply_to_name)
+        fmt = args.format or format_for_path(args.output)
+        combo_prices = parse_template_prices(args.target_price, templates)
+        main_prices = read_target_prices(args.target_prices) if args.target_prices else None
+        allocate = combo_prices is not None or bool(main_prices)
+        if any(option_combo_count(t) for t in templates):
+            # 有选项组：组合由生成器逐个产出，按批展开后直接写入导出文件
+            combos = ((c.get("prefix", ""), c.get("items", [])) for t in templates for c in iter_template_combos(t))
+            frames = iter_frames(mains, combos, **options)
+            if allocate:
+                valid = int(((mains["主商品编码"] != "") & (mains["主商品组合颜色规格"] != "")).sum())
+                frames = allocate_frames(frames, combo_prices, valid, main_prices)
+            rows = write_export_stream(frames, fmt, args.output, args.part_rows)
+        else:
+            df = build_frame(mains, [c for t in templates for c in compile_template(t)], workers=args.workers, compact=True, **options)
+            if allocate:
+                df = allocate_prices(df, block_targets(df, combo_prices, main_prices=main_prices))
+            write_export(df, fmt, args.output, args.part_rows)
+            rows = len(df)
+    except (CliError, OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    print(f"✅ 生成成功，共 {rows} 行 -> {args.output}")
+    return 0
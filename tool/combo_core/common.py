@@ -0,0 +1,54 @@
+"""Domain constants and value parsing shared by the UI, the CLI and the engine."""
+import os
+
+TEMPLATE_COLUMNS = [
+    '组合商品编码','组合装商品标签','组合款式编码','组合商品名称','组合商品简称','组合商品实体编码',
+    '虚拟分类','组合颜色规格','禁止库存同步','商品编码','数量','应占售价','基本售价','组合成本价','图片','品牌'
+]
+TEMPLATE_FILE = "templates.json"
+TEMPLATE_DB = os.environ.get('COMBO_TEMPLATE_DB') or "templates.db"  # 模板库；首次使用时迁移同名 .json
+TEMPLATE_LIMIT = 999
+COMBO_LIMIT_PER_TEMPLATE = 100
+ADHOC_COMBO_LIMIT = 100
+
+def _lines(raw: str):
+    if not raw or not raw.strip(): return []
+    return [s.strip() for s in raw.strip().splitlines() if s.strip()]
+
+def _num(val, default):
+    if val is None or str(val).strip() == "": return default
+    try:
+        f = float(str(val));  i = int(f)
+        return i if abs(f - i) < 1e-9 else f
+    except:
+        return default
+
+def resolve_env_number(key: str, fallback: int) -> int:
+    """解析环境变量数字值"""
+    try:
+        value = os.environ.get(key)
+        if value is not None:
+            parsed = int(value)
+            return parsed if parsed > 0 else fallback
+        return fallback
+    except (ValueError, TypeError):
+        return fallback
+
+def resolve_env_boolean(key: str, fallback: bool) -> bool:
+    """解析环境变量布尔值"""
+    try:
+        value = os.environ.get(key)
+        if value is None:
+            return fallback
+        normalized = value.strip().lower()
+        if normalized in ('false', '0'):
+            return False
+        if normalized in ('true', '1'):
+            return True
+        return fallback
+    except (ValueError, TypeError, AttributeError):
+        return fallback
+
+# 大批量生成时使用的进程数，默认单进程：进程池的启动与结果回传开销在实测中大于并行收益，
+# 多核机器上可在 tool 目录下用 `python -m benchmarks.bench --workers 1,4` 实测后再通过 COMBO_WORKERS 开启
+GENERATE_WORKERS = resolve_env_number('COMBO_WORKERS', 1)
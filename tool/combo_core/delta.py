@@ -0,0 +1,128 @@
+"""Delta export: which combos are new, changed or removed since the last export of a workspace.
+
+Each combo block (its main row plus sub-item rows, keyed by 组合商品编码) gets a 64-bit content hash; the last exported hashes of a
+workspace are kept on disk as a small `组合商品编码,hash` CSV (hash as signed 64-bit). Comparing the current hashes with that baseline is a
+hash join on 组合商品编码, and only the rows of new or changed blocks go into the delta file.
+"""
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .engine import GENERATED_COLUMNS, NUMERIC_COLUMNS, block_starts
+
+BASELINE_DIR = os.environ.get('COMBO_BASELINE_DIR') or "export_baselines"
+BLOCK_KEY_COLUMN = "组合商品编码"
+DEFAULT_WORKSPACE = "默认"
+
+
+def _column_hashes(values: pd.Series, numeric: bool) -> np.ndarray:
+    if numeric:
+        return pd.util.hash_array(values.to_numpy(dtype="float64"))
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # 只对类别本身求哈希再按编码取值，与同内容的字符串列结果相同
+        hashed = pd.util.hash_array(values.cat.categories.to_numpy(dtype=object))
+        return hashed[values.cat.codes.to_numpy()]
+    return pd.util.hash_array(values.to_numpy(dtype=object))
+
+
+def block_hashes(df: pd.DataFrame) -> pd.Series:
+    """uint64 content hash per 组合商品编码, in output order.
+
+    Compact and full frames of the same result hash alike: only generated columns are hashed and numbers as float64.
+    Codes that occur in several blocks get one combined hash.
+    """
+    starts = block_starts(df)
+    if len(starts) == 0:
+        return pd.Series([], dtype=np.uint64, index=pd.Index([], dtype=object, name=BLOCK_KEY_COLUMN))
+    rows = np.zeros(len(df), dtype=np.uint64)
+    for col in GENERATED_COLUMNS:
+        rows = (rows * np.uint64(0x100000001B3)) ^ _column_hashes(df[col], col in NUMERIC_COLUMNS)
+    # 块内行号参与运算，行顺序变化也算改动
+    rows = rows[starts[0]:]
+    lengths = np.diff(np.append(starts, len(df)))
+    offset = np.arange(len(rows)) - np.repeat(starts - starts[0], lengths)
+    mixed = (rows ^ (offset.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = np.add.reduceat(mixed, starts - starts[0])
+    codes = df[BLOCK_KEY_COLUMN].to_numpy(dtype=object)[starts]
+    series = pd.Series(hashes, index=pd.Index(codes, dtype=object, name=BLOCK_KEY_COLUMN))
+    if series.index.has_duplicates:
+        series = series.groupby(level=0, sort=False).sum()
+    return series
+
+
+@dataclass
+class Delta:
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def codes(self) -> List[str]:
+        """Codes whose rows go into the delta file (new and changed)."""
+        return self.new + self.changed
+
+
+def diff_blocks(current: pd.Series, baseline: Optional[pd.Series]) -> Delta:
+    """Compare block hashes with a baseline (None = nothing exported yet, so everything is new)."""
+    if baseline is None or len(baseline) == 0:
+        return Delta(new=current.index.tolist())
+    pos = baseline.index.get_indexer(current.index)
+    known = pos >= 0
+    same = np.zeros(len(current), dtype=bool)
+    same[known] = current.to_numpy()[known] == baseline.to_numpy()[pos[known]]
+    seen = np.zeros(len(baseline), dtype=bool)
+    seen[pos[known]] = True
+    return Delta(
+        new=current.index[~known].tolist(),
+        changed=current.index[known & ~same].tolist(),
+        removed=baseline.index[~seen].tolist(),
+        unchanged=int(same.sum()),
+    )
+
+
+def delta_rows(df: pd.DataFrame, codes: List[str]) -> pd.DataFrame:
+    """Rows of the blocks whose 组合商品编码 is in `codes`, in output order."""
+    starts = block_starts(df)
+    if len(starts) == 0 or not codes:
+        return df.iloc[:0]
+    keep_block = pd.Index(df[BLOCK_KEY_COLUMN].to_numpy(dtype=object)[starts], dtype=object).isin(pd.Index(codes, dtype=object))
+    lengths = np.diff(np.append(starts, len(df)))
+    mask = np.zeros(len(df), dtype=bool)
+    mask[starts[0]:] = np.repeat(keep_block, lengths)
+    return df[mask]
+
+
+def _baseline_path(workspace: str, root: str) -> str:
+    name = re.sub(r"[^\w\-]+", "_", workspace.strip() or DEFAULT_WORKSPACE)
+    return os.path.join(root, f"{name}.csv")
+
+
+_LOCK = threading.Lock()
+
+
+def load_baseline(workspace: str, root: str = BASELINE_DIR) -> Optional[pd.Series]:
+    """Block hashes of the workspace's last export, or None if it has none."""
+    path = _baseline_path(workspace, root)
+    with _LOCK:
+        if not os.path.exists(path):
+            return None
+        raw = pd.read_csv(path, dtype={BLOCK_KEY_COLUMN: object, "hash": np.int64}, keep_default_na=False, encoding="utf-8")
+    hashes = raw["hash"].to_numpy().view(np.uint64)
+    return pd.Series(hashes, index=pd.Index(raw[BLOCK_KEY_COLUMN].to_numpy(dtype=object), dtype=object, name=BLOCK_KEY_COLUMN))
+
+
+def save_baseline(workspace: str, hashes: pd.Series, root: str = BASELINE_DIR):
+    """Record `hashes` as the workspace's last export (written to a temp file, then renamed)."""
+    os.makedirs(root, exist_ok=True)
+    path = _baseline_path(workspace, root)
+    # 哈希按 int64 存储（位模式不变），读写都不必逐个转换
+    table = pd.DataFrame({BLOCK_KEY_COLUMN: hashes.index.to_numpy(dtype=object), "hash": hashes.to_numpy(dtype=np.uint64).view(np.int64)})
+    with _LOCK:
+        table.to_csv(path + ".tmp", index=False, encoding="utf-8")
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,613 @@
+"""Columnar combo expansion: main products × combos -> rows of the import template."""
+import hashlib
+import json
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .common import TEMPLATE_COLUMNS, _num, resolve_env_number
+from .profiling import profile_stage
+from .rules import compile_rules
+
+
+# 主商品表字段 -> (输出列, 默认值)
+MAIN_NUMERIC_FIELDS = [('数量', '数量', 1), ('应占售价', '应占售价', 1.0), ('基本售价', '基本售价', 1.0), ('成本价', '组合成本价', 1.0)]
+NUMERIC_COLUMNS = ['数量', '应占售价', '基本售价', '组合成本价']
+TOTAL_COLUMNS = ['应占售价', '基本售价', '组合成本价']
+FILLED_TEXT_COLUMNS = ['组合商品编码', '组合商品名称', '组合颜色规格', '商品编码']
+GENERATED_COLUMNS = [c for c in TEMPLATE_COLUMNS if c in FILLED_TEXT_COLUMNS or c in NUMERIC_COLUMNS]
+# 生成结果里恒为空的列：紧凑模式下不存储，导出时再补成空字符串
+EMPTY_COLUMNS = [c for c in TEMPLATE_COLUMNS if c not in GENERATED_COLUMNS]
+# 重复值多的文本列在紧凑模式下用分类存储（组合商品编码几乎各不相同，仍用字符串）
+CATEGORICAL_COLUMNS = ['组合商品名称', '组合颜色规格', '商品编码']
+# 块首行标记：只有主商品行写入组合颜色规格，且生成时跳过规格为空的主商品；组合商品编码可能被简化规则清空，不能作标记
+BLOCK_START_COLUMN = '组合颜色规格'
+COMPILED_COMBO_CACHE_SIZE = 4096
+PARALLEL_MIN_ROWS = 200_000  # 低于该行数时多进程启动开销不划算，直接单进程生成
+SHARDS_PER_WORKER = 4
+RESULT_CACHE_BYTES = resolve_env_number('COMBO_RESULT_CACHE_MB', 256) * 1024 * 1024
+PROGRESS_ROWS = 50_000  # 传入 progress 时单进程按约这么多行分段展开，每段回报一次进度
+STREAM_ROWS = 50_000  # iter_frames 每批约这么多行
+
+# progress(已生成行数, 总行数, 当前组合下标)
+ProgressCallback = Callable[[int, int, int], None]
+_COMPILED_COMBOS: "OrderedDict[str, CompiledCombo]" = OrderedDict()
+_COMPILED_COMBOS_LOCK = threading.Lock()  # 页面脚本线程与后台任务线程都会编译组合
+# 生成结果的进程级备忘：相同输入（跨会话）直接返回上次的结果，按内存占用做 LRU
+_RESULTS: "OrderedDict[str, Tuple[pd.DataFrame, Dict[str, np.ndarray], int]]" = OrderedDict()  # (结果, 浮点列整数掩码, 字节数)
+_RESULTS_LOCK = threading.Lock()
+
+def _num_array(series, default) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized `_num`: returns float64 values plus a mask of cells `_num` would return as int."""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        f = series.to_numpy(dtype="float64", na_value=np.nan)
+        finite = np.isfinite(f)
+        t = np.trunc(np.where(finite, f, 0.0))
+        integral = finite & (np.abs(f - t) < 1e-9)
+        vals = np.where(integral, t, np.where(finite, f, float(default)))
+        is_int = integral | (~finite & isinstance(default, int))
+        return vals, is_int
+    parsed = [_num(v, default) for v in series.tolist()]
+    return np.array(parsed, dtype="float64"), np.array([isinstance(v, int) for v in parsed], dtype=bool)
+
+def _main_frame(main_products_df) -> Dict[str, Any]:
+    """Column arrays for the main products, including the `code and spec` validity mask."""
+    n = len(main_products_df)
+    def col(name):
+        return main_products_df[name] if name in main_products_df.columns else pd.Series([None] * n, dtype=object)
+    def text(name):
+        return np.array([str(v) for v in main_products_df[name].tolist()] if name in main_products_df.columns else [""] * n, dtype=object)
+    codes, specs = text("主商品编码"), text("主商品组合颜色规格")
+    frame = {"code": codes, "spec": specs, "valid": (codes != "") & (specs != "")}
+    for field, out_col, default in MAIN_NUMERIC_FIELDS:
+        frame[out_col] = _num_array(col(field), default)
+    return frame
+
+def _readonly(arr: np.ndarray) -> np.ndarray:
+    arr.flags.writeable = False
+    return arr
+
+@dataclass(frozen=True)
+class CompiledCombo:
+    """One (prefix, items) combo with normalized items, sub-item totals and its sub-row block precomputed."""
+    key: str
+    prefix: str
+    items: Tuple[Tuple[Any, ...], ...]  # (商品编码, 数量, 应占售价, 基本售价, 组合成本价)，数值已按 _num 规整
+    totals: Mapping[str, Tuple[float, bool]]  # 列 -> (Σ 单价×数量, 是否为整数)
+    sub_block: Mapping[str, Any]  # 副商品行：'商品编码' -> ndarray，数值列 -> (values, is_int)
+
+def combo_content_hash(prefix: str, items: List[Dict[str, Any]]) -> str:
+    payload = json.dumps({"prefix": prefix, "items": items}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def compile_combo(prefix: str, items: List[Dict[str, Any]], remember: bool = True) -> CompiledCombo:
+    """Compiled combo, shared through an LRU by content; `remember=False` skips the LRU (for one-off streamed combos)."""
+    key = combo_content_hash(prefix, items)
+    with _COMPILED_COMBOS_LOCK:
+        cached = _COMPILED_COMBOS.get(key)
+        if cached is not None and remember:
+            _COMPILED_COMBOS.move_to_end(key)
+    if cached is not None:
+        return cached
+
+    normalized = []
+    totals = {c: 0 for c in TOTAL_COLUMNS}
+    for it in items:
+        qty = _num(it.get('数量', 1), 1)
+        p1, p2, cost = (_num(it.get(c, 1.0), 1.0) for c in TOTAL_COLUMNS)
+        for c, v in zip(TOTAL_COLUMNS, (p1, p2, cost)):
+            totals[c] += v * qty
+        normalized.append((it['商品编码'], qty, p1, p2, cost))
+
+    sub_block = {'商品编码': _readonly(np.array([row[0] for row in normalized], dtype=object))}
+    for pos, c in enumerate(NUMERIC_COLUMNS, start=1):
+        values = [row[pos] for row in normalized]
+        sub_block[c] = (_readonly(np.array(values, dtype="float64")), _readonly(np.array([isinstance(v, int) for v in values], dtype=bool)))
+
+    compiled = CompiledCombo(
+        key=key,
+        prefix=prefix,
+        items=tuple(normalized),
+        totals=MappingProxyType({c: (float(v), isinstance(v, int)) for c, v in totals.items()}),
+        sub_block=MappingProxyType(sub_block),
+    )
+    if remember:
+        with _COMPILED_COMBOS_LOCK:
+            _COMPILED_COMBOS[key] = compiled
+            if len(_COMPILED_COMBOS) > COMPILED_COMBO_CACHE_SIZE:
+                _COMPILED_COMBOS.popitem(last=False)
+    return compiled
+
+def compile_template(tpl: Dict[str, Any]) -> Tuple[CompiledCombo, ...]:
+    return tuple(compile_combo(c.get('prefix', ''), c.get('items', [])) for c in tpl.get('combos', []))
+
+def _combo_frame(combos) -> Dict[str, Any]:
+    """Concatenates compiled combos (or raw (prefix, items) pairs) into per-combo totals and one sub-row table."""
+    compiled = [c if isinstance(c, CompiledCombo) else compile_combo(*c) for c in combos]
+    def concat(parts, dtype):
+        return np.concatenate(parts) if parts else np.array([], dtype=dtype)
+    return {
+        "key": np.array([c.key for c in compiled], dtype=object),
+        "prefix": np.array([c.prefix for c in compiled], dtype=object),
+        "count": np.array([len(c.items) for c in compiled], dtype=np.int64),
+        "sub_code": concat([c.sub_block['商品编码'] for c in compiled], object),
+        "sub": {col: (concat([c.sub_block[col][0] for c in compiled], "float64"), concat([c.sub_block[col][1] for c in compiled], bool)) for col in NUMERIC_COLUMNS},
+        "total": {col: (np.array([c.totals[col][0] for c in compiled], dtype="float64"), np.array([c.totals[col][1] for c in compiled], dtype=bool)) for col in TOTAL_COLUMNS},
+    }
+
+def _simplified(values: np.ndarray, rules, use_regex: bool, case_sensitive: bool) -> np.ndarray:
+    if not rules or len(values) == 0:
+        return values
+    with profile_stage("simplify"):
+        apply = compile_rules(tuple((old, new) for old, new in rules), use_regex, case_sensitive).apply
+        memo = {v: apply(v) for v in pd.unique(values)}
+        return np.array([memo[v] for v in values], dtype=object)
+
+def _expand_arrays(mains, combo_frame, pair_main: np.ndarray, pair_combo: np.ndarray, simplify_rules, use_regex, case_sensitive, apply_to_name) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Cross join of main rows and combos given as aligned (main, combo) index pairs, in output order.
+
+    Returns the raw columns (numeric ones as float64) plus, per numeric column, the mask of cells that are ints.
+    """
+    counts = combo_frame["count"][pair_combo]
+    n_rows = int(len(pair_main) + counts.sum())
+    block_start = np.concatenate(([0], np.cumsum(1 + counts)[:-1])).astype(np.int64) if len(pair_main) else np.array([], dtype=np.int64)
+
+    # 副商品行：每个 (主商品, 组合) 对展开 counts 行
+    sub_pair = np.repeat(np.arange(len(pair_main)), counts)
+    sub_first = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(pair_main) else np.array([], dtype=np.int64)
+    sub_j = np.arange(len(sub_pair)) - np.repeat(sub_first, counts)
+    item_offset = np.concatenate(([0], np.cumsum(combo_frame["count"])[:-1]))
+    sub_item = item_offset[pair_combo[sub_pair]] + sub_j
+    sub_pos = block_start[sub_pair] + 1 + sub_j
+
+    prefix = combo_frame["prefix"][pair_combo]
+    code, spec = mains["code"][pair_main], mains["spec"][pair_main]
+    columns = {col: np.full(n_rows, "", dtype=object) for col in FILLED_TEXT_COLUMNS}
+    columns['组合商品编码'][block_start] = prefix + _simplified(code, simplify_rules, use_regex, case_sensitive)
+    columns['组合商品名称'][block_start] = prefix + (_simplified(spec, simplify_rules, use_regex, case_sensitive) if apply_to_name else spec)
+    columns['组合颜色规格'][block_start] = spec
+    columns['商品编码'][block_start] = code
+    columns['商品编码'][sub_pos] = combo_frame["sub_code"][sub_item]
+
+    masks = {}
+    for col in NUMERIC_COLUMNS:
+        vals, is_int = np.empty(n_rows, dtype="float64"), np.empty(n_rows, dtype=bool)
+        main_vals, main_int = mains[col]
+        vals[block_start], is_int[block_start] = main_vals[pair_main], main_int[pair_main]
+        if col in combo_frame["total"]:
+            total_vals, total_int = combo_frame["total"][col]
+            vals[block_start] += total_vals[pair_combo]
+            is_int[block_start] &= total_int[pair_combo]
+        sub_vals, sub_int = combo_frame["sub"][col]
+        vals[sub_pos], is_int[sub_pos] = sub_vals[sub_item], sub_int[sub_item]
+        columns[col], masks[col] = vals, is_int
+    return columns, masks
+
+def _output_column(col: str, values: np.ndarray, is_int: Optional[np.ndarray], compact: bool):
+    if is_int is not None:
+        # 与逐行构建一致：全部为整数时保留整数列
+        if not is_int.all():
+            return values
+        ints = values.astype(np.int64)
+        return pd.to_numeric(ints, downcast="integer") if compact else ints
+    if compact and col in CATEGORICAL_COLUMNS:
+        codes, uniques = pd.factorize(values)
+        return pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype="str"))
+    return values
+
+def _to_frame(columns: Dict[str, np.ndarray], masks: Dict[str, np.ndarray], compact: bool = False) -> pd.DataFrame:
+    """Export frame from raw columns; `compact` keeps only GENERATED_COLUMNS, with categories and downcast ints."""
+    layout = GENERATED_COLUMNS if compact else TEMPLATE_COLUMNS
+    n = len(columns[GENERATED_COLUMNS[0]])
+    if n == 0:
+        return pd.DataFrame(columns=layout)
+    out = {col: _output_column(col, columns[col], masks.get(col), compact) for col in GENERATED_COLUMNS}
+    if not compact:
+        out.update({col: np.full(n, "", dtype=object) for col in EMPTY_COLUMNS})
+    return pd.DataFrame(out, columns=layout)
+
+def block_starts(df: pd.DataFrame) -> np.ndarray:
+    """Row positions where a combo block (main row plus its sub rows) starts; every row for frames without BLOCK_START_COLUMN."""
+    if BLOCK_START_COLUMN not in df.columns:
+        return np.arange(len(df))
+    return np.flatnonzero(df[BLOCK_START_COLUMN].to_numpy(dtype=object) != "")
+
+def is_compact_frame(df: pd.DataFrame) -> bool:
+    columns = list(df.columns)
+    return columns != TEMPLATE_COLUMNS and set(columns) <= set(TEMPLATE_COLUMNS)
+
+def materialize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Full TEMPLATE_COLUMNS layout of a compact frame (empty columns as "", categories as strings, ints as int64).
+
+    Any other frame is returned unchanged. Works on slices, so exports can materialize chunk by chunk.
+    """
+    if not is_compact_frame(df):
+        return df
+    if len(df) == 0:
+        return pd.DataFrame(columns=TEMPLATE_COLUMNS)
+    out = {}
+    for col in TEMPLATE_COLUMNS:
+        if col not in df.columns:
+            out[col] = np.full(len(df), "", dtype=object)
+        elif col in NUMERIC_COLUMNS:
+            values = df[col].to_numpy()
+            out[col] = values.astype(np.int64) if values.dtype.kind in "iu" else values
+        else:
+            out[col] = df[col].to_numpy(dtype=object)
+    return pd.DataFrame(out, columns=TEMPLATE_COLUMNS, index=df.index)
+
+def _concat_arrays(parts: List[Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    columns = {col: np.concatenate([p[0][col] for p in parts]) for col in GENERATED_COLUMNS}
+    masks = {col: np.concatenate([p[1][col] for p in parts]) for col in NUMERIC_COLUMNS}
+    return columns, masks
+
+# 工作进程内的共享输入（由 initializer 每个进程传一次），任务只携带 pair 下标区间
+_SHARD_STATE: Dict[str, Any] = {}
+
+def _init_shard_worker(mains, combo_frame, pair_main, pair_combo, options):
+    _SHARD_STATE.update(mains=mains, combo_frame=combo_frame, pair_main=pair_main, pair_combo=pair_combo, options=options)
+
+def _pack_columns(columns: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """Text columns as (int32 codes, uniques): far cheaper to pickle back from a worker than object arrays."""
+    packed = {}
+    for col, values in columns.items():
+        if values.dtype == object:
+            codes, uniques = pd.factorize(values)
+            packed[col] = (codes.astype(np.int32), uniques)
+        else:
+            packed[col] = values
+    return packed
+
+def _unpack_columns(packed: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    return {col: v[1].astype(object)[v[0]] if isinstance(v, tuple) else v for col, v in packed.items()}
+
+def _expand_shard(bounds: Tuple[int, int]):
+    lo, hi = bounds
+    s = _SHARD_STATE
+    columns, masks = _expand_arrays(s["mains"], s["combo_frame"], s["pair_main"][lo:hi], s["pair_combo"][lo:hi], *s["options"])
+    return _pack_columns(columns), masks
+
+def _shard_bounds(row_counts: np.ndarray, n_shards: int) -> List[Tuple[int, int]]:
+    """Contiguous pair ranges holding roughly equal numbers of output rows."""
+    ends = np.cumsum(row_counts)
+    cuts = np.searchsorted(ends, np.linspace(0, ends[-1], n_shards + 1)[1:-1], side="right")
+    edges = np.unique(np.concatenate(([0], cuts, [len(row_counts)])))
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+def _expand_sharded(mains, combo_frame, pair_main, pair_combo, options, workers: int, progress: Optional[ProgressCallback] = None):
+    """`_expand_arrays` split over a process pool; shards are concatenated in pair order, so the result equals the serial one.
+
+    With `progress`, the serial path is also cut into slices of about PROGRESS_ROWS rows and the callback runs after each
+    slice (or shard).
+    """
+    row_counts = 1 + combo_frame["count"][pair_combo]
+    total = int(row_counts.sum())
+    parallel = workers > 1 and len(pair_main) >= 2 and total >= PARALLEL_MIN_ROWS
+    if not parallel and (progress is None or len(pair_main) < 2):
+        columns, masks = _expand_arrays(mains, combo_frame, pair_main, pair_combo, *options)
+        if progress is not None and len(pair_main):
+            progress(total, total, int(pair_combo[-1]))
+        return columns, masks
+    bounds = _shard_bounds(row_counts, workers * SHARDS_PER_WORKER if parallel else max(1, total // PROGRESS_ROWS))
+    ends = np.cumsum(row_counts)
+    parts = []
+
+    def collect(results):
+        for (lo, hi), part in zip(bounds, results):
+            parts.append(part)
+            if progress is not None:
+                progress(int(ends[hi - 1]), total, int(pair_combo[hi - 1]))
+
+    if not parallel:
+        collect(_expand_arrays(mains, combo_frame, pair_main[lo:hi], pair_combo[lo:hi], *options) for lo, hi in bounds)
+        return _concat_arrays(parts)
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(bounds)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_shard_worker,
+        initargs=(mains, combo_frame, pair_main, pair_combo, options),
+    ) as pool:
+        collect((_unpack_columns(columns), masks) for columns, masks in pool.map(_expand_shard, bounds))
+    return _concat_arrays(parts)
+
+@dataclass
+class GenerationCache:
+    """The previous generation with one fingerprint per (main row, combo) block, for incremental regeneration.
+
+    Pass the same instance to `build_frame` / `build_frame_pairwise` on every run: blocks whose inputs are unchanged
+    are copied from the previous result, only the dirty ones are expanded (and simplified) again. The only copy of
+    the previous rows is `frame` itself (compact when generated compact); unchanged blocks are read back from it.
+    """
+    options: Any = None
+    fingerprints: Optional[np.ndarray] = None  # uint64，每个块一个
+    rows: Optional[np.ndarray] = None  # 每个块的行数
+    # 浮点列各单元格是否为整数（全为整数的列输出为整数列，不需要记录）
+    masks: Dict[str, np.ndarray] = field(default_factory=dict)
+    frame: Optional[pd.DataFrame] = None
+    reused: int = 0
+    rebuilt: int = 0
+
+def _main_row_hashes(mains) -> np.ndarray:
+    """64-bit hash per main row over code, spec, numeric values and int-ness."""
+    parts = {"code": mains["code"], "spec": mains["spec"]}
+    for col in NUMERIC_COLUMNS:
+        parts[col], parts[f"{col}_int"] = mains[col]
+    return pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy()
+
+def _block_fingerprints(mains, combo_frame, pair_main: np.ndarray, pair_combo: np.ndarray) -> np.ndarray:
+    """64-bit hash per (main, combo) pair over everything its block reads: the main row's hash and the combo's content key."""
+    main_fp = _main_row_hashes(mains)
+    combo_fp = pd.util.hash_array(combo_frame["key"]) if len(combo_frame["key"]) else np.array([], dtype=np.uint64)
+    return (main_fp[pair_main] * np.uint64(0x9E3779B97F4A7C15)) ^ combo_fp[pair_combo]
+
+def _block_rows(starts: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Row numbers covered by blocks starting at `starts` with `rows` rows each."""
+    firsts = np.concatenate(([0], np.cumsum(rows)[:-1])).astype(np.int64) if len(rows) else np.array([], dtype=np.int64)
+    return np.repeat(starts - firsts, rows) + np.arange(int(rows.sum()))
+
+def _frame_column(frame: pd.DataFrame, masks: Dict[str, np.ndarray], col: str, rows=slice(None)) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Raw values (and int mask for numeric columns) of `frame[col]` at `rows`: the inverse of `_output_column`."""
+    series = frame[col].iloc[rows]
+    if col not in NUMERIC_COLUMNS:
+        return series.to_numpy(dtype=object, copy=True), None
+    values = series.to_numpy(dtype="float64", copy=True)
+    return values, masks[col][rows] if col in masks else np.ones(len(values), dtype=bool)
+
+def _float_masks(masks: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    return {col: m for col, m in masks.items() if not m.all()}
+
+def _recategorized(cat: pd.Categorical) -> pd.Categorical:
+    """Drops unused categories and orders the rest by first appearance, as `_output_column` builds them."""
+    codes, used = pd.factorize(cat.codes)
+    return pd.Categorical.from_codes(codes, categories=cat.categories[used])
+
+def _to_frame_masks(columns, masks, take: np.ndarray, compact: bool) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    masks = {col: masks[col][take] for col in NUMERIC_COLUMNS}
+    return _to_frame({col: columns[col][take] for col in GENERATED_COLUMNS}, masks, compact), masks
+
+def _splice_frame(cache: GenerationCache, take: np.ndarray, new_columns, new_masks, compact: bool) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    """Rows `take` of the previous frame followed by the newly expanded rows, read from the frame itself.
+
+    Text columns are taken as they are stored (categorical codes, strings) instead of going back to object arrays.
+    """
+    layout = GENERATED_COLUMNS if compact else TEMPLATE_COLUMNS
+    if len(take) == 0:
+        return pd.DataFrame(columns=layout), {col: np.array([], dtype=bool) for col in NUMERIC_COLUMNS}
+    part = _to_frame(new_columns, new_masks, compact)
+    out, masks = {}, {}
+    for col in GENERATED_COLUMNS:
+        if col in NUMERIC_COLUMNS:
+            old_values, old_mask = _frame_column(cache.frame, cache.masks, col)
+            masks[col] = np.concatenate([old_mask, new_masks[col]])[take]
+            out[col] = _output_column(col, np.concatenate([old_values, new_columns[col]])[take], masks[col], compact)
+            continue
+        old = cache.frame[col].array
+        if isinstance(old.dtype, pd.CategoricalDtype):
+            both = union_categoricals([old, part[col].array], ignore_order=True) if len(part) else old
+            out[col] = _recategorized(both.take(take))
+        else:
+            out[col] = (pd.concat([cache.frame[col], part[col]], ignore_index=True).array if len(part) else old).take(take)
+    if not compact:
+        out.update({col: np.full(len(take), "", dtype=object) for col in EMPTY_COLUMNS})
+    return pd.DataFrame(out, columns=layout), masks
+
+def _patch_in_place(cache: GenerationCache, dirty_rows: np.ndarray, new_columns, new_masks, compact: bool) -> pd.DataFrame:
+    """Same block layout as last time: overwrite the dirty rows and rebuild only the columns whose values changed."""
+    frame = cache.frame.copy(deep=False)
+    masks = dict(cache.masks)
+    for col in GENERATED_COLUMNS:
+        old_values, old_mask = _frame_column(cache.frame, cache.masks, col, dirty_rows)
+        if np.array_equal(old_values, new_columns[col]) and (old_mask is None or np.array_equal(old_mask, new_masks[col])):
+            continue
+        values, mask = _frame_column(cache.frame, cache.masks, col)
+        values[dirty_rows] = new_columns[col]
+        if mask is not None:
+            mask = mask.copy()
+            mask[dirty_rows] = new_masks[col]
+            masks[col] = mask
+        frame[col] = _output_column(col, values, mask, compact)
+    cache.masks = _float_masks(masks)
+    return frame
+
+def _result_key(mains, combo_frame, pair_main: np.ndarray, pair_combo: np.ndarray, options, compact: bool) -> str:
+    """Canonical hash of everything the output depends on: normalized main rows, combo content keys, the pair layout,
+    rules and flags. Inputs that normalize the same (e.g. 数量 "2" and 2) share a key."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(_main_row_hashes(mains).tobytes())
+    h.update(json.dumps(combo_frame["key"].tolist()).encode("utf-8"))
+    h.update(pair_main.astype(np.int64).tobytes())
+    h.update(pair_combo.astype(np.int64).tobytes())
+    rules = [[old, new] for old, new in options[0]]
+    h.update(json.dumps([rules, *options[1:], compact], ensure_ascii=False, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+def _remember_result(key: str, frame: pd.DataFrame, masks: Dict[str, np.ndarray]):
+    size = int(frame.memory_usage(index=True, deep=True).sum()) + sum(m.nbytes for m in masks.values())
+    if size > RESULT_CACHE_BYTES:
+        return
+    with _RESULTS_LOCK:
+        _RESULTS[key] = (frame, masks, size)
+        _RESULTS.move_to_end(key)
+        total = sum(v[2] for v in _RESULTS.values())
+        while total > RESULT_CACHE_BYTES and len(_RESULTS) > 1:
+            _, (_, _, dropped) = _RESULTS.popitem(last=False)
+            total -= dropped
+
+def clear_result_cache():
+    """Drops the memoized results (benchmarks time real generation, not memo hits)."""
+    with _RESULTS_LOCK:
+        _RESULTS.clear()
+
+def _generate(mains, combo_frame, pair_main, pair_combo, options, workers: int, cache: Optional[GenerationCache], compact: bool, progress: Optional[ProgressCallback] = None) -> pd.DataFrame:
+    """Memoized front of `_generate_blocks`: identical requests (from any session) return the shared result."""
+    with profile_stage("memo"):
+        key = _result_key(mains, combo_frame, pair_main, pair_combo, options, compact)
+        with _RESULTS_LOCK:
+            hit = _RESULTS.get(key)
+            if hit is not None:
+                _RESULTS.move_to_end(key)
+    if hit is not None:
+        frame, masks, _ = hit
+        if cache is not None:
+            # 命中备忘也要把调用方的增量缓存更新为这次的结果，下次编辑才以它为基准
+            with profile_stage("fingerprint"):
+                cache.fingerprints = _block_fingerprints(mains, combo_frame, pair_main, pair_combo)
+            cache.options, cache.rows = _options_key(options, compact), 1 + combo_frame["count"][pair_combo]
+            cache.frame, cache.masks = frame, masks
+            cache.reused, cache.rebuilt = len(pair_main), 0
+        if progress is not None and len(pair_main):
+            progress(len(frame), len(frame), int(pair_combo[-1]))
+        return frame.copy(deep=False)
+    frame, masks = _generate_blocks(mains, combo_frame, pair_main, pair_combo, options, workers, cache, compact, progress)
+    _remember_result(key, frame, masks)
+    return frame.copy(deep=False)
+
+def _options_key(options, compact: bool) -> Tuple:
+    return (tuple(tuple(r) for r in options[0]),) + tuple(options[1:]) + (compact,)
+
+def _generate_blocks(mains, combo_frame, pair_main, pair_combo, options, workers: int, cache: Optional[GenerationCache], compact: bool, progress: Optional[ProgressCallback] = None) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    """The frame plus the int masks of its float columns (see `GenerationCache.masks`)."""
+    if cache is None:
+        with profile_stage("expand"):
+            columns, masks = _expand_sharded(mains, combo_frame, pair_main, pair_combo, options, workers, progress)
+        with profile_stage("frame"):
+            return _to_frame(columns, masks, compact), _float_masks(masks)
+    options_key = _options_key(options, compact)
+    if cache.options != options_key:
+        cache.options, cache.fingerprints, cache.frame = options_key, None, None
+
+    with profile_stage("fingerprint"):
+        fps = _block_fingerprints(mains, combo_frame, pair_main, pair_combo)
+    rows = 1 + combo_frame["count"][pair_combo]
+    out_start = np.concatenate(([0], np.cumsum(rows)[:-1])).astype(np.int64) if len(rows) else np.array([], dtype=np.int64)
+
+    dirty = None
+    if cache.frame is not None and len(cache.fingerprints) == len(fps) and np.array_equal(cache.rows, rows):
+        dirty = np.flatnonzero(fps != cache.fingerprints)
+        if np.isin(fps[dirty], cache.fingerprints).any():
+            dirty = None  # 行数相同但块挪了位置（如删一行又加一行）：按指纹查找
+    if dirty is not None:
+        # 块布局未变（如只改了价格/数量/编码文字）：逐位置比较指纹，变化的块原位替换
+        with profile_stage("expand"):
+            new_columns, new_masks = _expand_sharded(mains, combo_frame, pair_main[dirty], pair_combo[dirty], options, workers, progress)
+        with profile_stage("frame"):
+            frame = _patch_in_place(cache, _block_rows(out_start[dirty], rows[dirty]), new_columns, new_masks, compact) if len(dirty) else cache.frame
+    else:
+        # 布局变化（增删主商品/组合、调整顺序）：按指纹查找旧块，只展开找不到的块
+        old_start = np.full(len(fps), -1, dtype=np.int64)
+        if cache.frame is not None and len(cache.fingerprints):
+            uniq, first = np.unique(cache.fingerprints, return_index=True)
+            prev_start = np.concatenate(([0], np.cumsum(cache.rows)[:-1])).astype(np.int64)
+            hit = pd.Index(uniq).get_indexer(fps)
+            old_start[hit >= 0] = prev_start[first[hit[hit >= 0]]]
+        dirty = np.flatnonzero(old_start < 0)
+        with profile_stage("expand"):
+            new_columns, new_masks = _expand_sharded(mains, combo_frame, pair_main[dirty], pair_combo[dirty], options, workers, progress)
+        n_old = len(cache.frame) if cache.frame is not None else 0
+        src_start = old_start.copy()
+        src_start[dirty] = n_old + np.concatenate(([0], np.cumsum(rows[dirty])[:-1])).astype(np.int64) if len(dirty) else 0
+        with profile_stage("frame"):
+            take = _block_rows(src_start, rows)
+            frame, masks = _splice_frame(cache, take, new_columns, new_masks, compact) if n_old else _to_frame_masks(new_columns, new_masks, take, compact)
+            cache.masks = _float_masks(masks)
+
+    cache.fingerprints, cache.rows, cache.frame = fps, rows, frame
+    cache.reused, cache.rebuilt = len(fps) - len(dirty), len(dirty)
+    return frame, cache.masks
+
+def build_frame(main_products_df, combos, simplify_rules=None, use_regex=False, case_sensitive=True, apply_to_name=False, workers: int = 1, cache: Optional[GenerationCache] = None, compact: bool = False, progress: Optional[ProgressCallback] = None) -> pd.DataFrame:
+    """Every combo × every main product (combo-major), returned as the export DataFrame.
+
+    `workers > 1` shards large outputs across a process pool; `cache` reuses unchanged blocks of the previous run.
+    Neither changes the rows or their order. `compact` returns the compact layout (see `materialize_frame`).
+    Results are memoized process-wide (bounded by COMBO_RESULT_CACHE_MB), so identical requests return at once.
+    `progress(rows_done, rows_total, combo_index)` is called as blocks are expanded (only dirty blocks count when cached).
+    """
+    with profile_stage("prepare"):
+        mains = _main_frame(main_products_df)
+        combo_frame = _combo_frame(combos)
+    valid = np.flatnonzero(mains["valid"])
+    pair_combo = np.repeat(np.arange(len(combos)), len(valid))
+    pair_main = np.tile(valid, len(combos))
+    options = (simplify_rules or [], use_regex, case_sensitive, apply_to_name)
+    return _generate(mains, combo_frame, pair_main, pair_combo, options, workers, cache, compact, progress)
+
+def build_frame_pairwise(main_products_df, per_main_pairs, simplify_rules=None, use_regex=False, case_sensitive=True, apply_to_name=False, workers: int = 1, cache: Optional[GenerationCache] = None, compact: bool = False, progress: Optional[ProgressCallback] = None) -> pd.DataFrame:
+    """One (prefix, items) pair per main product, aligned by row position; missing pairs mean no sub-items."""
+    n = len(main_products_df)
+    pairs = list(per_main_pairs[:n]) + [("", [])] * max(0, n - len(per_main_pairs))
+    with profile_stage("prepare"):
+        mains = _main_frame(main_products_df)
+        combo_frame = _combo_frame(pairs)
+    pair_main = np.flatnonzero(mains["valid"])
+    options = (simplify_rules or [], use_regex, case_sensitive, apply_to_name)
+    return _generate(mains, combo_frame, pair_main, pair_main, options, workers, cache, compact, progress)
+
+def iter_frames(main_products_df, combos: Iterable, simplify_rules=None, use_regex=False, case_sensitive=True, apply_to_name=False, compact: bool = True, batch_rows: int = STREAM_ROWS, progress: Optional[ProgressCallback] = None, total_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """`build_frame` over a lazily produced combo sequence, one frame per batch of about `batch_rows` rows.
+
+    Combos (compiled, or raw (prefix, items) pairs) are pulled from the iterable only as batches are built, so a large
+    option product never exists as a list; raw pairs bypass the compiled-combo LRU. The batches, concatenated, hold the
+    rows of `build_frame(main_products_df, list(combos))` in the same order (an int column may come out as float in
+    the batches that contain fractional values). Not memoized. `progress` reports against `total_rows` when known.
+    """
+    with profile_stage("prepare"):
+        mains = _main_frame(main_products_df)
+    valid = np.flatnonzero(mains["valid"])
+    options = (simplify_rules or [], use_regex, case_sensitive, apply_to_name)
+    batch, rows, first, done = [], 0, 0, 0
+
+    def flush():
+        combo_frame = _combo_frame(batch)
+        pair_combo = np.repeat(np.arange(len(batch)), len(valid))
+        pair_main = np.tile(valid, len(batch))
+        with profile_stage("expand"):
+            expanded = _expand_arrays(mains, combo_frame, pair_main, pair_combo, *options)
+        with profile_stage("frame"):
+            return _to_frame(*expanded, compact)
+
+    for combo in combos:
+        batch.append(combo if isinstance(combo, CompiledCombo) else compile_combo(*combo, remember=False))
+        rows += len(valid) * (1 + len(batch[-1].items))
+        if rows >= batch_rows:
+            frame = flush()
+            done += len(frame)
+            if progress is not None:
+                progress(done, max(total_rows, done), first + len(batch) - 1)
+            yield frame
+            first += len(batch)
+            batch, rows = [], 0
+    if batch or not first:
+        frame = flush()
+        done += len(frame)
+        if progress is not None and batch:
+            progress(done, max(total_rows, done), first + len(batch) - 1)
+        yield frame
+
+def concat_frames(frames: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Batches from `iter_frames` as one frame; categorical columns stay categorical (categories are unioned)."""
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame(columns=GENERATED_COLUMNS)
+    if len(frames) == 1:
+        return frames[0]
+    out = pd.concat(frames, ignore_index=True)
+    for col in CATEGORICAL_COLUMNS:
+        if col in out.columns and all(isinstance(f[col].dtype, pd.CategoricalDtype) for f in frames):
+            out[col] = union_categoricals([f[col] for f in frames], ignore_order=True)
+    return out
+
+def build_rows(main_products_df, combos, simplify_rules=None, use_regex=False, case_sensitive=True, apply_to_name=False):
+    return build_frame(main_products_df, combos, simplify_rules, use_regex, case_sensitive, apply_to_name).to_dict("records")
+
+
+def build_rows_pairwise(main_products_df, per_main_pairs, simplify_rules=None, use_regex=False, case_sensitive=True, apply_to_name=False):
+    return build_frame_pairwise(main_products_df, per_main_pairs, simplify_rules, use_regex, case_sensitive, apply_to_name).to_dict("records")
@@ -0,0 +1,279 @@
+"""Export backends for generated frames, with serialized bytes cached by frame fingerprint.
+
+Formats: `xlsx` (pandas/openpyxl, styled header), `xlsx-stream` (openpyxl write-only, constant memory),
+`xlsx-sheets` / `xlsx-zip` (streamed, rolled over to extra sheets / files in a zip every `part_rows` rows),
+`csv` (UTF-8 with BOM so Excel opens it correctly) and `parquet` (needs pyarrow).
+"""
+import contextlib
+import hashlib
+import importlib.util
+import threading
+import weakref
+import zipfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .common import TEMPLATE_COLUMNS, resolve_env_number
+from .engine import block_starts, concat_frames, materialize_frame
+
+EXPORT_CACHE_BYTES = resolve_env_number('COMBO_EXPORT_CACHE_MB', 256) * 1024 * 1024
+XLSX_SHEET_NAME = "Sheet1"
+EXCEL_SHEET_ROWS = 1_048_575  # Excel 单表行数上限（不含表头）
+EXCEL_PART_ROWS = min(resolve_env_number('COMBO_EXCEL_PART_ROWS', EXCEL_SHEET_ROWS), EXCEL_SHEET_ROWS)
+CHUNK_ROWS = 50_000
+
+
+def part_bounds(df: pd.DataFrame, part_rows: int) -> List[Tuple[int, int]]:
+    """Row ranges of at most `part_rows` rows, cut only where a new combo block starts (unless one block alone is longer)."""
+    n = len(df)
+    if n <= part_rows:
+        return [(0, n)]
+    starts = block_starts(df)
+    bounds, lo = [], 0
+    while lo < n:
+        hi = lo + part_rows
+        if hi < n:
+            cut = starts[np.searchsorted(starts, hi, side="right") - 1] if len(starts) else hi
+            hi = cut if cut > lo else hi
+        hi = min(hi, n)
+        bounds.append((int(lo), int(hi)))
+        lo = hi
+    return bounds
+
+
+def _iter_chunks(df: pd.DataFrame, lo: int, hi: int) -> Iterator[List[list]]:
+    """Rows of df[lo:hi] as lists, CHUNK_ROWS at a time (a compact frame is materialized per chunk); empty strings
+    become blank cells."""
+    for start in range(lo, hi, CHUNK_ROWS):
+        chunk = materialize_frame(df.iloc[start:min(start + CHUNK_ROWS, hi)])
+        yield [[None if v == "" else v for v in row] for row in chunk.itertuples(index=False, name=None)]
+
+
+def _header(df: pd.DataFrame) -> List[str]:
+    return [str(c) for c in materialize_frame(df.iloc[:0]).columns]
+
+
+def _frame_parts(frames: Iterable[pd.DataFrame], part_rows: int) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """(part number from 1, rows) pieces of a frame stream, `part_bounds` style: a part holds at most `part_rows` rows
+    and is cut only where a combo block starts (unless one block alone is longer). Frames must end on block boundaries,
+    as `iter_frames` batches do."""
+    part, room = 0, 0
+    for df in frames:
+        n, lo = len(df), 0
+        starts = block_starts(df)
+        while lo < n:
+            if room == 0:
+                part, room = part + 1, part_rows
+            hi = min(n, lo + room)
+            if hi < n:
+                k = np.searchsorted(starts, hi, side="right") - 1
+                if k >= 0 and starts[k] > lo:
+                    hi = int(starts[k])
+                elif room < part_rows:
+                    room = 0  # 当前分片剩余空间放不下下一个块，换新分片
+                    continue
+            yield part, df.iloc[lo:hi]
+            room = room - (hi - lo) if hi == n else 0
+            lo = hi
+
+
+def _append_rows(ws, df: pd.DataFrame):
+    for chunk in _iter_chunks(df, 0, len(df)):
+        for row in chunk:
+            ws.append(row)
+
+
+def _stream_sheets(frames: Iterable[pd.DataFrame], out, part_rows: int, header: Optional[List[str]] = None, max_parts: int = 0):
+    """One write-only workbook with a sheet per part; rows are written straight to the output stream."""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws, current = None, 0
+    for part, piece in _frame_parts(frames, part_rows):
+        if part != current:
+            if max_parts and part > max_parts:
+                raise ValueError(f"超过 Excel 单表上限 {part_rows} 行，请改用分表或分文件导出")
+            ws, current = wb.create_sheet(XLSX_SHEET_NAME if part == 1 else f"Sheet{part}"), part
+            ws.append(header or _header(piece))
+        _append_rows(ws, piece)
+    if ws is None:
+        wb.create_sheet(XLSX_SHEET_NAME).append(header or list(TEMPLATE_COLUMNS))
+    wb.save(out)
+
+
+def _stream_zip(frames: Iterable[pd.DataFrame], out, part_rows: int, header: Optional[List[str]] = None):
+    """Zip of `组合装导入模板_001.xlsx` … , each part streamed directly into its zip entry."""
+    from openpyxl import Workbook
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED) as zf:
+        def close(wb, part):
+            with zf.open(f"组合装导入模板_{part:03d}.xlsx", "w", force_zip64=True) as entry:
+                wb.save(entry)
+
+        wb, ws, current = None, None, 0
+        for part, piece in _frame_parts(frames, part_rows):
+            if part != current:
+                if wb is not None:
+                    close(wb, current)
+                wb, current = Workbook(write_only=True), part
+                ws = wb.create_sheet(XLSX_SHEET_NAME)
+                ws.append(header or _header(piece))
+            _append_rows(ws, piece)
+        if wb is None:
+            wb, current = Workbook(write_only=True), 1
+            wb.create_sheet(XLSX_SHEET_NAME).append(header or list(TEMPLATE_COLUMNS))
+        close(wb, current)
+
+
+def _stream_csv(frames: Iterable[pd.DataFrame], out, part_rows: int):
+    """Header once (with the BOM), then each frame appended as it arrives."""
+    with (open(out, "wb") if isinstance(out, str) else contextlib.nullcontext(out)) as f:
+        first = True
+        for df in frames:
+            if len(df) or first:
+                f.write(materialize_frame(df).to_csv(index=False, header=first).encode("utf-8-sig" if first else "utf-8"))
+                first = False
+        if first:
+            f.write(pd.DataFrame(columns=TEMPLATE_COLUMNS).to_csv(index=False).encode("utf-8-sig"))
+
+
+def _write_xlsx(df: pd.DataFrame, out, part_rows: int):
+    materialize_frame(df).to_excel(out, index=False)
+
+
+def _write_xlsx_stream(df: pd.DataFrame, out, part_rows: int):
+    """Write-only workbook: memory does not grow with the sheet."""
+    _stream_sheets([df], out, max(len(df), 1), _header(df))
+
+
+def _write_xlsx_sheets(df: pd.DataFrame, out, part_rows: int):
+    _stream_sheets([df], out, part_rows, _header(df))
+
+
+def _write_xlsx_zip(df: pd.DataFrame, out, part_rows: int):
+    _stream_zip([df], out, part_rows, _header(df))
+
+
+def _write_csv(df: pd.DataFrame, out, part_rows: int):
+    materialize_frame(df).to_csv(out, index=False, encoding="utf-8-sig")
+
+
+def _write_parquet(df: pd.DataFrame, out, part_rows: int):
+    materialize_frame(df).to_parquet(out, index=False)
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    label: str
+    extension: str
+    mime: str
+    writer: Callable[[pd.DataFrame, object, int], None]
+    requires: str = ""  # 可选依赖的模块名
+    max_rows: int = 0  # 单个工作表能容纳的行数，0 = 不限
+    # 逐批写入 iter_frames 结果的写出函数；没有时先拼接成一个 frame 再写
+    stream_writer: Optional[Callable[[Iterable[pd.DataFrame], object, int], None]] = None
+
+
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    "xlsx": ExportFormat("Excel（.xlsx）", ".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", _write_xlsx, max_rows=EXCEL_SHEET_ROWS),
+    "xlsx-stream": ExportFormat("Excel 流式写入（大数据量，省内存）", ".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", _write_xlsx_stream, max_rows=EXCEL_SHEET_ROWS,
+                                stream_writer=lambda frames, out, part_rows: _stream_sheets(frames, out, EXCEL_SHEET_ROWS, max_parts=1)),
+    "xlsx-sheets": ExportFormat("Excel 分表（超出行数自动新建工作表）", ".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", _write_xlsx_sheets, stream_writer=_stream_sheets),
+    "xlsx-zip": ExportFormat("Excel 分文件（zip 打包）", ".zip", "application/zip", _write_xlsx_zip, stream_writer=_stream_zip),
+    "csv": ExportFormat("CSV（UTF-8）", ".csv", "text/csv", _write_csv, stream_writer=_stream_csv),
+    "parquet": ExportFormat("Parquet", ".parquet", "application/vnd.apache.parquet", _write_parquet, requires="pyarrow"),
+}
+
+
+def available_formats() -> Dict[str, ExportFormat]:
+    return {k: f for k, f in EXPORT_FORMATS.items() if not f.requires or importlib.util.find_spec(f.requires) is not None}
+
+
+def format_for_path(path: str) -> str:
+    lower = path.lower()
+    return next((k for k, f in EXPORT_FORMATS.items() if lower.endswith(f.extension)), "xlsx")
+
+
+def _export_spec(fmt: str, part_rows: int) -> ExportFormat:
+    spec = EXPORT_FORMATS.get(fmt)
+    if spec is None:
+        raise ValueError(f"不支持的导出格式：{fmt}（可选：{', '.join(EXPORT_FORMATS)}）")
+    if spec.requires and importlib.util.find_spec(spec.requires) is None:
+        raise ValueError(f"导出 {spec.label} 需要安装 {spec.requires}")
+    if not 0 < part_rows <= EXCEL_SHEET_ROWS:
+        raise ValueError(f"分片行数需在 1 ~ {EXCEL_SHEET_ROWS} 之间")
+    return spec
+
+
+def write_export(df: pd.DataFrame, fmt: str, out, part_rows: int = EXCEL_PART_ROWS):
+    """Writes `df` (full or compact layout) in format `fmt` to a path or binary file object; `part_rows` applies to the
+    sharded Excel formats."""
+    spec = _export_spec(fmt, part_rows)
+    if spec.max_rows and len(df) > spec.max_rows:
+        raise ValueError(f"共 {len(df)} 行，超过 Excel 单表上限 {spec.max_rows} 行，请改用分表或分文件导出")
+    spec.writer(df, out, part_rows)
+
+
+def write_export_stream(frames: Iterable[pd.DataFrame], fmt: str, out, part_rows: int = EXCEL_PART_ROWS) -> int:
+    """Writes a stream of frames (e.g. `iter_frames` batches) as one export, each batch as it arrives; returns the row count.
+
+    The streamed formats (xlsx-stream, xlsx-sheets, xlsx-zip, csv) never hold more than one batch; the others
+    concatenate the batches first.
+    """
+    spec = _export_spec(fmt, part_rows)
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for df in frames:
+            rows += len(df)
+            yield df
+
+    if spec.stream_writer is not None:
+        spec.stream_writer(counted(), out, part_rows)
+    else:
+        write_export(concat_frames(counted()), fmt, out, part_rows)
+    return rows
+
+
+_FINGERPRINTS: Dict[int, Tuple[weakref.ref, str]] = {}
+_EXPORT_CACHE: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+_EXPORT_CACHE_LOCK = threading.Lock()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Content hash of a frame (values, index and column names), memoized per frame object.
+
+    Generated frames are never modified in place, so the same object keeps the same fingerprint.
+    """
+    memo = _FINGERPRINTS.get(id(df))
+    if memo is not None and memo[0]() is df:
+        return memo[1]
+    h = hashlib.sha1(repr(list(df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    fp = h.hexdigest()
+    _FINGERPRINTS[id(df)] = (weakref.ref(df, lambda _, key=id(df): _FINGERPRINTS.pop(key, None)), fp)
+    return fp
+
+
+def export_bytes(df: pd.DataFrame, fmt: str = "xlsx", part_rows: int = EXCEL_PART_ROWS) -> bytes:
+    """Serialized `df`, computed once per (frame content, format) and kept in a shared LRU bounded by EXPORT_CACHE_BYTES."""
+    key = (frame_fingerprint(df), f"{fmt}:{part_rows}")
+    with _EXPORT_CACHE_LOCK:
+        data = _EXPORT_CACHE.get(key)
+        if data is not None:
+            _EXPORT_CACHE.move_to_end(key)
+            return data
+    out = BytesIO()
+    write_export(df, fmt, out, part_rows)
+    data = out.getvalue()
+    with _EXPORT_CACHE_LOCK:
+        _EXPORT_CACHE[key] = data
+        total = sum(len(v) for v in _EXPORT_CACHE.values())
+        while total > EXPORT_CACHE_BYTES and len(_EXPORT_CACHE) > 1:
+            _, dropped = _EXPORT_CACHE.popitem(last=False)
+            total -= len(dropped)
+    return data
@@ -0,0 +1,182 @@
+"""Reverse ingestion: turns exported 组合装导入模板 sheets back into reusable templates.
+
+A block is a main row plus the sub rows below it; main rows are found by `block_starts` (non-empty 组合颜色规格), as
+everywhere else, because simplify rules may have emptied 组合商品编码. The prefix is what 组合商品编码 has in
+front of the main 商品编码 (or, when codes were simplified, what 组合商品名称 has in front of 组合颜色规格). Every main
+product's ordered list of (prefix, items) is one candidate template; identical lists collapse into one.
+
+Blocks, items and per-main sequences are hashed and grouped with numpy, so only the distinct templates are built
+as Python dicts: `python -m combo_core.ingest 历史导入模板.xlsx --templates-file templates.db`.
+"""
+import argparse
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .common import COMBO_LIMIT_PER_TEMPLATE, TEMPLATE_DB, TEMPLATE_LIMIT, _num
+from .engine import BLOCK_START_COLUMN, block_starts, combo_content_hash
+from .mains import read_table
+from .store import template_library
+from .templates import option_groups
+
+ITEM_COLUMNS = ["商品编码", "数量", "应占售价", "基本售价", "组合成本价"]
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+@dataclass
+class IngestResult:
+    templates: List[Dict[str, Any]] = field(default_factory=list)
+    mains: int = 0  # 主商品数
+    blocks: int = 0  # 组合块数
+    skipped_rows: int = 0  # 第一个组合行之前的行
+    unprefixed: int = 0  # 推断不出前缀的组合块（前缀记为空）
+
+
+def infer_prefixes(combo_codes: np.ndarray, main_codes: np.ndarray, names: np.ndarray, specs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Prefix per block and whether it could be inferred, from code suffixes first and name suffixes second."""
+    c, m, n, s = (np.asarray(a, dtype=str).astype(np.dtypes.StringDType()) for a in (combo_codes, main_codes, names, specs))
+    m_len, s_len = np.strings.str_len(m), np.strings.str_len(s)
+    by_code = (m_len > 0) & np.strings.endswith(c, m)
+    by_name = ~by_code & (s_len > 0) & np.strings.endswith(n, s)
+    prefix = np.where(by_code, np.strings.slice(c, 0, np.strings.str_len(c) - m_len),
+                      np.where(by_name, np.strings.slice(n, 0, np.strings.str_len(n) - s_len), ""))
+    return prefix.astype(object), by_code | by_name
+
+
+def _position_mix(hashes: np.ndarray, group_starts: np.ndarray) -> np.ndarray:
+    """Mixes each hash with its position inside its group, so order matters once the group is summed."""
+    lengths = np.diff(np.append(group_starts, len(hashes)))
+    offset = np.arange(len(hashes)) - np.repeat(group_starts, lengths)
+    return (hashes ^ (offset.astype(np.uint64) * _MIX)) * np.uint64(0xBF58476D1CE4E5B9)
+
+
+def _item(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Sub-item normalized like pasted items, so equal content compares equal whatever its source."""
+    return {"商品编码": str(row.get("商品编码", "")).strip(), "数量": _num(row.get("数量"), 1), "应占售价": _num(row.get("应占售价"), 1.0),
+            "基本售价": _num(row.get("基本售价"), 1.0), "组合成本价": _num(row.get("组合成本价"), 1.0)}
+
+
+def templates_from_export(df: pd.DataFrame, name: str = "导入模板") -> IngestResult:
+    """Distinct templates found in an export sheet (as read by `read_table`), named `name 1`, `name 2`, ...
+
+    Templates longer than COMBO_LIMIT_PER_TEMPLATE are split into parts.
+    """
+    missing = [c for c in ["组合商品编码", BLOCK_START_COLUMN] + ITEM_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"不是组合装导入模板：缺少列 {', '.join(missing)}")
+    text = {c: df[c].astype(str).str.strip().to_numpy(dtype=object) if c in df.columns else np.full(len(df), "", dtype=object)
+            for c in ["组合商品编码", "组合商品名称", "组合颜色规格"] + ITEM_COLUMNS}
+    starts = block_starts(pd.DataFrame({BLOCK_START_COLUMN: text[BLOCK_START_COLUMN]}))
+    result = IngestResult(skipped_rows=int(starts[0]) if len(starts) else len(df), blocks=len(starts))
+    if not len(starts):
+        return result
+    first = starts[0]
+    rows = {c: v[first:] for c, v in text.items()}
+    starts = starts - first
+    n = len(rows["商品编码"])
+
+    prefixes, inferred = infer_prefixes(rows["组合商品编码"][starts], rows["商品编码"][starts], rows["组合商品名称"][starts], rows["组合颜色规格"][starts])
+    result.unprefixed = int((~inferred).sum())
+
+    # 每行的哈希：主行取前缀，副行取 (商品编码, 数量, 单价们)；按块求和得到组合内容哈希
+    item_parts = {"code": rows["商品编码"]}
+    for col in ITEM_COLUMNS[1:]:
+        # 价格取值很少：只解析去重后的取值
+        codes, uniques = pd.factorize(rows[col])
+        item_parts[col] = pd.to_numeric(pd.Series(uniques, dtype=object), errors="coerce").to_numpy(dtype="float64")[codes]
+    row_hash = pd.util.hash_pandas_object(pd.DataFrame(item_parts), index=False).to_numpy().copy()
+    row_hash[starts] = pd.util.hash_array(prefixes)
+    combo_hash = np.add.reduceat(_position_mix(row_hash, starts), starts)
+
+    # 主商品 = (商品编码, 组合颜色规格)；按主商品分组（保持出现顺序），组合序列的哈希即模板签名
+    main_ids, main_keys = pd.factorize(pd.Series(rows["商品编码"][starts] + "\x1f" + rows["组合颜色规格"][starts]))
+    order = np.argsort(main_ids, kind="stable")
+    group_starts = np.flatnonzero(np.diff(np.concatenate(([-1], main_ids[order]))) != 0)
+    signatures = np.add.reduceat(_position_mix(combo_hash[order], group_starts), group_starts)
+    result.mains = len(main_keys)
+
+    _, first_main = np.unique(signatures, return_index=True)
+    block_ends = np.append(starts[1:], n)
+    number = 0
+    for g in np.sort(first_main):
+        lo = group_starts[g]
+        hi = group_starts[g + 1] if g + 1 < len(group_starts) else len(order)
+        combos = []
+        for b in order[lo:hi]:
+            sub = slice(starts[b] + 1, block_ends[b])
+            items = [_item({c: rows[c][i] for c in ITEM_COLUMNS}) for i in range(sub.start, sub.stop)]
+            combos.append({"prefix": prefixes[b], "items": items})
+        parts = [combos[i:i + COMBO_LIMIT_PER_TEMPLATE] for i in range(0, len(combos), COMBO_LIMIT_PER_TEMPLATE)]
+        number += 1
+        for k, part in enumerate(parts):
+            suffix = f"（{k + 1}/{len(parts)}）" if len(parts) > 1 else ""
+            result.templates.append({"name": f"{name} {number}{suffix}", "combos": part})
+    return result
+
+
+def template_content_key(tpl: Dict[str, Any]) -> Tuple[str, ...]:
+    """One hash per combo, plus one per option choice (grouped by option group) for option-group templates."""
+    key = tuple(combo_content_hash(c.get("prefix", ""), [_item(it) for it in c.get("items", [])]) for c in tpl.get("combos", []))
+    for g in option_groups(tpl):
+        key += ("|",) + tuple(combo_content_hash(c.get("prefix", ""), [_item(it) for it in c.get("items", [])]) for c in g["choices"])
+    return key
+
+
+def merge_templates(existing: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str], int]:
+    """Appends templates whose content is not in the library yet; clashing names get a numeric suffix.
+
+    Returns the merged library, the names added and how many were skipped as duplicates (or over TEMPLATE_LIMIT).
+    """
+    merged = list(existing)
+    seen = {template_content_key(t) for t in merged}
+    names = {t["name"] for t in merged}
+    added, skipped = [], 0
+    for tpl in new:
+        key = template_content_key(tpl)
+        if key in seen or len(merged) >= TEMPLATE_LIMIT:
+            skipped += 1
+            continue
+        name, i = tpl["name"], 1
+        while name in names:
+            i += 1
+            name = f"{tpl['name']} ({i})"
+        merged.append({**tpl, "name": name})
+        seen.add(key)
+        names.add(name)
+        added.append(name)
+    return merged, added, skipped
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m combo_core.ingest", description="把历史组合装导入模板（.xlsx/.csv）反向导入为模板")
+    parser.add_argument("files", nargs="+", help="导出过的组合装导入模板")
+    parser.add_argument("--templates-file", default=TEMPLATE_DB, help=f"模板库路径（.json 为旧版模板文件），默认 {TEMPLATE_DB}")
+    parser.add_argument("--name", help="新模板名称前缀，默认取文件名")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不写入模板库")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        store = template_library(args.templates_file)
+        library, baseline = store.load()
+        for path in args.files:
+            result = templates_from_export(read_table(path), args.name or os.path.splitext(os.path.basename(path))[0])
+            library, added, skipped = merge_templates(library, result.templates)
+            note = f"，{result.unprefixed} 个组合推断不出前缀" if result.unprefixed else ""
+            print(f"{path}: {result.mains} 个主商品、{result.blocks} 个组合 -> 新增模板 {len(added)} 个，重复跳过 {skipped} 个{note}")
+        if not args.dry_run:
+            store.save(library, baseline)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
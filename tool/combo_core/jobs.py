@@ -0,0 +1,109 @@
+"""Process-wide background jobs for long-running work (generation and export), so the page stays responsive.
+
+A job runs a callable on a shared thread pool and exposes its progress (rows done / total, current stage) for the
+page to poll. Jobs are keyed by an owner (the session id) rather than by the Streamlit session object, so a reloaded
+page with the same owner finds its running or finished job again.
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from .common import resolve_env_number
+
+JOB_WORKERS = resolve_env_number('COMBO_JOB_WORKERS', 2)
+JOB_KEEP_SECONDS = 3600  # 结束超过这么久的任务从登记表中移除
+
+_ACTIVE = ("queued", "running")
+
+
+@dataclass
+class Job:
+    id: str
+    owner: str
+    label: str
+    status: str = "queued"  # queued / running / done / error
+    rows_done: int = 0
+    rows_total: int = 0
+    stage: str = ""
+    result: Any = None
+    error: str = ""
+    submitted: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in _ACTIVE
+
+    @property
+    def fraction(self) -> float:
+        return min(1.0, self.rows_done / self.rows_total) if self.rows_total else 0.0
+
+    def report(self, rows_done: int, rows_total: int, stage: Optional[str] = None):
+        """Progress callback for the job body; safe to call from any thread."""
+        self.rows_done, self.rows_total = int(rows_done), int(rows_total)
+        if stage is not None:
+            self.stage = stage
+
+
+_LOCK = threading.Lock()
+_JOBS: Dict[str, Job] = {}
+_LATEST: Dict[str, str] = {}  # owner -> 最近提交的任务 id
+_IDS = itertools.count(1)
+_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def _run(job: Job, fn: Callable[[Job], Any]):
+    job.status = "running"
+    try:
+        job.result = fn(job)
+        job.status = "done"
+    except Exception as e:
+        job.error = f"{type(e).__name__}: {e}"
+        job.status = "error"
+    finally:
+        job.finished = time.time()
+
+
+def _prune(now: float):
+    for job_id, job in list(_JOBS.items()):
+        if job.finished is not None and now - job.finished > JOB_KEEP_SECONDS and _LATEST.get(job.owner) != job_id:
+            del _JOBS[job_id]
+
+
+def submit_job(owner: str, label: str, fn: Callable[[Job], Any]) -> Job:
+    """Run `fn(job)` in the background; its return value becomes `job.result`, an exception becomes `job.error`.
+
+    Raises RuntimeError if the owner already has a job queued or running.
+    """
+    global _POOL
+    with _LOCK:
+        current = _JOBS.get(_LATEST.get(owner, ""))
+        if current is not None and current.active:
+            raise RuntimeError(f"已有任务在运行：{current.label}")
+        _prune(time.time())
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=max(1, JOB_WORKERS), thread_name_prefix="combo-job")
+        job = Job(id=f"{owner}:{next(_IDS)}", owner=owner, label=label)
+        _JOBS[job.id] = job
+        _LATEST[owner] = job.id
+    _POOL.submit(_run, job, fn)
+    return job
+
+
+def latest_job(owner: str) -> Optional[Job]:
+    """The owner's most recently submitted job, running or finished."""
+    with _LOCK:
+        return _JOBS.get(_LATEST.get(owner, ""))
+
+
+def wait_job(job: Job, timeout: Optional[float] = None, interval: float = 0.05) -> bool:
+    """Block until the job finishes (for scripts and tests); False on timeout."""
+    deadline = None if timeout is None else time.time() + timeout
+    while job.active:
+        if deadline is not None and time.time() > deadline:
+            return False
+        time.sleep(interval)
+    return True
@@ -0,0 +1,113 @@
+"""Main-product table: one DataFrame shared by the page grid, file import, batch edits and the CLI."""
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+MAIN_COLUMNS = ["主商品编码", "主商品组合颜色规格", "数量", "应占售价", "基本售价", "成本价"]
+MAIN_NUMERIC_DEFAULTS = {"数量": 1, "应占售价": 1.0, "基本售价": 1.0, "成本价": 1.0}
+
+# 主商品表列名 -> 可接受的表头
+MAIN_COLUMN_ALIASES = {
+    "主商品编码": ["主商品编码", "编码", "code"],
+    "主商品组合颜色规格": ["主商品组合颜色规格", "组合颜色规格", "规格", "spec"],
+    "数量": ["数量", "qty"],
+    "应占售价": ["应占售价", "price1"],
+    "基本售价": ["基本售价", "price2"],
+    "成本价": ["成本价", "组合成本价", "cost"],
+}
+
+
+def read_table(source, name: Optional[str] = None) -> pd.DataFrame:
+    """Reads a .csv/.xlsx/.xls/.parquet path or uploaded file as strings; `name` gives the extension for file objects."""
+    ext = os.path.splitext(name or str(source))[1].lower()
+    if ext in (".xlsx", ".xls"):
+        return pd.read_excel(source, dtype=str, keep_default_na=False)
+    if ext == ".csv":
+        return pd.read_csv(source, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    if ext == ".parquet":
+        raw = pd.read_parquet(source)
+        return raw.astype(object).where(raw.notna(), "").astype(str)
+    raise ValueError(f"不支持的文件类型：{name or source}（仅支持 .csv / .xlsx / .xls / .parquet）")
+
+
+def read_main_products(source, name: Optional[str] = None) -> pd.DataFrame:
+    """Main-product columns (by alias) as stripped strings; code and spec are required."""
+    raw = read_table(source, name)
+    headers = {str(c).strip(): c for c in raw.columns}
+    data = {}
+    for target, aliases in MAIN_COLUMN_ALIASES.items():
+        source_col = next((headers[a] for a in aliases if a in headers), None)
+        if source_col is not None:
+            data[target] = raw[source_col].astype(str).str.strip()
+    missing = [c for c in ("主商品编码", "主商品组合颜色规格") if c not in data]
+    if missing:
+        raise ValueError(f"主商品表缺少列：{', '.join(missing)}")
+    return pd.DataFrame(data)
+
+
+@dataclass
+class MainJoin:
+    """Result of `join_main_products`: the joined table plus the keys that did not pair up one-to-one."""
+    frame: pd.DataFrame
+    missing: List[str] = field(default_factory=list)  # 编码列表中有、表中没有
+    extra: List[str] = field(default_factory=list)  # 表中有、编码列表中没有
+    duplicates: List[str] = field(default_factory=list)  # 表中重复出现的编码（只取第一行）
+
+
+def join_main_products(codes: List[str], table: pd.DataFrame) -> MainJoin:
+    """Pairs `codes` (in their order) with rows of `table` by 主商品编码 instead of by line position.
+
+    One hash lookup per code; duplicated table keys use their first row. Codes without a row are left out of the
+    frame and reported, as are table rows no code asked for.
+    """
+    keys = table["主商品编码"].astype(str).str.strip()
+    dup = keys.duplicated()
+    duplicates = pd.unique(keys[dup & (keys != "")]).tolist()
+    unique_rows = table[~dup].reset_index(drop=True)
+    index = pd.Index(keys[~dup].to_numpy(dtype=object))
+    wanted = pd.Index([str(c).strip() for c in codes], dtype=object)
+    pos = index.get_indexer(wanted)
+    missing = pd.unique(wanted[pos < 0].to_numpy()).tolist()
+    unused = np.ones(len(index), dtype=bool)
+    unused[pos[pos >= 0]] = False
+    extra = index[unused].tolist()
+    frame = unique_rows.iloc[pos[pos >= 0]].reset_index(drop=True)
+    return MainJoin(frame=frame, missing=missing, extra=extra, duplicates=duplicates)
+
+
+def typed_main_products(df: pd.DataFrame, default_qty: int = 1) -> pd.DataFrame:
+    """All MAIN_COLUMNS with numeric dtypes; blank or invalid numbers take the defaults, `数量` stays int when integral."""
+    df = df.reset_index(drop=True)
+    out = pd.DataFrame({c: df[c].astype(str) if c in df.columns else "" for c in MAIN_COLUMNS[:2]}, index=range(len(df)))
+    for col, default in MAIN_NUMERIC_DEFAULTS.items():
+        fill = max(default, default_qty) if col == "数量" else default
+        values = pd.to_numeric(df[col], errors="coerce") if col in df.columns else pd.Series(float("nan"), index=out.index)
+        out[col] = values.fillna(fill).astype("float64")
+    if (out["数量"] % 1 == 0).all():
+        out["数量"] = out["数量"].astype("int64")
+    return out
+
+
+def sync_main_products(current: Optional[pd.DataFrame], codes: List[str], specs: List[str], default_qty: int = 1) -> pd.DataFrame:
+    """Table for the given codes/specs; numeric values of `current` are kept by row position, new rows get defaults."""
+    n = len(codes)
+    data: Dict[str, Any] = {"主商品编码": list(codes), "主商品组合颜色规格": list(specs)}
+    kept = 0 if current is None else min(n, len(current))
+    for col in MAIN_NUMERIC_DEFAULTS:
+        data[col] = list(current[col].iloc[:kept]) + [None] * (n - kept) if kept else [None] * n
+    out = typed_main_products(pd.DataFrame(data), default_qty)
+    return clamp_quantity(out, default_qty)
+
+
+def clamp_quantity(df: pd.DataFrame, min_qty: int) -> pd.DataFrame:
+    if len(df) and (df["数量"] < min_qty).any():
+        df = df.assign(数量=df["数量"].clip(lower=min_qty))
+    return df
+
+
+def apply_batch(df: pd.DataFrame, values: Dict[str, Any]) -> pd.DataFrame:
+    """Sets every row of the given columns at once (批量修改)."""
+    return df.assign(**{col: pd.Series(value, index=df.index, dtype="int64" if col == "数量" and float(value) % 1 == 0 else "float64") for col, value in values.items()})
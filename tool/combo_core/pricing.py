@@ -0,0 +1,139 @@
+"""Target-price allocation: spreads a combo's target price over its main product and sub-items by base-price weight.
+
+Works on a generated frame (full or compact) as array operations over all blocks at once, in integer cents. Per block
+with target T the main row's 应占售价 becomes T. Each component (the main product's own 基本售价, i.e. the main row
+total minus its sub-items, and every sub-item line 基本售价 × 数量) is owed `T × weight / W`. Sub-item unit prices
+are rounded down to the cent. The cents left over go one unit price step at a time to the sub-items with the largest
+remainders (largest-remainder method), and whatever cannot be placed that way stays with the main product. So the
+components always sum to T exactly and the main product's own share is never negative. Blocks whose base prices sum
+to zero are split by quantity instead.
+"""
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .engine import block_starts
+from .mains import read_table
+
+PRICE_DECIMALS = 2
+# 目标售价表列名 -> 可接受的表头
+TARGET_COLUMN_ALIASES = {
+    "主商品编码": ["主商品编码", "编码", "code"],
+    "目标售价": ["目标售价", "组合售价", "target", "price"],
+}
+
+
+def _block_layout(df: pd.DataFrame):
+    starts = block_starts(df)
+    lengths = np.diff(np.append(starts, len(df)))
+    return starts, lengths
+
+
+def round_half_up(values: np.ndarray, decimals: int = PRICE_DECIMALS) -> np.ndarray:
+    """四舍五入 (np.round rounds halves to even); the epsilon absorbs float noise such as 1.005 -> 1.00499…"""
+    scale = 10.0 ** decimals
+    return np.floor(np.abs(values) * scale + 0.5 + 1e-7) / scale * np.sign(values)
+
+
+def block_targets(df: pd.DataFrame, combo_prices: Optional[Sequence[float]] = None, blocks_per_combo: int = 0,
+                  main_prices: Optional[Mapping[str, float]] = None, first_block: int = 0) -> np.ndarray:
+    """Target price per block of `df` (NaN = keep the block's prices).
+
+    `combo_prices` has one entry per combo in generation order and assumes the combo-major layout of `build_frame`
+    (`blocks_per_combo` = number of valid main products; inferred from `df` when 0). `main_prices` maps a main
+    product code to its target and wins over the combo price. `first_block` is the global index of the first block,
+    for frames that are batches of a larger stream.
+    """
+    starts, _ = _block_layout(df)
+    targets = np.full(len(starts), np.nan)
+    if combo_prices is not None and len(combo_prices):
+        prices = np.asarray(combo_prices, dtype="float64")
+        per_combo = blocks_per_combo or len(starts) // len(prices)
+        if per_combo:
+            combo = (first_block + np.arange(len(starts))) // per_combo
+            inside = combo < len(prices)
+            targets[inside] = prices[combo[inside]]
+    if main_prices:
+        index = pd.Index(list(main_prices), dtype=object)
+        values = np.asarray(list(main_prices.values()), dtype="float64")
+        pos = index.get_indexer(pd.Index(df["商品编码"].to_numpy(dtype=object)[starts], dtype=object))
+        found = pos >= 0
+        targets[found] = np.where(np.isnan(values[pos[found]]), targets[found], values[pos[found]])
+    return targets
+
+
+def allocate_prices(df: pd.DataFrame, targets: np.ndarray, decimals: int = PRICE_DECIMALS) -> pd.DataFrame:
+    """`df` with 应占售价 reallocated for the blocks that have a target; other rows keep their values."""
+    starts, lengths = _block_layout(df)
+    targets = np.asarray(targets, dtype="float64")
+    if len(targets) != len(starts):
+        raise ValueError(f"目标售价数量（{len(targets)}）与组合数量（{len(starts)}）不一致")
+    active = ~np.isnan(targets)
+    if not active.any():
+        return df
+    first = starts[0]
+    block = np.repeat(np.arange(len(starts)), lengths)
+    is_main = np.zeros(len(block), dtype=bool)
+    is_main[starts - first] = True
+    qty = df["数量"].to_numpy(dtype="float64")[first:]
+    base = df["基本售价"].to_numpy(dtype="float64")[first:]
+
+    # 主商品行的基本售价 = 主商品单价 + Σ 副商品单价×数量，先还原主商品自身的权重
+    sub_weight = np.where(is_main, 0.0, base * qty)
+    sub_total = np.bincount(block, weights=sub_weight, minlength=len(starts))
+    weight = np.where(is_main, (base - np.repeat(sub_total, lengths)).clip(min=0), sub_weight)
+    total = np.bincount(block, weights=weight, minlength=len(starts))
+    # 基本售价合计为 0 的组合按数量平分
+    by_qty = total <= 0
+    if by_qty.any():
+        fallback = np.where(is_main, 1.0, qty)
+        weight = np.where(np.repeat(by_qty, lengths), fallback, weight)
+        total = np.where(by_qty, np.bincount(block, weights=fallback, minlength=len(starts)), total)
+
+    # 以分为单位：先把每个副商品的单价向下取整，再按最大余数法分配剩下的分
+    scale = 10.0 ** decimals
+    cents = np.rint(round_half_up(np.nan_to_num(targets), decimals) * scale)
+    share = np.repeat(cents, lengths) * weight / np.repeat(total, lengths)
+    sub = ~is_main & (qty > 0)
+    unit = np.floor(np.divide(share, qty, out=np.zeros_like(share), where=sub) + 1e-9)
+    used = np.where(is_main, np.floor(share + 1e-9), unit * qty)
+    budget = cents - np.bincount(block, weights=used, minlength=len(starts))
+    # 各块内按余数从大到小，依次给副商品单价加 1 分（整行加 数量 分），加到预算用完为止
+    order = np.lexsort((-(share - unit * qty), block))
+    order = order[sub[order]]
+    if len(order):
+        spent = np.cumsum(qty[order])
+        group_first = np.r_[True, block[order][1:] != block[order][:-1]]
+        spent -= np.maximum.accumulate(np.where(group_first, spent - qty[order], 0.0))
+        unit[order[spent <= budget[block[order]] + 1e-9]] += 1
+    price = np.where(is_main, np.repeat(cents, lengths), unit) / scale
+    current = df["应占售价"].to_numpy(dtype="float64")
+    new = current.copy()
+    rows = np.repeat(active, lengths)
+    new[first:][rows] = price[rows]
+    return df.assign(应占售价=new)
+
+
+def allocate_frames(frames: Iterable[pd.DataFrame], combo_prices: Optional[Sequence[float]] = None, blocks_per_combo: int = 0,
+                    main_prices: Optional[Mapping[str, float]] = None, decimals: int = PRICE_DECIMALS) -> Iterator[pd.DataFrame]:
+    """`allocate_prices` over a stream of block-aligned batches (e.g. `iter_frames`), keeping the global block index."""
+    first = 0
+    for df in frames:
+        targets = block_targets(df, combo_prices, blocks_per_combo, main_prices, first)
+        first += len(targets)
+        yield allocate_prices(df, targets, decimals)
+
+
+def read_target_prices(source, name: Optional[str] = None) -> Dict[str, float]:
+    """主商品编码 -> 目标售价 from a table (by column alias); blank or invalid prices are skipped."""
+    raw = read_table(source, name)
+    headers = {str(c).strip(): c for c in raw.columns}
+    cols = {target: next((headers[a] for a in aliases if a in headers), None) for target, aliases in TARGET_COLUMN_ALIASES.items()}
+    missing = [c for c, source_col in cols.items() if source_col is None]
+    if missing:
+        raise ValueError(f"目标售价表缺少列：{', '.join(missing)}")
+    codes = raw[cols["主商品编码"]].astype(str).str.strip()
+    prices = pd.to_numeric(raw[cols["目标售价"]], errors="coerce")
+    keep = (codes != "") & prices.notna()
+    return dict(zip(codes[keep], prices[keep].astype(float)))
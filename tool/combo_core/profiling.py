@@ -0,0 +1,106 @@
+"""Opt-in per-stage timing of a generation run (COMBO_PROFILE=1).
+
+A `StageProfiler` collects wall time and peak traced allocation (tracemalloc) per named stage. Code marks stages
+with `profile_stage(name)`, which is a no-op unless a profiler is active in the current context, so the engine
+pays nothing when profiling is off. Finished runs are appended as one JSON line each to COMBO_PROFILE_LOG.
+
+tracemalloc is process-wide: allocation figures of runs that overlap in time (two sessions generating at once)
+include each other's allocations. Work done in shard processes is not traced.
+"""
+import contextvars
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .common import resolve_env_boolean
+
+PROFILE_ENABLED = resolve_env_boolean('COMBO_PROFILE', False)
+PROFILE_LOG = os.environ.get('COMBO_PROFILE_LOG') or "combo_profile.jsonl"
+
+_ACTIVE: contextvars.ContextVar[Optional["StageProfiler"]] = contextvars.ContextVar("combo_profiler", default=None)
+_LOG_LOCK = threading.Lock()
+
+
+class StageProfiler:
+    """Per-stage wall time and peak allocation of one run; with `enabled=False` every method is a cheap no-op."""
+    def __init__(self, enabled: bool = True, track_memory: bool = True):
+        self.enabled = enabled
+        self.track_memory = track_memory
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._stack: List[List[int]] = []  # 每层：[进入时已分配字节数, 子阶段期间见到的峰值]
+
+    @contextmanager
+    def activate(self):
+        """Make this profiler the target of `profile_stage` in the current thread / context."""
+        if not self.enabled:
+            yield self
+            return
+        started = self.track_memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        token = _ACTIVE.set(self)
+        try:
+            yield self
+        finally:
+            _ACTIVE.reset(token)
+            if started:
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time one stage. Stages may nest and repeat; repeats add up their time and keep the largest peak."""
+        if not self.enabled:
+            yield
+            return
+        tracing = self.track_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, 0])
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            peak_bytes = 0
+            if tracing:
+                start, seen = self._stack.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], seen)
+                peak_bytes = max(0, peak - start)
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], peak)
+                tracemalloc.reset_peak()
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "peak_mb": 0.0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["peak_mb"] = max(entry["peak_mb"], peak_bytes / 2**20)
+            entry["calls"] += 1
+
+    def records(self) -> List[Dict[str, Any]]:
+        """One dict per stage in first-seen order, rounded for display and logging."""
+        return [{"stage": name, "seconds": round(s["seconds"], 4), "peak_mb": round(s["peak_mb"], 2), "calls": s["calls"]}
+                for name, s in self.stages.items()]
+
+
+@contextmanager
+def profile_stage(name: str):
+    """Time a stage on the active profiler, if any."""
+    profiler = _ACTIVE.get()
+    if profiler is None or not profiler.enabled:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+def append_profile_log(record: Dict[str, Any], path: str = PROFILE_LOG):
+    """Append one run as a JSON line (with a UTC timestamp); safe to call from several threads."""
+    line = json.dumps({"ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"), **record}, ensure_ascii=False)
+    with _LOG_LOCK, open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
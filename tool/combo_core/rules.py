@@ -0,0 +1,199 @@
+"""Code/name simplification rules: compiled once, applied per unique body."""
+import functools
+import os
+import random
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from .common import resolve_env_number
+
+RULE_MEMO_SIZE = 65536
+SUGGEST_SAMPLE = resolve_env_number('COMBO_SUGGEST_SAMPLE', 20000)  # 规则建议最多统计的编码数
+_TOKEN = re.compile(r"[A-Za-z0-9]+")
+
+def _template_ok(pattern: "re.Pattern", repl: str) -> bool:
+    # 替换模板的错误与被处理的字符串无关，可在编译期一次性校验
+    try:
+        pattern.sub(repl, "")
+        return True
+    except re.error:
+        return False
+
+def _case_variants(s: str) -> set:
+    return set(s.lower()) | set(s.upper())
+
+def _plain(old: str, new: str) -> bool:
+    return old.isascii() and new.isascii() and "\\" not in new
+
+def _fusable(run: List[Tuple[str, str]], old: str, new: str) -> bool:
+    """True if appending (old, new) to a fused run keeps single-pass matching identical to sequential replacement."""
+    if not _plain(old, new):
+        return False
+    chars = _case_variants(old)
+    for prev_old, prev_new in run:
+        # 前序规则删除文本会拼接左右内容，或其替换结果含本规则字符时，顺序执行可能产生新匹配
+        if not prev_new or chars & _case_variants(prev_old) or chars & _case_variants(prev_new):
+            return False
+    return True
+
+class CompiledRuleSet:
+    """Simplify rules validated and compiled once; `apply` is memoized per unique body."""
+
+    def __init__(self, rules: Tuple[Tuple[str, str], ...], use_regex: bool, case_sensitive: bool):
+        self.rules = rules
+        self.steps = self._compile(rules, use_regex, case_sensitive)
+        self.apply = functools.lru_cache(maxsize=RULE_MEMO_SIZE)(self._run)
+
+    @staticmethod
+    def _compile(rules, use_regex: bool, case_sensitive: bool) -> List[Callable[[str], str]]:
+        flags = 0 if case_sensitive else re.IGNORECASE
+        literal = []  # [(old, new)]，无效正则按原逻辑回退为普通文本
+        for old, new in rules:
+            if old == "":
+                continue
+            if use_regex:
+                try:
+                    pattern = re.compile(old, flags)
+                except re.error:
+                    pattern = None
+                if pattern is not None and _template_ok(pattern, new):
+                    if re.escape(old) == old and "\\" not in new:
+                        literal.append((old, new))  # 不含元字符的正则与普通文本替换等价
+                    else:
+                        literal.append((pattern, new))
+                    continue
+            literal.append((old, new))
+
+        steps: List[Callable[[str], str]] = []
+        run: List[Tuple[str, str]] = []
+
+        def flush():
+            if not run:
+                return
+            if len(run) == 1:
+                old, new = run[0]
+                pattern = re.compile(re.escape(old), re.IGNORECASE)
+                steps.append(functools.partial(pattern.sub, new if _template_ok(pattern, new) else new.replace("\\", r"\\")))
+            else:
+                pattern = re.compile("|".join(f"({re.escape(old)})" for old, _ in run), re.IGNORECASE)
+                news = [new for _, new in run]
+                steps.append(functools.partial(pattern.sub, lambda m, news=news: news[m.lastindex - 1]))
+            run.clear()
+
+        for old, new in literal:
+            if isinstance(old, re.Pattern):
+                flush()
+                steps.append(functools.partial(old.sub, new))
+            elif case_sensitive:
+                steps.append(lambda body, old=old, new=new: body.replace(old, new))
+            else:
+                # 不区分大小写的普通文本规则尽量合并为一次扫描
+                if run and not _fusable(run, old, new):
+                    flush()
+                run.append((old, new))
+                if not _plain(old, new):
+                    flush()
+        flush()
+        return steps
+
+    def _run(self, body: str) -> str:
+        for step in self.steps:
+            body = step(body)
+        return body
+
+@functools.lru_cache(maxsize=32)
+def compile_rules(rules: Tuple[Tuple[str, str], ...], use_regex: bool, case_sensitive: bool) -> CompiledRuleSet:
+    return CompiledRuleSet(rules, use_regex, case_sensitive)
+
+class StagedRules:
+    """Rules applied one at a time over the distinct codes, keeping the output after every rule (for live previews).
+
+    Editing rule k (or adding/removing rules from k on) re-evaluates only rules k..n, starting from the cached output
+    of rule k-1; other codes or regex/case flags start over. Applying single rules in turn equals `CompiledRuleSet.apply`.
+    """
+
+    def __init__(self):
+        self._key = None
+        self._bodies: List[str] = []
+        self._rules: List[Tuple[str, str]] = []
+        self._stages: List[List[str]] = []  # _stages[i]：依次应用前 i+1 条规则后的结果，与 _bodies 对齐
+        self.evaluated = 0  # 上次 apply 实际重算的规则数
+
+    def apply(self, codes: Sequence[str], rules: Sequence[Tuple[str, str]], use_regex: bool, case_sensitive: bool) -> List[str]:
+        bodies = list(dict.fromkeys(codes))
+        if (use_regex, case_sensitive) != self._key or bodies != self._bodies:
+            self._key, self._bodies, self._rules, self._stages = (use_regex, case_sensitive), bodies, [], []
+        rules = [(old, new) for old, new in rules]
+        k = 0
+        while k < min(len(rules), len(self._rules)) and rules[k] == self._rules[k]:
+            k += 1
+        del self._stages[k:]
+        current = self._stages[-1] if self._stages else self._bodies
+        for old, new in rules[k:]:
+            if old:
+                apply = compile_rules(((old, new),), use_regex, case_sensitive).apply
+                current = [apply(b) for b in current]
+            self._stages.append(current)
+        self._rules, self.evaluated = rules, len(rules) - k
+        final = dict(zip(self._bodies, current))
+        return [final[c] for c in codes]
+
+    def changed_per_rule(self) -> List[int]:
+        """Distinct codes each rule changed, from the cached stages."""
+        counts, prev = [], self._bodies
+        for stage in self._stages:
+            counts.append(sum(a != b for a, b in zip(prev, stage)))
+            prev = stage
+        return counts
+
+def invalid_regex(pattern: str) -> bool:
+    """True if `pattern` is not a valid regex (such rules are applied as plain text)."""
+    try:
+        re.compile(pattern)
+        return False
+    except re.error:
+        return True
+
+def _apply_rules_on_body(body: str, rules: List[Tuple[str, str]], use_regex: bool, case_sensitive: bool) -> str:
+    return compile_rules(tuple((old, new) for old, new in rules), use_regex, case_sensitive).apply(body)
+
+def apply_code_simplify(original: str, prefix: str, rules: List[Tuple[str, str]], use_regex: bool, case_sensitive: bool) -> str:
+    head, body = (prefix, original[len(prefix):]) if original.startswith(prefix) else ("", original)
+    body = _apply_rules_on_body(body, rules, use_regex, case_sensitive)
+    return f"{head}{body}"
+
+def apply_name_simplify(name: str, prefix: str, rules: List[Tuple[str, str]], use_regex: bool, case_sensitive: bool) -> str:
+    head, tail = (prefix, name[len(prefix):]) if name.startswith(prefix) else ("", name)
+    tail = _apply_rules_on_body(tail, rules, use_regex, case_sensitive)
+    return f"{head}{tail}"
+
+def _removal_form(token: str, text: str) -> str:
+    """The token with the separator it is most often written with in `text` (`-XL` rather than `XL`)."""
+    forms = Counter(lead + token if lead else token + trail for lead, trail in re.findall(
+        rf"([^A-Za-z0-9\n]?)(?<![A-Za-z0-9]){re.escape(token)}(?![A-Za-z0-9])([^A-Za-z0-9\n]?)", text))
+    return forms.most_common(1)[0][0] if forms else token
+
+def suggest_tokens_from_codes(codes: List[str], min_ratio: float = 0.6, sample: int = SUGGEST_SAMPLE) -> Dict[str, Any]:
+    """Longest common prefix of the codes, tokens found in at least `min_ratio` of them and removal rules for both.
+
+    The LCP is that of the smallest and largest code (every other code sorts between them). Tokens are counted on a
+    fixed random sample of at most `sample` codes; `rules` lists find strings (LCP first, then tokens with their usual
+    separator) that are not already covered by the LCP.
+    """
+    sug = {"lcp": "", "tokens": [], "rules": []}
+    if not codes: return sug
+    lcp = os.path.commonprefix([min(codes), max(codes)])
+    sug["lcp"] = lcp if len(lcp) >= 2 else ""
+    picked_codes = random.Random(0).sample(codes, sample) if len(codes) > sample else codes
+    freq = Counter(t for s in picked_codes for t in set(_TOKEN.findall(s)))
+    picked = sorted([(t, c) for t, c in freq.items() if c / len(picked_codes) >= min_ratio and len(t) >= 2], key=lambda x: (-x[1], -len(x[0]), x[0]))
+    sug["tokens"] = picked[:10]
+    text = "\n".join(picked_codes)
+    rules = [sug["lcp"]] if sug["lcp"] else []
+    for t, _ in sug["tokens"]:
+        form = _removal_form(t, text)
+        if form not in rules and not (sug["lcp"] and form in sug["lcp"]):
+            rules.append(form)
+    sug["rules"] = rules
+    return sug
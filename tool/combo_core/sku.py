@@ -0,0 +1,156 @@
+"""SKU master data: validates main and sub-item codes before generation and fills prices by code.
+
+The master (CSV / Excel / Parquet, ~200k rows) is held as a hash index for exact lookups and a sorted code array for
+prefix search; both are built once per load.
+"""
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from .engine import CompiledCombo
+from .mains import read_table
+
+SKU_MASTER_FILE = os.environ.get('COMBO_SKU_MASTER') or None  # 所有会话共用的默认主数据
+
+# 主数据列名 -> 可接受的表头
+SKU_COLUMN_ALIASES = {
+    "商品编码": ["商品编码", "编码", "sku", "code"],
+    "商品名称": ["商品名称", "名称", "name"],
+    "基本售价": ["基本售价", "售价", "price", "price2"],
+    "成本价": ["成本价", "组合成本价", "cost"],
+}
+SKU_PRICE_COLUMNS = ["基本售价", "成本价"]
+# 主数据价格列 -> 副商品字段 / 主商品表列
+ITEM_PRICE_FIELDS = {"基本售价": "基本售价", "成本价": "组合成本价"}
+MAIN_PRICE_FIELDS = {"基本售价": "基本售价", "成本价": "成本价"}
+
+
+def _codes(values: Iterable[Any]) -> np.ndarray:
+    return np.array([str(v).strip() for v in values], dtype=object)
+
+
+class SkuMaster:
+    def __init__(self, table: pd.DataFrame):
+        codes = table["商品编码"].astype(str).str.strip()
+        keep = (codes != "") & ~codes.duplicated()
+        self.duplicates = int(((codes != "") & ~keep).sum())  # 重复编码只保留第一行
+        self.codes = codes[keep].to_numpy(dtype=object)
+        self.index = pd.Index(self.codes)
+        self.names = table.loc[keep, "商品名称"].astype(str).to_numpy(dtype=object) if "商品名称" in table.columns else None
+        self.prices = {col: pd.to_numeric(table.loc[keep, col], errors="coerce").to_numpy(dtype="float64")
+                       for col in SKU_PRICE_COLUMNS if col in table.columns}
+        self._sorted = np.sort(self.codes.astype(str))
+
+    @classmethod
+    def load(cls, source, name: Optional[str] = None) -> "SkuMaster":
+        """Reads the master by column alias; the code column is required, name and prices are optional."""
+        raw = read_table(source, name)
+        headers = {str(c).strip(): c for c in raw.columns}
+        data = {}
+        for target, aliases in SKU_COLUMN_ALIASES.items():
+            source_col = next((headers[a] for a in aliases if a in headers), None)
+            if source_col is not None:
+                data[target] = raw[source_col]
+        if "商品编码" not in data:
+            raise ValueError("SKU 主数据缺少列：商品编码")
+        return cls(pd.DataFrame(data))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __contains__(self, code) -> bool:
+        return str(code).strip() in self.index
+
+    def positions(self, codes: Iterable[Any]) -> np.ndarray:
+        """Row of each code in the master, -1 when unknown (one hash lookup per code)."""
+        return self.index.get_indexer(pd.Index(_codes(codes)))
+
+    def unknown(self, codes: Iterable[Any]) -> List[str]:
+        """Distinct non-empty codes missing from the master, in first-seen order."""
+        distinct = pd.unique(_codes(codes))
+        missing = (self.index.get_indexer(pd.Index(distinct)) < 0) & (distinct != "")
+        return distinct[missing].tolist()
+
+    def search_prefix(self, prefix: str, limit: int = 10) -> List[str]:
+        """Codes starting with `prefix`, in sorted order (binary search on the sorted codes)."""
+        prefix = str(prefix).strip()
+        if not prefix:
+            return []
+        lo = np.searchsorted(self._sorted, prefix, side="left")
+        hi = np.searchsorted(self._sorted, prefix + "\U0010ffff", side="left")
+        return self._sorted[lo:min(hi, lo + limit)].tolist()
+
+    def suggest(self, code: str, limit: int = 5) -> List[str]:
+        """Closest codes by longest shared prefix, for hinting at typos."""
+        code = str(code).strip()
+        for n in range(len(code), 0, -1):
+            found = self.search_prefix(code[:n], limit)
+            if found:
+                return found
+        return []
+
+    def fill_frame(self, df: pd.DataFrame, code_column: str, fields: Mapping[str, str] = MAIN_PRICE_FIELDS) -> pd.DataFrame:
+        """Hash join on `code_column`: master prices replace the mapped columns where the code is known and the price set.
+
+        Rows without a master price keep their value (NaN for a column the frame did not have, i.e. the default)."""
+        if len(self) == 0:
+            return df  # 空主数据（只有表头的上传、无效的 COMBO_SKU_MASTER）：价格数组为空，不能按位置取值
+        pos = self.positions(df[code_column])
+        found = pos >= 0
+        updates = {}
+        for master_col, target in fields.items():
+            if master_col not in self.prices:
+                continue
+            values = np.where(found, self.prices[master_col][np.where(found, pos, 0)], np.nan)
+            hit = ~np.isnan(values)
+            if hit.any():
+                current = pd.to_numeric(df[target], errors="coerce").to_numpy(dtype="float64") if target in df.columns else np.full(len(df), np.nan)
+                updates[target] = np.where(hit, values, current)
+        return df.assign(**updates) if updates else df
+
+    def fill_items(self, items: List[Dict[str, Any]], fields: Mapping[str, str] = ITEM_PRICE_FIELDS) -> List[Dict[str, Any]]:
+        """Sub-items with prices taken from the master where their code is known; the input list is not modified."""
+        if not items:
+            return []
+        if len(self) == 0:
+            return [dict(it) for it in items]
+        pos = self.positions(it.get("商品编码", "") for it in items)
+        out = []
+        for it, p in zip(items, pos):
+            it = dict(it)
+            if p >= 0:
+                for master_col, target in fields.items():
+                    value = self.prices[master_col][p] if master_col in self.prices else np.nan
+                    if not np.isnan(value):
+                        it[target] = float(value)
+            out.append(it)
+        return out
+
+
+def sub_item_codes(combos) -> List[str]:
+    """Sub-item codes of compiled combos or raw (prefix, items) pairs, in order, for one `SkuMaster.unknown` pass."""
+    codes = []
+    for c in combos:
+        if isinstance(c, CompiledCombo):
+            codes.extend(item[0] for item in c.items)
+        else:
+            codes.extend(it.get("商品编码", "") for it in c[1])
+    return codes
+
+
+_DEFAULT: Dict[str, Any] = {}
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_sku_master() -> Optional[SkuMaster]:
+    """The master named by COMBO_SKU_MASTER, loaded once per process (reloaded when the file changes)."""
+    if not SKU_MASTER_FILE:
+        return None
+    mtime = os.path.getmtime(SKU_MASTER_FILE)
+    with _DEFAULT_LOCK:
+        if _DEFAULT.get("mtime") != mtime:
+            _DEFAULT.update(master=SkuMaster.load(SKU_MASTER_FILE), mtime=mtime)
+        return _DEFAULT["master"]
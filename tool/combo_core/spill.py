@@ -0,0 +1,195 @@
+"""Process-wide store for large per-session objects (generated frames, chart data, parse results).
+
+Objects stay in memory until the total estimated size exceeds the budget; then the least recently used sessions
+are written to a temp directory (DataFrames as Feather, anything else pickled) and dropped from memory. Sessions
+idle for longer than the TTL are deleted, memory and disk alike.
+
+Reading a spilled object back materializes it fully: `to_pandas` copies the Arrow table into pandas memory (the
+generated frames carry text and categorical columns, so there is no zero-copy path), and a lazy Arrow handle would
+only move that copy to the first column access. The reloaded object is therefore resident again, its size is
+re-estimated and counted toward the budget, and other sessions are spilled to make room.
+
+Entries are keyed by a session id supplied by the caller. Whoever knows a session id can read its objects, so the
+id must not leak; `SESSION_ID_IN_URL` (COMBO_SID_IN_URL=1) lets the app keep it in the page URL so results survive
+a reload, which is only appropriate when everyone with access to the app may see each other's results.
+"""
+import atexit
+import hashlib
+import importlib.util
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .common import resolve_env_boolean, resolve_env_number
+
+SPILL_BUDGET_BYTES = resolve_env_number('COMBO_SPILL_BUDGET_MB', 1024) * 1024 * 1024
+SPILL_TTL_SECONDS = resolve_env_number('COMBO_SPILL_TTL_HOURS', 12) * 3600
+SPILL_DIR = os.environ.get('COMBO_SPILL_DIR') or None
+SESSION_ID_IN_URL = resolve_env_boolean('COMBO_SID_IN_URL', False)
+
+
+def estimate_size(obj: Any) -> int:
+    """Rough in-memory size in bytes: exact for frames and arrays, recursive for containers and dataclasses."""
+    if obj is None:
+        return 0
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(estimate_size(v) for v in obj)
+    if hasattr(obj, "__dataclass_fields__"):
+        return sum(estimate_size(getattr(obj, f)) for f in obj.__dataclass_fields__)
+    return sys.getsizeof(obj)
+
+
+@dataclass
+class _Entry:
+    obj: Any = None  # None = 只在磁盘上
+    path: Optional[str] = None
+    size: int = 0
+    dirty: bool = True  # 内存中的版本尚未写盘
+
+
+class SpillStore:
+    def __init__(self, root: Optional[str] = None, memory_budget: int = SPILL_BUDGET_BYTES, ttl: float = SPILL_TTL_SECONDS):
+        self.root = root or tempfile.mkdtemp(prefix="combo_spill_", dir=SPILL_DIR)
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Dict[str, _Entry]]" = OrderedDict()  # 最近使用的会话在末尾
+        self._last_seen: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def put(self, session: str, name: str, obj: Any, size: Optional[int] = None):
+        """Stores `obj` (None deletes it). `size` overrides the estimate, e.g. for an object whose bulk is another
+        entry's memory; once spilled and read back the object owns its memory and is re-estimated."""
+        if obj is None:
+            self.drop(session, name)
+            return
+        with self._lock:
+            entries = self._touch(session)
+            old = entries.get(name)
+            if old is not None and old.path:
+                self._remove_file(old.path)
+            entries[name] = _Entry(obj=obj, size=estimate_size(obj) if size is None else size)
+            self._sweep()
+            self._evict(keep=session)
+
+    def get(self, session: str, name: str, default: Any = None) -> Any:
+        with self._lock:
+            entries = self._touch(session)
+            entry = entries.get(name)
+            if entry is None:
+                return default
+            if entry.obj is None:
+                # 读回即完整驻留内存，按实际大小计入预算
+                entry.obj = self._load(entry.path)
+                entry.size = estimate_size(entry.obj)
+                entry.dirty = False
+                self._evict(keep=session)
+            return entry.obj
+
+    def drop(self, session: str, name: str):
+        with self._lock:
+            entry = self._sessions.get(session, {}).pop(name, None)
+            if entry is not None and entry.path:
+                self._remove_file(entry.path)
+
+    def drop_session(self, session: str):
+        with self._lock:
+            for entry in self._sessions.pop(session, {}).values():
+                if entry.path:
+                    self._remove_file(entry.path)
+            self._last_seen.pop(session, None)
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sum(e.size for entries in self._sessions.values() for e in entries.values() if e.obj is not None)
+
+    def close(self):
+        with self._lock:
+            self._sessions.clear()
+            self._last_seen.clear()
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def _touch(self, session: str) -> Dict[str, _Entry]:
+        entries = self._sessions.setdefault(session, {})
+        self._sessions.move_to_end(session)
+        self._last_seen[session] = time.monotonic()
+        return entries
+
+    def _sweep(self):
+        cutoff = time.monotonic() - self.ttl
+        for session in [s for s, seen in self._last_seen.items() if seen < cutoff]:
+            self.drop_session(session)
+
+    def _evict(self, keep: str):
+        """Spills the least recently used sessions (never `keep`) until resident objects fit the budget."""
+        used = self.memory_usage()
+        for session in list(self._sessions):
+            if used <= self.memory_budget:
+                break
+            if session == keep:
+                continue
+            for name, entry in self._sessions[session].items():
+                if entry.obj is None:
+                    continue
+                if entry.dirty:
+                    entry.path = self._dump(session, name, entry.obj)
+                    entry.dirty = False
+                entry.obj = None
+                used -= entry.size
+
+    def _dump(self, session: str, name: str, obj: Any) -> str:
+        stem = os.path.join(self.root, hashlib.sha1(f"{session}\0{name}".encode("utf-8")).hexdigest())
+        if isinstance(obj, pd.DataFrame) and importlib.util.find_spec("pyarrow") is not None:
+            try:
+                obj.to_feather(stem + ".feather")
+                return stem + ".feather"
+            except Exception:
+                # 混合类型列、非字符串列名等 Arrow 存不了的表退回 pickle
+                self._remove_file(stem + ".feather")
+        with open(stem + ".pkl", "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return stem + ".pkl"
+
+    @staticmethod
+    def _load(path: str) -> Any:
+        if path.endswith(".feather"):
+            from pyarrow import feather
+            return feather.read_feather(path)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_STORE: Optional[SpillStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_spill_store() -> SpillStore:
+    """The process-wide store, created on first use and removed from disk at exit."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = SpillStore()
+            atexit.register(_STORE.close)
+        return _STORE
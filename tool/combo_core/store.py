@@ -0,0 +1,185 @@
+"""Template library in a local SQLite file, with templates, combos and items as indexed tables.
+
+`load` returns the templates together with their content hashes (the baseline); the caller keeps both, one pair
+per session, and hands the baseline back to `save`. `save` takes the whole library like `write_templates`, but
+writes per template: inside one `BEGIN IMMEDIATE` transaction it compares each template's hash with the hash stored
+in the database and with the caller's baseline. Only templates the caller added or changed are rewritten (a changed
+template is replaced with all its combos and items), only templates it removed are deleted, and unchanged ones at
+most get a new position. A template that another writer added, edited or deleted meanwhile, and this caller did not
+touch, is left as that writer left it.
+
+Reading never creates the database: until the first save, `load` reads the legacy `templates.json` next to it, and
+the first save migrates that file once before applying its own changes.
+
+Option groups live in the same tables: `grp` 0 holds the template's own combos, `grp` k the choices of option group k.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .common import TEMPLATE_DB, TEMPLATE_LIMIT
+from .templates import normalize_templates, read_templates, write_templates
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, position INTEGER NOT NULL, hash TEXT NOT NULL, extra TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS templates_position ON templates (position);
+CREATE TABLE IF NOT EXISTS combos (
+    template_id INTEGER NOT NULL REFERENCES templates (id) ON DELETE CASCADE,
+    grp INTEGER NOT NULL, position INTEGER NOT NULL, prefix TEXT NOT NULL, extra TEXT NOT NULL,
+    PRIMARY KEY (template_id, grp, position)
+);
+CREATE TABLE IF NOT EXISTS items (
+    template_id INTEGER NOT NULL REFERENCES templates (id) ON DELETE CASCADE,
+    grp INTEGER NOT NULL, combo INTEGER NOT NULL, position INTEGER NOT NULL, code TEXT NOT NULL, data TEXT NOT NULL,
+    PRIMARY KEY (template_id, grp, combo, position)
+);
+CREATE INDEX IF NOT EXISTS items_code ON items (code);
+"""
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True)
+
+
+def content_hash(tpl: Dict[str, Any]) -> str:
+    return hashlib.sha1(_dumps(tpl).encode("utf-8")).hexdigest()
+
+
+def library_baseline(templates: List[Dict[str, Any]]) -> Dict[str, str]:
+    return {t["name"]: content_hash(t) for t in templates}
+
+
+class TemplateStore:
+    """SQLite template library; `load`/`save` behave like `read_templates`/`write_templates` plus a baseline."""
+
+    def __init__(self, path: str = TEMPLATE_DB, legacy_json: Optional[str] = None):
+        self.path = path
+        self.legacy_json = legacy_json if legacy_json is not None else os.path.splitext(path)[0] + ".json"
+        self._ready = False
+
+    @contextlib.contextmanager
+    def _transaction(self, write: bool) -> Iterator[sqlite3.Connection]:
+        """Write transactions create the schema and run the one-time migration; read transactions are deferred."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA foreign_keys = ON")
+            if write and not self._ready:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.executescript(SCHEMA)
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                if write and not self._ready:
+                    self._migrate(conn)
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if write:
+                self._ready = True
+        finally:
+            conn.close()
+
+    def _migrate(self, conn: sqlite3.Connection):
+        # 只迁移一次：meta 中记下来源，之后以数据库为准
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from'").fetchone():
+            return
+        source = self.legacy_json if os.path.exists(self.legacy_json) else ""
+        if source:
+            for pos, tpl in enumerate(read_templates(source)):
+                self._insert(conn, tpl, pos, content_hash(tpl))
+        conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', ?)", (source,))
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, tpl: Dict[str, Any], pos: int, digest: str):
+        groups = tpl.get("options", [])
+        extra = {k: v for k, v in tpl.items() if k not in ("name", "combos", "options")}
+        if "options" in tpl:
+            extra["options"] = [{k: v for k, v in g.items() if k != "choices"} for g in groups]
+        tid = conn.execute("INSERT INTO templates (name, position, hash, extra) VALUES (?, ?, ?, ?)", (tpl["name"], pos, digest, _dumps(extra))).lastrowid
+        combos, items = [], []
+        for grp, entries in enumerate([tpl.get("combos", [])] + [g.get("choices", []) for g in groups]):
+            for ci, combo in enumerate(entries):
+                combos.append((tid, grp, ci, combo.get("prefix", ""), _dumps({k: v for k, v in combo.items() if k not in ("prefix", "items")})))
+                items.extend((tid, grp, ci, ii, str(it.get("商品编码", "")), _dumps(it)) for ii, it in enumerate(combo.get("items", [])))
+        conn.executemany("INSERT INTO combos (template_id, grp, position, prefix, extra) VALUES (?, ?, ?, ?, ?)", combos)
+        conn.executemany("INSERT INTO items (template_id, grp, combo, position, code, data) VALUES (?, ?, ?, ?, ?, ?)", items)
+
+    def load(self) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """(templates, baseline): the baseline maps each name to its content hash and is passed back to `save`."""
+        if os.path.exists(self.path):
+            templates = self._read()
+        else:
+            # 数据库还不存在：读旧版 JSON，不建库；第一次保存时才建库并迁移
+            templates = read_templates(self.legacy_json) if os.path.exists(self.legacy_json) else []
+        return templates, library_baseline(templates)
+
+    def _read(self) -> List[Dict[str, Any]]:
+        with self._transaction(write=False) as conn:
+            rows = conn.execute("SELECT id, name, extra FROM templates ORDER BY position, id").fetchall()
+            combo_rows = conn.execute("SELECT template_id, grp, position, prefix, extra FROM combos ORDER BY template_id, grp, position").fetchall()
+            item_rows = conn.execute("SELECT template_id, grp, combo, data FROM items ORDER BY template_id, grp, combo, position").fetchall()
+        # 每列 JSON 拼成一个数组一次解析，比逐行 json.loads 快得多
+        combo_extras = json.loads("[" + ",".join(r[4] for r in combo_rows) + "]")
+        item_data = json.loads("[" + ",".join(r[3] for r in item_rows) + "]")
+        entries: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        for (tid, grp, _, prefix, _), extra in zip(combo_rows, combo_extras):
+            entries.setdefault((tid, grp), []).append({"prefix": prefix, "items": [], **extra})
+        for (tid, grp, ci, _), item in zip(item_rows, item_data):
+            entries[(tid, grp)][ci]["items"].append(item)
+        templates = []
+        for tid, name, extra in rows:
+            tpl = {"name": name, "combos": entries.get((tid, 0), []), **json.loads(extra)}
+            if "options" in tpl:
+                tpl["options"] = [{**g, "choices": entries.get((tid, k + 1), [])} for k, g in enumerate(tpl["options"])]
+            templates.append(tpl)
+        return normalize_templates(templates)
+
+    def save(self, templates: List[Dict[str, Any]], baseline: Dict[str, str]) -> Dict[str, str]:
+        """Writes the templates added, changed or removed relative to `baseline` (see the module doc); returns the new baseline."""
+        templates = templates[:TEMPLATE_LIMIT]
+        names = [t["name"] for t in templates]
+        if len(set(names)) != len(names):
+            raise ValueError(f"模板名称重复：{', '.join(sorted({n for n in names if names.count(n) > 1}))}")
+        digests = library_baseline(templates)
+        with self._transaction(write=True) as conn:
+            stored = {name: (digest, pos) for name, digest, pos in conn.execute("SELECT name, hash, position FROM templates")}
+            conn.executemany("DELETE FROM templates WHERE name = ?", [(n,) for n in baseline if n not in digests and n in stored])
+            for pos, tpl in enumerate(templates):
+                name, digest = tpl["name"], digests[tpl["name"]]
+                current = stored.get(name)
+                if current is not None and current[0] == digest:
+                    if current[1] != pos:
+                        conn.execute("UPDATE templates SET position = ? WHERE name = ?", (pos, name))
+                    continue
+                if baseline.get(name) == digest:
+                    continue  # 调用方未改动、库中已被他人修改或删除：保持他人的结果
+                conn.execute("DELETE FROM templates WHERE name = ?", (name,))
+                self._insert(conn, tpl, pos, digest)
+        return digests
+
+
+class JsonTemplateFile:
+    """The legacy `templates.json` behind the `TemplateStore` interface (full rewrite on every save, baseline unused)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        templates = read_templates(self.path) if os.path.exists(self.path) else []
+        return templates, library_baseline(templates)
+
+    def save(self, templates: List[Dict[str, Any]], baseline: Dict[str, str]) -> Dict[str, str]:
+        write_templates(self.path, templates)
+        return library_baseline(templates[:TEMPLATE_LIMIT])
+
+
+def template_library(path: str = TEMPLATE_DB):
+    """`JsonTemplateFile` for a `.json` path, `TemplateStore` otherwise."""
+    return JsonTemplateFile(path) if path.lower().endswith(".json") else TemplateStore(path)
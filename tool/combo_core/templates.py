@@ -0,0 +1,85 @@
+"""Template library I/O (`templates.json`), option-group expansion and pasted sub-item parsing.
+
+Besides its `combos`, a template may carry `options`: `[{"name": "壳色", "choices": [{"prefix": "红", "items": [...]}]}]`.
+Every pick of one choice per group is a combo (prefixes joined in group order, items concatenated); the cartesian
+product is only ever walked by a generator, never stored.
+"""
+import itertools
+import json
+import math
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .common import COMBO_LIMIT_PER_TEMPLATE, TEMPLATE_LIMIT, _lines, _num, resolve_env_number
+
+OPTION_CHOICE_LIMIT = COMBO_LIMIT_PER_TEMPLATE  # 每个选项组最多的选项数
+# 页面内展开选项组的行数上限：页面边生成边写出，但写好的导出文件整体留在内存中供下载，更大的量用命令行直接写到磁盘
+OPTION_UI_ROW_LIMIT = resolve_env_number('COMBO_OPTION_UI_ROWS', 1_000_000)
+
+
+def normalize_templates(data: Any) -> List[Dict[str, Any]]:
+    """Accepts `{"templates": [...]}` or a bare list; legacy single-combo templates become one-combo templates."""
+    templates = data["templates"] if isinstance(data, dict) and "templates" in data else (data if isinstance(data, list) else [])
+    normalized = []
+    for t in templates:
+        if "combos" in t or "options" in t:
+            normalized.append({**t, "combos": t.get("combos", [])})
+        else:
+            normalized.append({"name": t.get("name",""), "combos": [{"prefix": t.get("prefix",""), "items": t.get("items", [])}]})
+    return normalized[:TEMPLATE_LIMIT]
+
+def read_templates(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return normalize_templates(json.load(f))
+
+def write_templates(path: str, templates: List[Dict[str, Any]]):
+    data = {"templates": templates[:TEMPLATE_LIMIT]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def option_groups(tpl: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Option groups that have at least one choice (an empty group would make the product empty)."""
+    return [g for g in tpl.get("options", []) if g.get("choices")]
+
+def option_combo_count(tpl: Dict[str, Any]) -> int:
+    groups = option_groups(tpl)
+    return math.prod(len(g["choices"]) for g in groups) if groups else 0
+
+def template_size(tpl: Dict[str, Any]) -> Tuple[int, int]:
+    """(combos, sub-item rows) per main product, option product included, computed without expanding it.
+
+    Each choice of a group appears in `product / len(group)` combos.
+    """
+    combos = tpl.get("combos", [])
+    n_combos, n_items = len(combos), sum(len(c.get("items", [])) for c in combos)
+    product = option_combo_count(tpl)
+    if product:
+        n_combos += product
+        n_items += sum(product // len(g["choices"]) * sum(len(c.get("items", [])) for c in g["choices"]) for g in option_groups(tpl))
+    return n_combos, n_items
+
+def iter_option_combos(tpl: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Combos of the option product, lazily, in odometer order (the last group varies fastest)."""
+    groups = option_groups(tpl)
+    if not groups:
+        return
+    for picks in itertools.product(*(g["choices"] for g in groups)):
+        yield {"prefix": "".join(c.get("prefix", "") for c in picks), "items": [it for c in picks for it in c.get("items", [])]}
+
+def iter_template_combos(tpl: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """The template's own combos, then its option combos."""
+    yield from tpl.get("combos", [])
+    yield from iter_option_combos(tpl)
+
+def parse_items_block_codes_default1(text: str) -> List[Dict[str, Any]]:
+    items = []
+    for line in _lines(text):
+        parts = [p.strip() for p in line.split(",")]
+        if not parts:
+            continue
+        code = parts[0]
+        qty  = _num(parts[1] if len(parts)>1 else "", 1)
+        p1   = _num(parts[2] if len(parts)>2 else "", 1.0)
+        p2   = _num(parts[3] if len(parts)>3 else "", 1.0)
+        cost = _num(parts[4] if len(parts)>4 else "", 1.0)
+        items.append({"商品编码": code, "数量": qty, "应占售价": p1, "基本售价": p2, "组合成本价": cost})
+    return items
@@ -1,470 +1,35 @@
 import streamlit as st
 import pandas as pd
 import json
-import re
 import copy
 import time
-import os
-import random
-import urllib.parse
+import uuid
+import bisect
+import dataclasses
+import itertools
 from io import BytesIO
-from typing import List, Dict, Any, Tuple, Optional
-from collections import Counter
-import plotly.express as px
-import plotly.graph_objects as go
-import requests
+from typing import List, Dict, Any
 
+from combo_core import (
+    TEMPLATE_DB, TEMPLATE_LIMIT, GENERATE_WORKERS, COMBO_LIMIT_PER_TEMPLATE, ADHOC_COMBO_LIMIT, _lines,
+    TemplateStore, parse_items_block_codes_default1,
+    OPTION_CHOICE_LIMIT, OPTION_UI_ROW_LIMIT, option_groups, option_combo_count, template_size, iter_option_combos,
+    CompiledCombo, compile_combo, build_frame, build_frame_pairwise, iter_frames, GenerationCache, materialize_frame,
+    block_targets, allocate_prices, allocate_frames,
+    available_formats, export_bytes, write_export_stream, frame_fingerprint, EXCEL_SHEET_ROWS, EXCEL_PART_ROWS,
+    DEFAULT_WORKSPACE, block_hashes, diff_blocks, delta_rows, load_baseline, save_baseline,
+    get_spill_store, estimate_size, SESSION_ID_IN_URL, submit_job, latest_job, PROFILE_ENABLED, StageProfiler, profile_stage, append_profile_log,
+    SkuMaster, default_sku_master, sub_item_codes, MAIN_PRICE_FIELDS,
+    templates_from_export, merge_templates,
+    StagedRules, invalid_regex, suggest_tokens_from_codes,
+    MAIN_COLUMNS, read_table, read_main_products, join_main_products, typed_main_products, sync_main_products, clamp_quantity, apply_batch,
+)
 
-# 抖音下载配置 - 借鉴 TypeScript 实现
-def resolve_env_number(key: str, fallback: int) -> int:
-    """解析环境变量数字值"""
-    try:
-        value = os.environ.get(key)
-        if value is not None:
-            parsed = int(value)
-            return parsed if parsed > 0 else fallback
-        return fallback
-    except (ValueError, TypeError):
-        return fallback
-
-def resolve_env_boolean(key: str, fallback: bool) -> bool:
-    """解析环境变量布尔值"""
-    try:
-        value = os.environ.get(key)
-        if value is None:
-            return fallback
-        normalized = value.strip().lower()
-        if normalized in ('false', '0'):
-            return False
-        if normalized in ('true', '1'):
-            return True
-        return fallback
-    except (ValueError, TypeError, AttributeError):
-        return fallback
-
-# 配置常量
-DOUYIN_REQUEST_TIMEOUT = resolve_env_number('DOUYIN_REQUEST_TIMEOUT', 30000)  # 30秒
-DOUYIN_MAX_RETRIES = max(0, resolve_env_number('DOUYIN_MAX_RETRIES', 3))
-DOUYIN_RETRY_DELAY_MS = resolve_env_number('DOUYIN_RETRY_DELAY', 1000)
-
-
-def sleep_async(ms: int):
-    """异步等待"""
-    time.sleep(ms / 1000.0)
-
-
-def generate_fallback_urls(original_url: str) -> List[str]:
-    """生成备用 CDN URL - 借鉴 TypeScript 实现"""
-    fallback_urls = []
-    
-    try:
-        parsed = urllib.parse.urlparse(original_url)
-        
-        # 常见的抖音 CDN 域名
-        cdn_domains = [
-            'aweme.snssdk.com',
-            'v5-hl-zenl-ov.zjcdn.com',
-            'v3-hl-zenl-ov.zjcdn.com', 
-            'v6-hl-zenl-ov.zjcdn.com',
-            'v1-hl-zenl-ov.zjcdn.com',
-            'v9-hl-zenl-ov.zjcdn.com',
-            'p3-sign.douyinpic.com',
-            'p1-sign.douyinpic.com',
-            'p9-sign.douyinpic.com'
-        ]
-        
-        # 生成不同 CDN 的备用 URL
-        for domain in cdn_domains:
-            if parsed.netloc != domain:
-                fallback = urllib.parse.urlparse(original_url)
-                fallback = fallback._replace(netloc=domain)
-                fallback_urls.append(fallback.geturl())
-        
-        # 尝试不同的协议
-        if parsed.scheme == 'https':
-            http_fallback = urllib.parse.urlparse(original_url)
-            http_fallback = http_fallback._replace(scheme='http')
-            fallback_urls.append(http_fallback.geturl())
-        
-        # 尝试不同的路径参数
-        query_params = urllib.parse.parse_qs(parsed.query)
-        if 'line' not in query_params:
-            for line in range(4):  # line=0,1,2,3
-                line_fallback = urllib.parse.urlparse(original_url)
-                new_query = query_params.copy()
-                new_query['line'] = str(line)
-                line_fallback = line_fallback._replace(
-                    query=urllib.parse.urlencode(new_query, doseq=True)
-                )
-                fallback_urls.append(line_fallback.geturl())
-        
-    except Exception as e:
-        st.warning(f"生成备用 URL 失败: {e}")
-    
-    return fallback_urls
-
-
-async def try_multiple_video_urls(urls: List[str]) -> Optional[str]:
-    """尝试多个视频 URL 直到找到一个可用的 - 借鉴 TypeScript 实现"""
-    if not urls:
-        return None
-    
-    st.info(f"🔄 尝试 {len(urls)} 个视频 URL")
-    
-    # 合并原始 URL 和备用 URL
-    all_urls = []
-    for url in urls:
-        all_urls.append(url)
-        # 为每个原始 URL 生成备用 URL
-        fallback_urls = generate_fallback_urls(url)
-        all_urls.extend(fallback_urls)
-    
-    # 去重
-    unique_urls = list(dict.fromkeys(all_urls))  # 保持顺序的去重
-    st.info(f"📡 总共尝试 {len(unique_urls)} 个 URL（包含备用）")
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/605.1.15',
-        'Accept': 'video/mp4,video/webm,video/ogg,video/*;q=0.9,application/ogg;q=0.7,audio/*;q=0.6,*/*;q=0.5',
-        'Accept-Language': 'zh-CN,zh;q=0.8',
-        'Referer': 'https://www.douyin.com/',
-        'Connection': 'keep-alive'
-    }
-    
-    for i, url in enumerate(unique_urls):
-        try:
-            st.write(f"🔍 尝试 URL {i + 1}/{len(unique_urls)}")
-            
-            # 使用 HEAD 请求预先检测 URL 可用性
-            head_response = requests.head(
-                url, 
-                headers=headers, 
-                timeout=8  # 8秒超时用于HEAD请求
-            )
-            
-            if head_response.ok:
-                content_type = head_response.headers.get('content-type', '')
-                content_length = head_response.headers.get('content-length', '0')
-                
-                # 检查是否为视频或具有合理的内容长度
-                if (content_type and 'video' in content_type.lower()) or \
-                   (content_length.isdigit() and int(content_length) > 10000) or \
-                   '.mp4' in url or '/play/' in url:
-                    st.success(f"✅ URL {i + 1} 可用 ({content_type or 'unknown'}, {content_length or 'unknown'} bytes)")
-                    return url
-            
-        except requests.exceptions.RequestException as e:
-            st.warning(f"⚠️ URL {i + 1} 不可用: {str(e)}")
-    
-    st.error("❌ 所有视频 URL 都不可用")
-    return None
-
-
-def requests_with_retry(url: str, headers: Dict[str, str] = None, timeout: int = None, max_retries: int = None) -> requests.Response:
-    """带重试机制的请求函数 - 借鉴 TypeScript 实现"""
-    if headers is None:
-        # 使用默认的请求头，这些头信息对抖音CDN是必需的
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/605.1.15',
-            'Accept': 'video/mp4,video/webm,video/ogg,video/*;q=0.9,application/ogg;q=0.7,audio/*;q=0.6,*/*;q=0.5',
-            'Accept-Language': 'zh-CN,zh;q=0.8',
-            'Referer': 'https://www.douyin.com/',
-            'Connection': 'keep-alive'
-        }
-    if timeout is None:
-        timeout = DOUYIN_REQUEST_TIMEOUT // 1000  # 转换为秒
-    if max_retries is None:
-        max_retries = DOUYIN_MAX_RETRIES
-    
-    last_error = None
-    
-    for attempt in range(max_retries + 1):
-        try:
-            response = requests.get(url, headers=headers, timeout=timeout)
-            if response.ok:
-                return response
-            else:
-                raise requests.exceptions.HTTPError(f"HTTP {response.status_code}: {response.reason}")
-                
-        except requests.exceptions.RequestException as e:
-            last_error = e
-            
-            # 如果是最后一次尝试，直接抛出异常
-            if attempt == max_retries:
-                break
-            
-            # 记录重试尝试
-            st.warning(f"🔄 请求失败 (尝试 {attempt + 1}/{max_retries + 1}): {str(e)}")
-            
-            # 指数退避 + 随机抖动
-            base_delay = DOUYIN_RETRY_DELAY_MS * (2 ** attempt)
-            jitter = random.uniform(0, 0.3 * base_delay)  # 30% 抖动
-            delay = base_delay + jitter
-            
-            st.info(f"⏱️ 等待 {delay/1000:.1f} 秒后重试...")
-            sleep_async(int(delay))
-    
-    raise last_error or Exception("Max retries exceeded")
-
-
-def parse_douyin_url_method2(url: str) -> Optional[Dict[str, Any]]:
-    """
-    第二解析线路 - 使用抖音移动端API
-    参考: https://github.com/pwh-pwh/douyinVd
-    """
-    try:
-        # 移动端User-Agent
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/605.1.15',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9',
-            'Referer': 'https://www.douyin.com/',
-        }
-        
-        # 第一步：获取重定向后的URL
-        response = requests.get(url, headers=headers, allow_redirects=True, timeout=10)
-        final_url = response.url
-        
-        # 从URL中提取aweme_id或video_id
-        aweme_id = None
-        import re
-        
-        # 尝试多种模式匹配ID
-        patterns = [
-            r'/video/(\d+)',
-            r'modal_id=(\d+)',
-            r'aweme_id=(\d+)',
-            r'/(\d{19})',  # 19位数字ID
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, final_url)
-            if match:
-                aweme_id = match.group(1)
-                break
-        
-        if not aweme_id:
-            st.warning("⚠️ 线路2: 无法从URL提取视频ID")
-            return None
-        
-        # 第二步：使用抖音wap API获取视频信息
-        api_url = f"https://www.iesdouyin.com/aweme/v1/web/aweme/detail/?aweme_id={aweme_id}"
-        
-        api_headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/605.1.15',
-            'Referer': 'https://www.douyin.com/',
-            'Accept': 'application/json',
-        }
-        
-        api_response = requests.get(api_url, headers=api_headers, timeout=15)
-        
-        if api_response.status_code != 200:
-            st.warning(f"⚠️ 线路2: API请求失败 (HTTP {api_response.status_code})")
-            return None
-        
-        data = api_response.json()
-        
-        # 检查API响应
-        if data.get('status_code') != 0:
-            st.warning(f"⚠️ 线路2: API返回错误 - {data.get('status_msg', '未知错误')}")
-            return None
-        
-        aweme_detail = data.get('aweme_detail')
-        if not aweme_detail:
-            st.warning("⚠️ 线路2: 未找到视频详情")
-            return None
-        
-        # 解析视频信息
-        result = {
-            'code': 200,
-            'message': 'success (线路2)',
-            'data': {
-                'awemeId': aweme_detail.get('aweme_id', ''),
-                'desc': aweme_detail.get('desc', ''),
-                'create_time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(aweme_detail.get('create_time', 0))),
-                'author_name': aweme_detail.get('author', {}).get('nickname', ''),
-                'author': aweme_detail.get('author', {}).get('nickname', ''),
-                'nickname': aweme_detail.get('author', {}).get('nickname', ''),
-                'cover': '',
-                'comment_count': aweme_detail.get('statistics', {}).get('comment_count', 0),
-                'like_count': aweme_detail.get('statistics', {}).get('digg_count', 0),
-                'digg_count': aweme_detail.get('statistics', {}).get('digg_count', 0),
-                'share_count': aweme_detail.get('statistics', {}).get('share_count', 0),
-                'collect_count': aweme_detail.get('statistics', {}).get('collect_count', 0)
-            }
-        }
-        
-        # 检查是否为图集
-        images = aweme_detail.get('images')
-        if images:
-            result['data']['type'] = 'image'
-            result['data']['images'] = []
-            for img in images:
-                url_list = img.get('url_list', [])
-                if url_list:
-                    result['data']['images'].append(url_list[0])
-            if result['data']['images']:
-                result['data']['cover'] = result['data']['images'][0]
-        else:
-            # 解析视频
-            result['data']['type'] = 'video'
-            video_info = aweme_detail.get('video', {})
-            
-            # 获取封面
-            cover = video_info.get('cover', {})
-            if cover and 'url_list' in cover and cover['url_list']:
-                result['data']['cover'] = cover['url_list'][0]
-            
-            # 获取视频下载地址
-            video_urls = []
-            
-            # 方法1: play_addr (无水印)
-            play_addr = video_info.get('play_addr', {})
-            if play_addr and 'url_list' in play_addr:
-                for url in play_addr['url_list']:
-                    clean_url = url.replace('playwm', 'play')
-                    if clean_url not in video_urls:
-                        video_urls.append(clean_url)
-            
-            # 方法2: download_addr (下载地址)
-            download_addr = video_info.get('download_addr', {})
-            if download_addr and 'url_list' in download_addr:
-                for url in download_addr['url_list']:
-                    clean_url = url.replace('playwm', 'play')
-                    if clean_url not in video_urls:
-                        video_urls.append(clean_url)
-            
-            # 方法3: bit_rate (不同清晰度)
-            bit_rate_list = video_info.get('bit_rate', [])
-            for bit_rate in bit_rate_list:
-                play_addr_item = bit_rate.get('play_addr', {})
-                if play_addr_item and 'url_list' in play_addr_item:
-                    for url in play_addr_item['url_list']:
-                        clean_url = url.replace('playwm', 'play')
-                        if clean_url not in video_urls:
-                            video_urls.append(clean_url)
-            
-            # 确保URL完整
-            final_video_urls = []
-            for url in video_urls:
-                if not url.startswith('http'):
-                    url = 'https:' + url if url.startswith('//') else 'https://' + url
-                if url not in final_video_urls:
-                    final_video_urls.append(url)
-            
-            if final_video_urls:
-                result['data']['video_url'] = final_video_urls[0]
-                result['data']['all_video_urls'] = final_video_urls
-            
-        return result
-        
-    except Exception as e:
-        st.warning(f"⚠️ 线路2解析异常: {str(e)}")
-        return None
-
-
-def format_number_chinese(value):
-    """将数字格式化为中文单位：万（w）、亿等"""
-    if pd.isna(value) or value == 0:
-        return "0"
-    
-    abs_value = abs(value)
-    sign = "-" if value < 0 else ""
-    
-    if abs_value >= 100000000:  # 1亿
-        return f"{sign}{abs_value/100000000:.2f}亿"
-    elif abs_value >= 10000:  # 1万
-        return f"{sign}{abs_value/10000:.2f}w"
-    elif abs_value >= 1000:  # 1千
-        return f"{sign}{abs_value/1000:.2f}k"
-    else:
-        return f"{sign}{abs_value:.2f}"
-
-
-def update_xaxis_ticks(fig, x_axis_data, angle, interval_threshold, interval_step):
-    x_labels = pd.unique(x_axis_data)
-    num_x_items = len(x_labels)
-
-    tickvals, ticktext = None, None
-    x_range = None # Initialize x_range
-
-    # Apply special tick logic only for categorical data when items are many
-    # For numerical data, let Plotly handle tick generation automatically
-    if x_axis_data.dtype == 'object' and num_x_items > interval_threshold:
-        tickvals = list(x_labels)
-        ticktext = [str(label) for label in x_labels]
-
-        for i in range(1, num_x_items - 1): # Keep first, check others
-            if i % interval_step != 0:
-                ticktext[i] = ""
-
-        # Ensure last is visible, and hide second-to-last to avoid crowding
-        if num_x_items > 1:
-            ticktext[-2] = ""
-            ticktext[-1] = str(x_labels[-1])
-    elif pd.api.types.is_numeric_dtype(x_axis_data):
-        # For numerical data, ensure the range covers the max value
-        x_min = x_axis_data.min()
-        x_max = x_axis_data.max()
-        x_range = [x_min, x_max * 1.05] # Add a 5% buffer to the max to ensure it's fully visible
-
-    fig.update_xaxes(tickangle=angle, tickvals=tickvals, ticktext=ticktext, automargin=True, range=x_range)
-    return fig
-
-def update_yaxis_range(fig, y_axis_data, use_chinese_format=True, yaxis_num=1):
-    """更新Y轴范围和格式"""
-    # Let Plotly's autorange handle the limits, but ensure the range extends to zero.
-    yaxis_key = 'yaxis' if yaxis_num == 1 else f'yaxis{yaxis_num}'
-    
-    if use_chinese_format:
-        # 获取Y轴数据的最大值来确定tickformat
-        max_val = y_axis_data.max() if hasattr(y_axis_data, 'max') else max(y_axis_data)
-        
-        # 创建自定义的tickvals和ticktext
-        fig.update_layout({
-            yaxis_key: dict(
-                rangemode="tozero",
-                autorange=True,
-                tickformat="",
-                tickmode="auto"
-            )
-        })
-        
-        # 使用tickformatstops来自定义格式
-        if yaxis_num == 1:
-            fig.update_yaxes(rangemode="tozero", autorange=True)
-        else:
-            fig.update_layout({yaxis_key: dict(rangemode="tozero", autorange=True)})
-    else:
-        if yaxis_num == 1:
-            fig.update_yaxes(rangemode="tozero", autorange=True)
-        else:
-            fig.update_layout({yaxis_key: dict(rangemode="tozero", autorange=True)})
-    
-    return fig
 
+def st_notify(level: str, message: str):
+    """把 combo_core 的进度消息转发到页面（info / write / success / warning / error）"""
+    getattr(st, level)(message)
 
-def apply_chinese_yaxis_format(fig, yaxis_num=1):
-    """应用中文Y轴格式到图表"""
-    yaxis_key = 'yaxis' if yaxis_num == 1 else f'yaxis{yaxis_num}'
-    
-    # 使用自定义的tickformat函数
-    fig.update_layout({
-        yaxis_key: dict(
-            tickformat="",
-            tickmode="auto",
-        )
-    })
-    
-    # 获取当前的traces并更新hover模板
-    for trace in fig.data:
-        if hasattr(trace, 'y') and trace.y is not None:
-            # 更新hover模板以显示中文格式
-            if hasattr(trace, 'hovertemplate') and trace.hovertemplate:
-                # 保持现有的hovertemplate
-                pass
-    
-    return fig
 
 # ============================
 # App Config
@@ -592,70 +157,167 @@ def inject_theme(theme_mode: str):
     """
     st.session_state["__theme_slot"].markdown("<style>" + css_vars + base_css + "</style>", unsafe_allow_html=True)
 
-# ============================
-# Data/Domain Config
-# ============================
-TEMPLATE_COLUMNS = [
-    '组合商品编码','组合装商品标签','组合款式编码','组合商品名称','组合商品简称','组合商品实体编码',
-    '虚拟分类','组合颜色规格','禁止库存同步','商品编码','数量','应占售价','基本售价','组合成本价','图片','品牌'
-]
-TEMPLATE_FILE = "templates.json"
-TEMPLATE_LIMIT = 999
-COMBO_LIMIT_PER_TEMPLATE = 100
-ADHOC_COMBO_LIMIT = 100
-
 # ============================
 # Helpers
 # ============================
-def _lines(raw: str):
-    if not raw or not raw.strip(): return []
-    return [s.strip() for s in raw.strip().splitlines() if s.strip()]
+@st.cache_resource
+def template_store() -> TemplateStore:
+    return TemplateStore(TEMPLATE_DB)
+
+def load_templates() -> List[Dict[str, Any]]:
+    """本会话的模板库副本；连同读取时各模板的内容哈希（基线）一起放在 session_state，会话之间互不影响"""
+    if '__templates' not in st.session_state:
+        try:
+            templates, baseline = template_store().load()
+        except Exception as e:
+            st.warning(f"读取模板失败：{e}")
+            templates, baseline = [], {}
+        st.session_state['__templates'], st.session_state['__template_baseline'] = templates, baseline
+    return st.session_state['__templates']
 
-def _num(val, default):
-    if val is None or str(val).strip() == "": return default
+def save_templates(templates: List[Dict[str, Any]]):
+    # 只写入本会话相对基线改动过的模板，然后重新读取，带上其他会话的改动
+    template_store().save(templates, st.session_state.get('__template_baseline', {}))
+    st.session_state.pop('__templates', None)
+    load_templates()
+
+def session_spill_id() -> str:
+    """会话外存储和后台任务的会话 id，默认只存在于本次 Streamlit 会话中。
+    知道 id 即可读取该会话的生成结果，因此只有 COMBO_SID_IN_URL=1 时才写进地址栏（?sid=），
+    以便刷新页面后找回结果和运行中的任务；拿到该链接的人都能看到这些结果，仅适合可互相查看结果的团队使用"""
+    sid = st.session_state.get('__spill_session')
+    if sid is None:
+        sid = (st.query_params.get('sid') if SESSION_ID_IN_URL else None) or uuid.uuid4().hex
+        st.session_state['__spill_session'] = sid
+    if SESSION_ID_IN_URL and st.query_params.get('sid') != sid:
+        st.query_params['sid'] = sid
+    return sid
+
+def spilled(name: str, default=None):
+    """取出放在会话外存储中的大对象（生成结果、图表数据、解析结果），内存不足时它们会落盘"""
+    return get_spill_store().get(session_spill_id(), name, default)
+
+def spill(name: str, obj):
+    """存入会话外存储；obj 为 None 时删除"""
+    get_spill_store().put(session_spill_id(), name, obj)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def rule_suggestions(codes: tuple) -> List[str]:
+    """按主商品编码缓存的规则建议：编码不变时，编辑规则等重跑不再重新统计"""
+    return suggest_tokens_from_codes(list(codes))["rules"]
+
+def export_format_for(n_rows: int, fmt: str) -> str:
+    """实际使用的导出格式：不可用时退回 xlsx，超过单表上限时改为分文件（zip）"""
+    formats = available_formats()
+    fmt = fmt if fmt in formats else "xlsx"
+    return "xlsx-zip" if formats[fmt].max_rows and n_rows > formats[fmt].max_rows else fmt
+
+def stream_export_format(n_rows: int, fmt: str) -> str:
+    """边生成边写出时的导出格式：xlsx 改用流式写出（同为单个 xlsx 文件），其余同 export_format_for"""
+    fmt = "xlsx-stream" if fmt == "xlsx" and "xlsx-stream" in available_formats() else fmt
+    return export_format_for(n_rows, fmt)
+
+def generated_block_hashes(df: pd.DataFrame) -> pd.Series:
+    """生成结果每个组合块的内容哈希，按结果指纹缓存在会话外存储中"""
+    fp = frame_fingerprint(df)
+    cached = spilled('generated_block_hashes')
+    if cached is not None and cached[0] == fp:
+        return cached[1]
+    hashes = block_hashes(df)
+    spill('generated_block_hashes', (fp, hashes))
+    return hashes
+
+def mark_exported():
+    """下载后把当前结果记为该工作区上次导出的内容，下次增量导出以它为基线"""
+    df = spilled('generated_df')
+    if df is not None:
+        save_baseline(st.session_state.get('delta_workspace') or DEFAULT_WORKSPACE, generated_block_hashes(df))
+
+@st.fragment(run_every=1.0)
+def render_generation_progress(job_id: str):
+    """后台生成任务的进度条，每秒刷新一次（只刷新这一块）；任务结束后整页重跑以显示结果"""
+    job = latest_job(session_spill_id())
+    if job is None or job.id != job_id:
+        return
+    if not job.active:
+        st.rerun()
+    stage = job.stage or "排队中"
+    st.progress(job.fraction, text=f"⏳ {job.label}：{stage} · 已生成 {job.rows_done}/{job.rows_total} 行（可继续操作页面）")
+
+def main_grid_base(codes: List[str], specs: List[str], min_qty: int) -> pd.DataFrame:
+    """主商品表格的底表：编码/规格变化时按行位置保留已填数值并重建（换新的编辑器 key），否则保持不变以保留表格内的编辑。"""
+    base, current = st.session_state['main_df'], st.session_state['main_df_current']
+    if (base is None or base['主商品编码'].tolist() != codes or base['主商品组合颜色规格'].tolist() != specs
+            or (current is not None and len(current) and (current['数量'] < min_qty).any())):
+        set_main_grid(sync_main_products(current, codes, specs, min_qty))
+    return st.session_state['main_df']
+
+def set_main_grid(df: pd.DataFrame):
+    st.session_state['main_df'] = df
+    st.session_state['main_df_current'] = df
+    st.session_state['main_df_version'] += 1
+
+def preview_keys(keys: List[str], limit: int = 20) -> str:
+    return "、".join(keys[:limit]) + (f" 等 {len(keys)} 个" if len(keys) > limit else "")
+
+def import_main_products():
+    """上传 CSV / Excel 后设置主商品：整表导入直接替换编码和规格；按编码匹配则保留当前编码顺序，从表中按编码取规格和数值"""
+    uploaded = st.session_state.get('main_upload')
+    if uploaded is None: return
+    try:
+        df = read_main_products(uploaded, uploaded.name)
+    except Exception as e:
+        st.error(f"导入主商品失败：{e}")
+        return
+    keep = (df['主商品编码'] != "") & (df['主商品组合颜色规格'] != "")
+    if (~keep).any():
+        st.warning(f"已跳过 {int((~keep).sum())} 行缺少编码或规格的记录")
+    df = df[keep]
+    if st.session_state.get('main_import_mode') == "按编码匹配":
+        codes = _lines(st.session_state.get('txt_main_codes', ""))
+        if not codes:
+            st.error("按编码匹配需要先在『主商品编码』中填写编码")
+            return
+        joined = join_main_products(codes, df)
+        if joined.duplicates:
+            st.warning(f"表中编码重复（按第一行取值）：{preview_keys(joined.duplicates)}")
+        if joined.missing:
+            st.warning(f"以下编码在表中找不到，已从主商品中移除：{preview_keys(joined.missing)}")
+        if joined.extra:
+            st.info(f"表中另有 {len(joined.extra)} 个编码未在编码列表中：{preview_keys(joined.extra)}")
+        df = joined.frame
+    else:
+        dup = df['主商品编码'].duplicated()
+        if dup.any():
+            st.warning(f"表中编码重复：{preview_keys(pd.unique(df['主商品编码'][dup]).tolist())}")
+    df = typed_main_products(df)
+    st.session_state.txt_main_codes = "\n".join(df['主商品编码'])
+    st.session_state.txt_main_specs = "\n".join(df['主商品组合颜色规格'])
+    set_main_grid(df)
+    st.success(f"已导入 {len(df)} 个主商品")
+
+
+def current_sku_master():
+    """本会话导入的 SKU 主数据，没有则用 COMBO_SKU_MASTER 指定的公共主数据"""
+    master = spilled('sku_master')
+    if master is not None:
+        return master
     try:
-        f = float(str(val));  i = int(f)
-        return i if abs(f - i) < 1e-9 else f
-    except:
-        return default
+        return default_sku_master()
+    except Exception as e:
+        st.warning(f"读取公共 SKU 主数据失败：{e}")
+        return None
 
-@st.cache_resource
-def load_templates() -> List[Dict[str, Any]]:
+def import_sku_master():
+    uploaded = st.session_state.get('sku_upload')
+    if uploaded is None:
+        spill('sku_master', None)
+        return
     try:
-        with open(TEMPLATE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        templates = data["templates"] if isinstance(data, dict) and "templates" in data else (data if isinstance(data, list) else [])
-        normalized = []
-        for t in templates:
-            if "combos" in t:
-                normalized.append(t)
-            else:
-                normalized.append({"name": t.get("name",""), "combos": [{"prefix": t.get("prefix",""), "items": t.get("items", [])}]})
-        return normalized[:TEMPLATE_LIMIT]
-    except FileNotFoundError:
-        return []
+        spill('sku_master', SkuMaster.load(uploaded, uploaded.name))
     except Exception as e:
-        st.warning(f"读取模板失败：{e}")
-        return []
+        st.error(f"导入 SKU 主数据失败：{e}")
 
-def save_templates(templates: List[Dict[str, Any]]):
-    data = {"templates": templates[:TEMPLATE_LIMIT]}
-    with open(TEMPLATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def parse_items_block_codes_default1(text: str) -> List[Dict[str, Any]]:
-    items = []
-    for line in _lines(text):
-        parts = [p.strip() for p in line.split(",")]
-        if not parts:
-            continue
-        code = parts[0]
-        qty  = _num(parts[1] if len(parts)>1 else "", 1)
-        p1   = _num(parts[2] if len(parts)>2 else "", 1.0)
-        p2   = _num(parts[3] if len(parts)>3 else "", 1.0)
-        cost = _num(parts[4] if len(parts)>4 else "", 1.0)
-        items.append({"商品编码": code, "数量": qty, "应占售价": p1, "基本售价": p2, "组合成本价": cost})
-    return items
 
 def render_sub_items_editor(session_key_prefix: str, initial_items: List[Dict[str, Any]] = None):
     """Renders a sub-items editor block with detailed inputs and paste functionality."""
@@ -668,9 +330,14 @@ def render_sub_items_editor(session_key_prefix: str, initial_items: List[Dict[st
     st.markdown("###### ⚡️ 副商品明细（可微调）")
     
     items_data = st.session_state[items_key]
+    sku_master = current_sku_master()
     for i, item in enumerate(items_data):
         cols = st.columns([2, 1, 1, 1, 1, 1])
         items_data[i]['商品编码'] = cols[0].text_input("商品编码", value=item.get("商品编码", ""), key=f"{session_key_prefix}_{i}_code")
+        code = items_data[i]['商品编码'].strip()
+        if sku_master is not None and code and code not in sku_master:
+            near = sku_master.suggest(code)
+            cols[0].caption("⚠️ 不在 SKU 主数据中" + (f"，相近：{'、'.join(near)}" if near else ""))
         items_data[i]['数量'] = cols[1].number_input("数量", min_value=1, step=1, value=item.get("数量", 1), key=f"{session_key_prefix}_{i}_qty")
         items_data[i]['应占售价'] = cols[2].number_input("应占售价", min_value=0.0, step=0.1, value=float(item.get("应占售价", 1.0)), format="%.4f", key=f"{session_key_prefix}_{i}_p1")
         items_data[i]['基本售价'] = cols[3].number_input("基本售价", min_value=0.0, step=0.1, value=float(item.get("基本售价", 1.0)), format="%.4f", key=f"{session_key_prefix}_{i}_p2")
@@ -711,126 +378,20 @@ def render_sub_items_editor(session_key_prefix: str, initial_items: List[Dict[st
 
     return st.session_state[items_key]
 
-def _apply_rules_on_body(body: str, rules: List[Tuple[str, str]], use_regex: bool, case_sensitive: bool) -> str:
-    flags = 0 if case_sensitive else re.IGNORECASE
-    for old, new in rules:
-        if old == "":
-            continue
-        if use_regex:
-            try:
-                body = re.sub(old, new, body, flags=flags)
-            except re.error:
-                body = body.replace(old, new) if case_sensitive else re.compile(re.escape(old), re.IGNORECASE).sub(new, body)
-        else:
-            body = body.replace(old, new) if case_sensitive else re.compile(re.escape(old), re.IGNORECASE).sub(new, body)
-    return body
-
-def apply_code_simplify(original: str, prefix: str, rules: List[Tuple[str, str]], use_regex: bool, case_sensitive: bool) -> str:
-    head, body = (prefix, original[len(prefix):]) if original.startswith(prefix) else ("", original)
-    body = _apply_rules_on_body(body, rules, use_regex, case_sensitive)
-    return f"{head}{body}"
-
-def apply_name_simplify(name: str, prefix: str, rules: List[Tuple[str, str]], use_regex: bool, case_sensitive: bool) -> str:
-    head, tail = (prefix, name[len(prefix):]) if name.startswith(prefix) else ("", name)
-    tail = _apply_rules_on_body(tail, rules, use_regex, case_sensitive)
-    return f"{head}{tail}"
-
-def build_rows(main_products_df, combos, simplify_rules=None, use_regex=False, case_sensitive=True, apply_to_name=False):
-    rows = []
-    simplify_rules = simplify_rules or []
-    for prefix, items in combos:
-        for _, main_prod_row in main_products_df.iterrows():
-            code, spec = str(main_prod_row.get("主商品编码", "")), str(main_prod_row.get("主商品组合颜色规格", ""))
-            qty, price1, price2, cost = _num(main_prod_row.get("数量"), 1), _num(main_prod_row.get("应占售价"), 1.0), _num(main_prod_row.get("基本售价"), 1.0), _num(main_prod_row.get("成本价"), 1.0)
-            if not code or not spec: continue
-
-            combo_code_raw = f"{prefix}{code}"
-            combo_code_final = apply_code_simplify(combo_code_raw, prefix, simplify_rules, use_regex, case_sensitive)
-            combo_name_raw = f"{prefix}{spec}"
-            combo_name_final = apply_name_simplify(combo_name_raw, prefix, simplify_rules, use_regex, case_sensitive) if apply_to_name else combo_name_raw
-
-            # Calculate totals from sub-items
-            total_sub_price1 = sum(_num(it.get('应占售价', 1.0), 1.0) * _num(it.get('数量', 1), 1) for it in items)
-            total_sub_price2 = sum(_num(it.get('基本售价', 1.0), 1.0) * _num(it.get('数量', 1), 1) for it in items)
-            total_sub_cost = sum(_num(it.get('组合成本价', 1.0), 1.0) * _num(it.get('数量', 1), 1) for it in items)
-
-            # Main combo row with calculated totals
-            main_row = {col: "" for col in TEMPLATE_COLUMNS}
-            main_row.update({
-                '组合商品编码': combo_code_final,
-                '组合商品名称': combo_name_final,
-                '组合颜色规格': spec,
-                '商品编码': code,
-                '数量': qty,
-                '应占售价': price1 + total_sub_price1,
-                '基本售价': price2 + total_sub_price2,
-                '组合成本价': cost + total_sub_cost
-            })
-            rows.append(main_row)
-
-            for it in items:
-                sub_row = {col: "" for col in TEMPLATE_COLUMNS}
-                sub_row.update({'商品编码': it['商品编码'], '数量': _num(it.get('数量', 1), 1), '应占售价': _num(it.get('应占售价', 1.0), 1.0), '基本售价': _num(it.get('基本售价', 1.0), 1.0), '组合成本价': _num(it.get('组合成本价', 1.0), 1.0)})
-                rows.append(sub_row)
-    return rows
-
-
-def build_rows_pairwise(main_products_df, per_main_pairs, simplify_rules=None, use_regex=False, case_sensitive=True, apply_to_name=False):
-    rows = []
-    simplify_rules = simplify_rules or []
-    # per_main_pairs: list of tuples (prefix, items) aligned with main_products_df rows
-    for idx, (_, main_prod_row) in enumerate(main_products_df.iterrows()):
-        prefix, items = ("", [])
-        if idx < len(per_main_pairs):
-            prefix, items = per_main_pairs[idx]
-        code, spec = str(main_prod_row.get("主商品编码", "")), str(main_prod_row.get("主商品组合颜色规格", ""))
-        qty, price1, price2, cost = _num(main_prod_row.get("数量"), 1), _num(main_prod_row.get("应占售价"), 1.0), _num(main_prod_row.get("基本售价"), 1.0), _num(main_prod_row.get("成本价"), 1.0)
-        if not code or not spec: 
-            continue
-        combo_code_raw = f"{prefix}{code}"
-        combo_code_final = apply_code_simplify(combo_code_raw, prefix, simplify_rules, use_regex, case_sensitive)
-        combo_name_raw = f"{prefix}{spec}"
-        combo_name_final = apply_name_simplify(combo_name_raw, prefix, simplify_rules, use_regex, case_sensitive) if apply_to_name else combo_name_raw
-
-        total_sub_price1 = sum(_num(it.get('应占售价', 1.0), 1.0) * _num(it.get('数量', 1), 1) for it in items)
-        total_sub_price2 = sum(_num(it.get('基本售价', 1.0), 1.0) * _num(it.get('数量', 1), 1) for it in items)
-        total_sub_cost = sum(_num(it.get('组合成本价', 1.0), 1.0) * _num(it.get('数量', 1), 1) for it in items)
-
-        main_row = {col: "" for col in TEMPLATE_COLUMNS}
-        main_row.update({
-            '组合商品编码': combo_code_final,
-            '组合商品名称': combo_name_final,
-            '组合颜色规格': spec,
-            '商品编码': code,
-            '数量': qty,
-            '应占售价': price1 + total_sub_price1,
-            '基本售价': price2 + total_sub_price2,
-            '组合成本价': cost + total_sub_cost
-        })
-        rows.append(main_row)
-        for it in items:
-            sub_row = {col: "" for col in TEMPLATE_COLUMNS}
-            sub_row.update({'商品编码': it['商品编码'], '数量': _num(it.get('数量', 1), 1), '应占售价': _num(it.get('应占售价', 1.0), 1.0), '基本售价': _num(it.get('基本售价', 1.0), 1.0), '组合成本价': _num(it.get('组合成本价', 1.0), 1.0)})
-            rows.append(sub_row)
-    return rows
-
-def suggest_tokens_from_codes(codes: List[str], min_ratio: float = 0.6) -> Dict[str, Any]:
-    sug = {"lcp": "", "tokens": []}
-    if not codes: return sug
-    lcp = codes[0]
-    for s in codes[1:]:
-        i = 0
-        while i < len(lcp) and i < len(s) and lcp[i] == s[i]: i += 1
-        lcp = lcp[:i]
-        if not lcp: break
-    sug["lcp"] = lcp if len(lcp) >= 2 else ""
-    token_lists = [set(t for t in re.split(r"[^A-Za-z0-9]+", s) if t) for s in codes]
-    freq = Counter(t for ts in token_lists for t in ts)
-    picked = sorted([(t, c) for t, c in freq.items() if c / len(codes) >= min_ratio and len(t) >= 2], key=lambda x: (-x[1], -len(x[0]), x[0]))
-    sug["tokens"] = picked[:10]
-    return sug
-
-for k, v in {'temp_edits': {}, 'generated_df': None, 'txt_main_codes': "", 'txt_main_specs': "", 'rules_df': pd.DataFrame(columns=["顺序","要替换/删除","替换为（留空=删除）"]), 'show_new_tpl_modal': False, 'tpl_manage_view': 'list', 'tpl_edit_index': None, 'gen_mode': 'template', 'theme_mode': '浅色', 'page': '🚀 生成组合装', 'tpl_search': '', '__show_save_tpl_modal': False, '__pending_tpl_payload': None, '__last_saved_tpl_name': None, '__dup_modal_idx': None, '__del_modal_idx': None, '__dup_edit_flag': False, 'selected_templates_for_batch': [], 'tpl_page': 0, 'analysis_mode': '单个文件图表', 'last_fig': None, 'allow_no_subitems': False}.items():
+def collect_option_groups(key_prefix: str, groups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """选项组编辑器的当前内容（尚未渲染过的输入取模板中的原值）"""
+    return [{"name": st.session_state.get(f"{key_prefix}_{gi}_name", g.get("name", "")),
+             "choices": [{"prefix": st.session_state.get(f"{key_prefix}_{gi}_{ki}_prefix", c.get("prefix", "")),
+                          "items": st.session_state.get(f"{key_prefix}_{gi}_{ki}_items", c.get("items", []))}
+                         for ki, c in enumerate(g.get("choices", []))]}
+            for gi, g in enumerate(groups)]
+
+def reset_option_editor(key_prefix: str):
+    """删除选项组/选项后下标会变化，清掉编辑器状态让输入框按新顺序重新取值"""
+    for k in [k for k in st.session_state if f"{key_prefix}_" in str(k)]:
+        del st.session_state[k]
+
+for k, v in {'temp_edits': {}, 'txt_main_codes': "", 'txt_main_specs': "", 'rules_df': pd.DataFrame(columns=["顺序","要替换/删除","替换为（留空=删除）"]), 'show_new_tpl_modal': False, 'tpl_manage_view': 'list', 'tpl_edit_index': None, 'gen_mode': 'template', 'theme_mode': '浅色', 'page': '🚀 生成组合装', 'tpl_search': '', '__show_save_tpl_modal': False, '__pending_tpl_payload': None, '__last_saved_tpl_name': None, '__dup_modal_idx': None, '__del_modal_idx': None, '__dup_edit_flag': False, 'selected_templates_for_batch': [], 'tpl_page': 0, 'analysis_mode': '单个文件图表', 'last_fig': None, 'allow_no_subitems': False, 'main_df': None, 'main_df_current': None, 'main_df_version': 0}.items():
     if k not in st.session_state: st.session_state[k] = v
 
 with st.sidebar:
@@ -886,15 +447,48 @@ if page == "🚀 生成组合装":
         st.info("空模板模式将默认副商品为空，您可在下方为每个主商品添加或编辑副商品。若某主商品无副商品，则其数量必须≥2。")
     else:
         st.caption("使用模板模式：请选择需要的模板并可进行临时微调。")
+    with st.expander("📒 SKU 主数据（校验编码 · 自动填价）", expanded=False):
+        st.file_uploader("导入 SKU 主数据（CSV / Excel / Parquet，列：商品编码，可选 商品名称、基本售价、成本价）", type=["csv", "xlsx", "xls", "parquet"], key="sku_upload", on_change=import_sku_master)
+        sku_master = current_sku_master()
+        if sku_master is None:
+            st.caption("未加载主数据：生成前不校验编码。")
+        else:
+            dup_note = f"，忽略重复编码 {sku_master.duplicates} 行" if sku_master.duplicates else ""
+            st.caption(f"已加载 {len(sku_master)} 个 SKU{dup_note}。")
+            st.checkbox("生成前校验主商品和副商品编码", value=True, key="sku_validate")
+            st.checkbox("生成时按主数据填充 基本售价 / 成本价（主商品和副商品）", value=False, key="sku_autofill")
+    with st.expander("💰 目标售价分摊（按基本售价比例）", expanded=False):
+        st.caption("设置组合的目标售价后：主商品行的 应占售价 = 目标售价；副商品按 基本售价×数量 占整组（含主商品）的比例分摊，"
+                   "四舍五入到分，尾差计入主商品。留空的组合不分摊。")
+        alloc_mode = st.radio("分摊方式", ["不分摊", "按模板", "按主商品"], horizontal=True, key="alloc_mode")
+        if alloc_mode == "按模板":
+            alloc_names = st.session_state.get('gen_tpl_select', []) if mode == "template" else []
+            if not alloc_names:
+                st.info("按模板分摊用于模板模式：请先在下方选择模板。")
+            else:
+                saved = st.session_state.get('alloc_template_prices', {})
+                edited = st.data_editor(pd.DataFrame({"模板": alloc_names, "目标售价": [saved.get(n) for n in alloc_names]}, dtype=object),
+                                        key="alloc_template_editor", hide_index=True, disabled=["模板"], use_container_width=True,
+                                        column_config={"目标售价": st.column_config.NumberColumn("目标售价", min_value=0.0, step=0.01, format="%.2f")})
+                st.session_state['alloc_template_prices'] = {**saved, **dict(zip(edited["模板"], pd.to_numeric(edited["目标售价"], errors="coerce")))}
+        elif alloc_mode == "按主商品":
+            saved = st.session_state.get('alloc_main_prices', {})
+            edited = st.data_editor(pd.DataFrame({"主商品编码": codes, "目标售价": [saved.get(c) for c in codes]}, dtype=object),
+                                    key="alloc_main_editor", hide_index=True, disabled=["主商品编码"], use_container_width=True,
+                                    column_config={"目标售价": st.column_config.NumberColumn("目标售价", min_value=0.0, step=0.01, format="%.2f")})
+            st.session_state['alloc_main_prices'] = {**saved, **dict(zip(edited["主商品编码"], pd.to_numeric(edited["目标售价"], errors="coerce")))}
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.markdown("###### 🔢 主商品明细")
+    st.radio("导入方式", ["整表导入", "按编码匹配"], horizontal=True, key="main_import_mode",
+             help="整表导入：用表中的编码和规格替换当前主商品。按编码匹配：保留上方编码的顺序，按编码从表中取规格和数值，并报告找不到或重复的编码。")
+    st.file_uploader("📤 从 CSV / Excel 导入主商品（列：主商品编码、主商品组合颜色规格，可选 数量、应占售价、基本售价、成本价）", type=["csv", "xlsx", "xls"], key="main_upload", on_change=import_main_products)
 
+    min_qty = 2 if (st.session_state.get("allow_no_subitems", False) and st.session_state.get("gen_mode", "template") == "adhoc") else 1
     with st.container():
         st.markdown("###### ⚡️ 批量修改（统一设置下方所有主商品）")
         batch_cols = st.columns([1, 1, 1, 1, 2])
-        min_qty = 2 if (st.session_state.get("allow_no_subitems", False) and st.session_state.get("gen_mode", "template") == "adhoc") else 1
-        if (st.session_state.get("allow_no_subitems", False) and st.session_state.get("gen_mode", "template") == "adhoc") and st.session_state.get("batch_qty_input", 1) < 2:
+        if min_qty == 2 and st.session_state.get("batch_qty_input", 1) < 2:
             st.session_state["batch_qty_input"] = 2
         with batch_cols[0]: batch_qty = st.number_input("统一数量", min_value=min_qty, step=1, value=min_qty, key="batch_qty_input")
         with batch_cols[1]: batch_price1 = st.number_input("统一应占售价", min_value=0.0, step=0.1, value=1.0, format="%.4f", key="batch_price1_input")
@@ -903,29 +497,31 @@ if page == "🚀 生成组合装":
         with batch_cols[4]:
             st.write(""); st.write("")
             if st.button("➡️ 应用批量修改", key="btn_apply_batch", use_container_width=True):
-                for i in range(len(_lines(st.session_state["txt_main_codes"]))):
-                    st.session_state[f"main_qty_{i}"] = batch_qty
-                    st.session_state[f"main_price1_{i}"] = batch_price1
-                    st.session_state[f"main_price2_{i}"] = batch_price2
-                    st.session_state[f"main_cost_{i}"] = batch_cost
+                current = st.session_state['main_df_current']
+                if current is not None:
+                    set_main_grid(apply_batch(current, {"数量": batch_qty, "应占售价": batch_price1, "基本售价": batch_price2, "成本价": batch_cost}))
                 st.success("已应用批量修改。"); st.rerun()
 
     if codes and specs and len(codes) == len(specs):
-        for i, (code, spec) in enumerate(zip(codes, specs)):
-            default_qty = 2 if (st.session_state.get("allow_no_subitems", False) and st.session_state.get("gen_mode", "template") == "adhoc") else 1
-            st.session_state.setdefault(f"main_qty_{i}", default_qty)
-            if (st.session_state.get("allow_no_subitems", False) and st.session_state.get("gen_mode", "template") == "adhoc") and st.session_state.get(f"main_qty_{i}", 1) < 2:
-                st.session_state[f"main_qty_{i}"] = 2
-            st.session_state.setdefault(f"main_price1_{i}", 1.0)
-            st.session_state.setdefault(f"main_price2_{i}", 1.0)
-            st.session_state.setdefault(f"main_cost_{i}", 1.0)
-            cols = st.columns([2, 2, 1, 1, 1, 1])
-            with cols[0]: st.text_input("编码", value=code, key=f"main_code_{i}", disabled=True)
-            with cols[1]: st.text_input("规格", value=spec, key=f"main_spec_{i}", disabled=True)
-            with cols[2]: st.number_input("数量", min_value=default_qty, step=1, key=f"main_qty_{i}")
-            with cols[3]: st.number_input("应占售价", min_value=0.0, step=0.1, format="%.4f", key=f"main_price1_{i}")
-            with cols[4]: st.number_input("基本售价", min_value=0.0, step=0.1, format="%.4f", key=f"main_price2_{i}")
-            with cols[5]: st.number_input("成本价", min_value=0.0, step=0.1, format="%.4f", key=f"main_cost_{i}")
+        base = main_grid_base(codes, specs, min_qty)
+        st.caption("可直接从 Excel 复制多行多列数值，选中单元格后粘贴（Ctrl+V）。")
+        edited = st.data_editor(
+            base,
+            key=f"main_editor_{st.session_state['main_df_version']}",
+            num_rows="fixed",
+            hide_index=True,
+            use_container_width=True,
+            disabled=["主商品编码", "主商品组合颜色规格"],
+            column_config={
+                "主商品编码": st.column_config.TextColumn("编码"),
+                "主商品组合颜色规格": st.column_config.TextColumn("规格"),
+                "数量": st.column_config.NumberColumn("数量", min_value=min_qty, step=1),
+                "应占售价": st.column_config.NumberColumn("应占售价", min_value=0.0, step=0.1, format="%.4f"),
+                "基本售价": st.column_config.NumberColumn("基本售价", min_value=0.0, step=0.1, format="%.4f"),
+                "成本价": st.column_config.NumberColumn("成本价", min_value=0.0, step=0.1, format="%.4f"),
+            },
+        )
+        st.session_state['main_df_current'] = typed_main_products(clamp_quantity(edited[MAIN_COLUMNS], min_qty), min_qty)
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.markdown("<div class='card-ghost'><div class='section-title'>🧰 方式选择</div></div>", unsafe_allow_html=True)
@@ -969,6 +565,45 @@ if page == "🚀 生成组合装":
             st.session_state['simplify_rules'].append({'find': '', 'replace': ''})
             st.rerun()
 
+        # 规则建议：公共前缀与高频片段，一键添加为删除规则
+        if codes:
+            existing = {r.get('find', '') for r in st.session_state['simplify_rules']}
+            suggestions = [f for f in rule_suggestions(tuple(codes)) if f not in existing]
+            if suggestions:
+                st.markdown("**💡 规则建议**（编码中的公共前缀与高频片段）")
+                cols = st.columns(min(len(suggestions), 4) + 1)
+                for i, find in enumerate(suggestions):
+                    if cols[i % 4].button(f"➕ 删除「{find}」", key=f"suggest_rule_{i}"):
+                        st.session_state['simplify_rules'].append({'find': find, 'replace': ''})
+                        st.rerun()
+                if len(suggestions) > 1 and cols[-1].button("全部添加", key="suggest_rule_all"):
+                    st.session_state['simplify_rules'].extend({'find': f, 'replace': ''} for f in suggestions)
+                    st.rerun()
+
+        # 实时预览：每条规则的中间结果缓存在会话里，改第 k 条只重算第 k 条及之后的规则
+        preview_rules = [(r.get('find', ''), r.get('replace', '')) for r in st.session_state['simplify_rules']]
+        if codes and any(f for f, _ in preview_rules):
+            st.markdown("**👀 实时预览**" + ("" if enable_simplify else "（未启用编码简化，生成时不会应用）"))
+            if use_regex:
+                bad = [str(i + 1) for i, (f, _) in enumerate(preview_rules) if f and invalid_regex(f)]
+                if bad:
+                    st.warning(f"规则 {', '.join(bad)} 不是有效的正则表达式，将按普通文本替换")
+            staged = st.session_state.setdefault('__rule_preview_codes', StagedRules())
+            after = staged.apply(codes, preview_rules, use_regex, case_sensitive)
+            preview = pd.DataFrame({"主商品编码": codes, "简化后编码": after})
+            if apply_to_name and specs:
+                staged_specs = st.session_state.setdefault('__rule_preview_specs', StagedRules())
+                n = min(len(codes), len(specs))
+                preview = preview.iloc[:n].assign(组合颜色规格=specs[:n], 简化后规格=staged_specs.apply(specs[:n], preview_rules, use_regex, case_sensitive))
+            changed = preview["主商品编码"] != preview["简化后编码"]
+            hits = " · ".join(f"规则 {i + 1}：{n}" for i, n in enumerate(staged.changed_per_rule()) if preview_rules[i][0])
+            st.caption(f"{int(changed.sum())} / {len(preview)} 个编码有变化（各规则改动的编码数：{hits}）")
+            clash = preview.groupby("简化后编码")["主商品编码"].transform("nunique") > 1
+            if clash.any():
+                st.warning(f"{int(clash.sum())} 个不同的编码简化后重名：{preview_keys(pd.unique(preview['简化后编码'][clash]).tolist())}")
+            only_changed = st.checkbox("只看有变化的编码", value=True, key="rule_preview_changed")
+            st.dataframe(preview[changed] if only_changed else preview, use_container_width=True, hide_index=True, height=280)
+
     st.markdown('</div>', unsafe_allow_html=True)
 
     adhoc_combos = []
@@ -1019,6 +654,8 @@ if page == "🚀 生成组合装":
                                     session_key_prefix=f"tmp_edit_{tname}_{ci}",
                                     initial_items=combo.get("items", [])
                                 )
+                        if option_combo_count(tpl):
+                            st.caption(f"另有 {option_combo_count(tpl)} 个选项组合，按模板中的选项生成（请到『模板管理』修改）。")
 
     if mode == "per_main":
         st.markdown("<div class='card-ghost'><div class='section-title'>🧩 空模板 · 每个主商品自定义</div></div>", unsafe_allow_html=True)
@@ -1042,9 +679,10 @@ if page == "🚀 生成组合装":
             st.info("请先在上方输入并对齐主商品编码与规格，然后在此处为每个主商品设置对应的副商品。")
         st.markdown('</div>', unsafe_allow_html=True)
 
+    job = latest_job(session_spill_id())
     st.markdown('<div class="card toolbar-sticky">', unsafe_allow_html=True)
     g1, g2, g3, g4 = st.columns([1, 1, 1, 1])
-    go = g1.button("🚀 生成 Excel", use_container_width=True)
+    go = g1.button("🚀 生成 Excel", use_container_width=True, disabled=job is not None and job.active)
     show_preview = g2.checkbox("生成后显示预览", value=True, key="show_preview_cb")
     
     with g3:
@@ -1104,63 +742,248 @@ if page == "🚀 生成组合装":
         # 规则：
         # - 无模板 + 允许不添加副商品：所有主商品数量必须≥2
         # - 空模板（按主商品自定义）：对于副商品为空的主商品，数量必须≥2
+        main_grid = st.session_state['main_df_current']
+        qtys = main_grid['数量'].tolist() if main_grid is not None and len(main_grid) == len(codes) else [1] * len(codes)
         if mode == "adhoc" and st.session_state.get('allow_no_subitems', False):
-            qtys = [st.session_state.get(f"main_qty_{i}", 1) for i in range(len(codes))]
             if any(q < 2 for q in qtys):
                 errs.append("已启用『不添加副商品』，主商品数量必须≥2")
         if mode == "per_main":
-            for i, c in enumerate(codes):
+            for i, (c, qty) in enumerate(zip(codes, qtys)):
                 items = st.session_state.get(f"permain_{i}_items", [])
-                qty = st.session_state.get(f"main_qty_{i}", 1)
                 if not items and qty < 2:
                     errs.append(f"主商品 {c} 未设置副商品，数量需≥2")
 
-        if errs:
-            for e in errs: st.error("❌ " + e)
-        else:
+        # COMBO_PROFILE=1 时记录各阶段耗时与内存，结果显示在成功提示下方并追加到 JSONL 日志
+        profiler = StageProfiler(enabled=PROFILE_ENABLED)
+        with profiler.activate(), profiler.stage("parse"):
+            sku_master = current_sku_master()
+            sku_fill = sku_master is not None and st.session_state.get('sku_autofill', False)
+            fill_items = sku_master.fill_items if sku_fill else (lambda items: items)
             rules = [(r.get('find', ''), r.get('replace', '')) for r in st.session_state.get('simplify_rules', []) if r.get('find')] if 'enable_simplify' in locals() and enable_simplify else []
-            
+        
             combos = []
+            combo_parts = []  # 模板模式：按顺序的 [已编译组合列表 | 含选项组的模板]
             if mode == "adhoc":
                 for i in range(int(st.session_state.get("adhoc_count", 1))):
                     prefix = st.session_state.get(f"adhoc_prefix_{i}", "")
                     items = [] if st.session_state.get('allow_no_subitems', False) else st.session_state.get(f"adhoc_{i}_items", [])
-                    combos.append((prefix, items))
+                    combos.append((prefix, fill_items(items)))
             elif mode == "template":
                 for tname in selected_templates:
                     tpl = next((t for t in templates if t['name'] == tname), None)
                     if not tpl: continue
+                    explicit = []
                     for ci, combo in enumerate(tpl.get('combos', [])):
                         prefix = st.session_state.get(f"tmp_edit_{tname}_{ci}_prefix", combo.get('prefix', ''))
                         items = st.session_state.get(f"tmp_edit_{tname}_{ci}_items", combo.get("items", []))
-                        combos.append((prefix, items))
+                        explicit.append(compile_combo(prefix, fill_items(items)))
+                    combos.extend(explicit)
+                    combo_parts.append(explicit)
+                    if option_combo_count(tpl):
+                        # 选项组的笛卡尔积不展开成列表，生成时由生成器逐批产出
+                        combo_parts.append(copy.deepcopy(tpl))
             else:
                 # per_main
                 per_main_pairs = []
                 for i in range(len(codes)):
                     prefix = st.session_state.get(f"permain_{i}_prefix", "")
                     items = st.session_state.get(f"permain_{i}_items", [])
-                    per_main_pairs.append((prefix, items))
-
-            main_products_data = [{"主商品编码": c, "主商品组合颜色规格": s, "数量": st.session_state.get(f"main_qty_{i}", 1), "应占售价": st.session_state.get(f"main_price1_{i}", 1.0), "基本售价": st.session_state.get(f"main_price2_{i}", 1.0), "成本价": st.session_state.get(f"main_cost_{i}", 1.0)} for i, (c, s) in enumerate(zip(codes, specs))]
-            main_products_df = pd.DataFrame(main_products_data)
+                    per_main_pairs.append((prefix, fill_items(items)))
+
+            main_products_df = main_grid.copy() if main_grid is not None else None
+            if sku_master is not None and main_products_df is not None:
+                if sku_fill:
+                    main_products_df = sku_master.fill_frame(main_products_df, '主商品编码', MAIN_PRICE_FIELDS)
+                if st.session_state.get('sku_validate', True):
+                    # 主商品和全部副商品编码一次性对主数据做哈希查找
+                    choices = [("", ch.get("items", [])) for t in combo_parts if isinstance(t, dict) for g in option_groups(t) for ch in g["choices"]]
+                    unknown = sku_master.unknown(codes + sub_item_codes(per_main_pairs if mode == "per_main" else combos + choices))
+                    if unknown:
+                        errs.append(f"以下编码不在 SKU 主数据中：{preview_keys(unknown)}（可在『SKU 主数据』中关闭校验）")
+            # 选项组合按生成器逐批展开；展开前按组合数 × 主商品数估算总行数，过大时不在页面内生成
+            stream_rows_per_main = sum(sum(1 + len(c.items) for c in p) if isinstance(p, list) else sum(template_size({"options": p["options"]})) for p in combo_parts)
+            if any(isinstance(p, dict) for p in combo_parts) and main_products_df is not None:
+                stream_rows = stream_rows_per_main * len(main_products_df)
+                if stream_rows > OPTION_UI_ROW_LIMIT:
+                    template_args = " ".join(f'-t "{n}"' for n in selected_templates)
+                    errs.append(f"所选模板的选项组合将生成约 {stream_rows} 行，超过页面内生成上限 {OPTION_UI_ROW_LIMIT} 行。"
+                                f"请用命令行边生成边写出：python -m combo_core -i 主商品表.xlsx {template_args} -o 组合装导入模板.zip -f xlsx-zip")
+            # 进度标签：从 label_starts[k] 起的组合显示 label_names[k]（一段选项组合共用一个标签）
+            if mode == "template":
+                label_starts, label_names, pos = [], [], 0
+                for tname in selected_templates:
+                    tpl = next((t for t in templates if t['name'] == tname), {})
+                    for ci in range(len(tpl.get('combos', []))):
+                        label_starts.append(pos); label_names.append(f"{tname} · 组合 {ci+1}")
+                        pos += 1
+                    if option_combo_count(tpl):
+                        label_starts.append(pos); label_names.append(f"{tname} · 选项组合")
+                        pos += option_combo_count(tpl)
+            elif mode == "adhoc":
+                label_starts, label_names = list(range(len(combos))), [f"组合 {i+1}" for i in range(len(combos))]
+            else:
+                label_starts, label_names = list(range(len(codes))), [f"主商品 {c}" for c in codes]
+
+            # 目标售价分摊：按模板时每个组合一个目标价（按生成顺序），按主商品时按主商品编码查找
+            allocation = None
+            alloc_mode = st.session_state.get('alloc_mode', "不分摊")
+            if alloc_mode == "按模板" and mode == "template":
+                tpl_prices = st.session_state.get('alloc_template_prices', {})
+                if any(pd.notna(tpl_prices.get(n)) for n in selected_templates):
+                    allocation = {"combo_prices": [float(tpl_prices[n]) if pd.notna(tpl_prices.get(n)) else float("nan")
+                                                   for n in selected_templates
+                                                   for _ in range(template_size(next((t for t in templates if t['name'] == n), {}))[0])]}
+            elif alloc_mode == "按主商品":
+                main_prices = {c: float(p) for c, p in st.session_state.get('alloc_main_prices', {}).items() if c in codes and pd.notna(p)}
+                if main_prices:
+                    allocation = {"main_prices": main_prices}
 
-            if mode == "per_main":
-                rows = build_rows_pairwise(main_products_df, per_main_pairs, simplify_rules=rules, use_regex=use_regex, case_sensitive=case_sensitive, apply_to_name=apply_to_name)
+        if errs:
+            for e in errs: st.error("❌ " + e)
+        else:
+            owner = session_spill_id()
+            gen_options = dict(simplify_rules=rules, use_regex=use_regex, case_sensitive=case_sensitive, apply_to_name=apply_to_name, workers=GENERATE_WORKERS, compact=True)
+            export_fmt = st.session_state.get('export_format', 'xlsx')
+            part_rows = int(st.session_state.get('export_part_rows', EXCEL_PART_ROWS))
+            # 副商品列表来自 session_state，可能在任务运行期间被编辑，先复制一份（编译好的模板组合不可变）
+            gen_mode = mode
+            gen_combos = [c if isinstance(c, CompiledCombo) else (c[0], copy.deepcopy(c[1])) for c in (per_main_pairs if mode == "per_main" else combos)]
+            # 含选项组的模板：组合按顺序由生成器产出，逐批展开（不经过结果备忘和增量缓存）
+            streamed = any(isinstance(part, dict) for part in combo_parts)
+            n_combos = sum(len(p) if isinstance(p, list) else option_combo_count(p) for p in combo_parts) if streamed else len(gen_combos)
+
+            def run_streamed(job, progress, t0):
+                # 选项组合逐批展开并直接写入导出文件：只保留写好的文件和第一批的预览，不拼出整个结果
+                store = get_spill_store()
+                stream = itertools.chain.from_iterable(
+                    part if isinstance(part, list) else ((c["prefix"], fill_items(c["items"])) for c in iter_option_combos(part))
+                    for part in combo_parts)
+                stream_options = {k: v for k, v in gen_options.items() if k != "workers"}
+                total_rows = stream_rows_per_main * len(main_products_df)
+                frames = iter_frames(main_products_df, stream, progress=progress, total_rows=total_rows, **stream_options)
+                if allocation is not None:
+                    valid = int(((main_products_df["主商品编码"] != "") & (main_products_df["主商品组合颜色规格"] != "")).sum())
+                    frames = allocate_frames(frames, allocation.get("combo_prices"), valid, allocation.get("main_prices"))
+                preview = []
+
+                def first_batch_kept(frames):
+                    for frame in frames:
+                        if not preview:
+                            preview.append(materialize_frame(frame.head(60)))
+                        yield frame
+
+                fmt = stream_export_format(total_rows, export_fmt)
+                buf = BytesIO()
+                with profile_stage(f"export:{fmt}"):
+                    rows = write_export_stream(first_batch_kept(frames), fmt, buf, part_rows)
+                store.put(owner, 'generated_df', None)
+                store.put(owner, 'generated_export', {"format": fmt, "part_rows": part_rows, "rows": rows, "data": buf.getvalue(), "preview": preview[0] if preview else None})
+                stages = profiler.records()
+                if profiler.enabled:
+                    append_profile_log({
+                        "session": owner, "mode": gen_mode, "mains": len(main_products_df), "combos": n_combos,
+                        "rows": rows, "workers": 1, "reused_blocks": 0, "rebuilt_blocks": 0,
+                        "seconds": round(time.time() - t0, 4), "stages": stages,
+                    })
+                return {"message": f"✅ 生成成功，共 {rows} 行（含选项组，已直接写出导出文件）", "stages": stages}
+
+            def run_generation(job):
+                # 在后台线程中运行：不能访问 st.session_state，所需输入都已在提交前取出
+                store = get_spill_store()
+                # 按模式分别缓存上次结果，重新生成时只重算改动过的 (主商品, 组合) 块
+                gen_cache = store.get(owner, f"generation_cache_{gen_mode}") or GenerationCache()
+                progress = lambda done, total, ci: job.report(done, total, label_names[bisect.bisect_right(label_starts, ci) - 1] if label_starts else "")
+                t0 = time.time()
+                with profiler.activate():
+                    if gen_mode == "per_main":
+                        df = build_frame_pairwise(main_products_df, gen_combos, cache=gen_cache, progress=progress, **gen_options)
+                    elif streamed:
+                        return run_streamed(job, progress, t0)
+                    else:
+                        df = build_frame(main_products_df, gen_combos, cache=gen_cache, progress=progress, **gen_options)
+                    if allocation is not None:
+                        with profile_stage("allocate"):
+                            df = allocate_prices(df, block_targets(df, **allocation))
+                    job.report(len(df), len(df), "写出导出文件")
+                    # 预先按当前选中的导出格式序列化，完成后下载按钮直接取缓存的字节
+                    fmt = export_format_for(len(df), export_fmt)
+                    with profile_stage(f"export:{fmt}"):
+                        export_bytes(df, fmt, part_rows)
+                # 未分摊时结果与缓存中的上次结果共用列数据，缓存只计入指纹等自身占用
+                shared = gen_cache.frame is not None and allocation is None
+                store.put(owner, f"generation_cache_{gen_mode}", gen_cache, size=estimate_size(dataclasses.replace(gen_cache, frame=None)) if shared else None)
+                store.put(owner, 'generated_df', df)
+                store.put(owner, 'generated_export', None)
+                stages = profiler.records()
+                if profiler.enabled:
+                    append_profile_log({
+                        "session": owner, "mode": gen_mode, "mains": len(main_products_df), "combos": n_combos,
+                        "rows": len(df), "workers": GENERATE_WORKERS, "reused_blocks": gen_cache.reused,
+                        "rebuilt_blocks": gen_cache.rebuilt, "seconds": round(time.time() - t0, 4), "stages": stages,
+                    })
+                reuse_note = f"（复用 {gen_cache.reused} 块，重算 {gen_cache.rebuilt} 块）" if gen_cache.reused else ""
+                return {"message": f"✅ 生成成功，共 {len(df)} 行{reuse_note}", "stages": stages}
+
+            job = submit_job(owner, "生成组合装", run_generation)
+
+    if job is not None and job.active:
+        render_generation_progress(job.id)
+    elif job is not None and st.session_state.get('__job_reported') != job.id:
+        st.session_state['__job_reported'] = job.id
+        if job.status == "done":
+            st.success(job.result["message"])
+            if job.result["stages"]:
+                st.caption("⏱ 各阶段耗时（COMBO_PROFILE）")
+                st.dataframe(pd.DataFrame(job.result["stages"]).rename(columns={"stage": "阶段", "seconds": "耗时(秒)", "peak_mb": "峰值内存(MB)", "calls": "次数"}), hide_index=True, use_container_width=True)
+        else:
+            st.error(f"❌ 生成失败：{job.error}")
+
+    df = spilled('generated_df')
+    # 含选项组的结果生成时已直接写成导出文件，页面不保留完整结果，只有文件和第一批的预览
+    streamed_export = spilled('generated_export') if df is None else None
+    if df is not None or streamed_export is not None:
+        formats = available_formats()
+        e1, e2 = st.columns([2, 1])
+        export_fmt = e1.selectbox("导出格式", options=list(formats), format_func=lambda k: formats[k].label, key="export_format")
+        part_rows = EXCEL_PART_ROWS
+        if export_fmt in ("xlsx-sheets", "xlsx-zip"):
+            part_rows = int(e2.number_input("每个分片最多行数", min_value=1000, max_value=EXCEL_SHEET_ROWS, value=EXCEL_PART_ROWS, step=10000, key="export_part_rows"))
+    if streamed_export is not None:
+        fmt = streamed_export["format"]
+        if stream_export_format(streamed_export["rows"], export_fmt) != fmt or (fmt in ("xlsx-sheets", "xlsx-zip") and part_rows != streamed_export["part_rows"]):
+            st.info(f"含选项组的结果在生成时已写出为「{formats[fmt].label}」，导出设置的改动需重新生成后生效。")
+        st.caption("含选项组的结果不支持增量导出。")
+        st.download_button("📥 下载组合装导入模板", data=streamed_export["data"], file_name=f"组合装导入模板{formats[fmt].extension}", mime=formats[fmt].mime, use_container_width=True)
+        if show_preview and streamed_export["preview"] is not None:
+            st.markdown('<div class="card">', unsafe_allow_html=True)
+            st.write("🔎 预览前 60 行：")
+            st.dataframe(streamed_export["preview"], use_container_width=True, height=420)
+            st.markdown('</div>', unsafe_allow_html=True)
+    if df is not None:
+        if export_format_for(len(df), export_fmt) != export_fmt:
+            st.warning(f"共 {len(df)} 行，超过 Excel 单表上限 {EXCEL_SHEET_ROWS} 行，已改为分文件（zip）导出。")
+            export_fmt = "xlsx-zip"
+        # 同一结果只序列化一次，翻看预览等重跑直接复用缓存的字节
+        st.download_button("📥 下载组合装导入模板", data=export_bytes(df, export_fmt, part_rows), file_name=f"组合装导入模板{formats[export_fmt].extension}", mime=formats[export_fmt].mime, use_container_width=True, on_click=mark_exported)
+        with st.expander("🔁 增量导出（只导出与上次相比新增或变化的组合）", expanded=False):
+            workspace = st.text_input("工作区 / 操作员", value=DEFAULT_WORKSPACE, key="delta_workspace", help="每个工作区分别记录上次导出的结果；下载完整或增量文件后即记为已导出。") or DEFAULT_WORKSPACE
+            baseline = load_baseline(workspace)
+            delta = diff_blocks(generated_block_hashes(df), baseline)
+            if baseline is None:
+                st.info("该工作区还没有导出记录，本次全部视为新增。")
+            st.markdown(f"新增 **{len(delta.new)}** · 变化 **{len(delta.changed)}** · 删除 **{len(delta.removed)}** · 未变 **{delta.unchanged}**")
+            if delta.removed:
+                st.caption(f"上次导出过、本次没有的组合（需在 ERP 中自行处理）：{preview_keys(delta.removed)}")
+            if delta.codes:
+                delta_df = delta_rows(df, delta.codes)
+                delta_fmt = export_format_for(len(delta_df), export_fmt)
+                st.download_button(f"📥 下载增量（{len(delta.codes)} 个组合，{len(delta_df)} 行）", data=export_bytes(delta_df, delta_fmt, part_rows), file_name=f"组合装导入模板_增量{formats[delta_fmt].extension}", mime=formats[delta_fmt].mime, use_container_width=True, on_click=mark_exported, key="download_delta")
             else:
-                rows = build_rows(main_products_df, combos, simplify_rules=rules, use_regex=use_regex, case_sensitive=case_sensitive, apply_to_name=apply_to_name)
-            df = pd.DataFrame(rows, columns=TEMPLATE_COLUMNS)
-            st.session_state['generated_df'] = df
-            st.success(f"✅ 生成成功，共 {len(df)} 行")
-
-    if st.session_state['generated_df'] is not None:
-        df = st.session_state['generated_df']
-        out = BytesIO(); df.to_excel(out, index=False); out.seek(0)
-        st.download_button("📥 下载组合装导入模板", data=out, file_name="组合装导入模板.xlsx", use_container_width=True)
+                st.success("与上次导出相比没有新增或变化的组合。")
         if show_preview:
             st.markdown('<div class="card">', unsafe_allow_html=True)
             st.write("🔎 预览前 60 行：")
-            st.dataframe(df.head(60), use_container_width=True, height=420)
+            st.dataframe(materialize_frame(df.head(60)), use_container_width=True, height=420)
             st.markdown('</div>', unsafe_allow_html=True)
 
     if st.session_state.get('__show_save_tpl_modal', False):
@@ -1196,12 +1019,18 @@ elif page == "🧱 模板管理":
     edit_index = st.session_state.get('tpl_edit_index', None)
 
     if view == 'edit' and edit_index is not None and edit_index < len(templates):
-        tpl = templates[edit_index]
+        # 在草稿副本上编辑，点保存才写回；未保存的增删不会改动模板库中的模板
+        draft = st.session_state.get('__tpl_draft')
+        if draft is None or draft[:2] != (edit_index, templates[edit_index]['name']):
+            draft = (edit_index, templates[edit_index]['name'], copy.deepcopy(templates[edit_index]))
+            st.session_state['__tpl_draft'] = draft
+        tpl = draft[2]
         st.markdown(f"### 正在编辑：{tpl['name']}")
         
         if st.button("⬅️ 返回模板列表"):
             st.session_state['tpl_manage_view'] = 'list'
             st.session_state['tpl_edit_index'] = None
+            st.session_state.pop('__tpl_draft', None)
             st.rerun()
 
         new_name = st.text_input("模板名称", value=tpl['name'], key=f"tpl_edit_name_{edit_index}")
@@ -1246,6 +1075,61 @@ elif page == "🧱 模板管理":
                 del st.session_state[confirm_combo_del_key]
                 st.rerun()
 
+        # --- Option Groups ---
+        opt_key = f"tpl_opt_{edit_index}"
+        groups = tpl.get('options', [])
+        st.markdown("#### 🎛️ 选项组")
+        st.caption(f"每个选项组任选一项组成一个组合：前缀按选项组顺序拼接，副商品合并。当前共 **{option_combo_count(tpl)}** 种组合，"
+                   "生成时逐批展开，不受每个模板组合数上限限制。")
+        if st.button("➕ 添加选项组", key=f"{opt_key}_add_group"):
+            tpl['options'] = groups + [{"name": f"选项组 {len(groups) + 1}", "choices": []}]
+            st.rerun()
+        for gi, group in enumerate(groups):
+            choices = group.get('choices', [])
+            with st.expander(f"选项组 {gi+1}：{group.get('name') or '未命名'}（{len(choices)} 个选项）", expanded=exp_all):
+                c1, c2, c3 = st.columns([3, 1, 1])
+                c1.text_input("选项组名称", value=group.get('name', ''), key=f"{opt_key}_{gi}_name")
+                with c2:
+                    st.write("") # Align button
+                    if st.button("➕ 添加选项", key=f"{opt_key}_{gi}_add"):
+                        if len(choices) >= OPTION_CHOICE_LIMIT:
+                            st.warning(f"每个选项组最多 {OPTION_CHOICE_LIMIT} 个选项")
+                        else:
+                            group['choices'] = choices + [{"prefix": "", "items": []}]
+                            st.rerun()
+                with c3:
+                    st.write("") # Align button
+                    if st.button("删除此选项组", key=f"{opt_key}_{gi}_delete"):
+                        st.session_state[f'confirm_delete_group_{edit_index}'] = gi
+                        st.rerun()
+                for ki, choice in enumerate(choices):
+                    st.markdown(f"**选项 {ki+1}**")
+                    k1, k2 = st.columns([4, 1])
+                    k1.text_input("前缀", value=choice.get('prefix', ''), key=f"{opt_key}_{gi}_{ki}_prefix")
+                    with k2:
+                        st.write("") # Align button
+                        if st.button("删除此选项", key=f"{opt_key}_{gi}_{ki}_delete"):
+                            tpl['options'] = collect_option_groups(opt_key, groups)
+                            tpl['options'][gi]['choices'].pop(ki)
+                            reset_option_editor(opt_key)
+                            st.rerun()
+                    render_sub_items_editor(session_key_prefix=f"{opt_key}_{gi}_{ki}", initial_items=choice.get("items", []))
+
+        confirm_group_del_key = f'confirm_delete_group_{edit_index}'
+        if st.session_state.get(confirm_group_del_key) is not None:
+            group_idx = st.session_state[confirm_group_del_key]
+            st.warning(f"确定要删除 **选项组 {group_idx + 1}** 及其全部选项吗？此操作不可撤销。")
+            c1, c2 = st.columns(2)
+            if c1.button("确认删除选项组", key=f"confirm_del_group_{edit_index}"):
+                tpl['options'] = collect_option_groups(opt_key, groups)
+                tpl['options'].pop(group_idx)
+                reset_option_editor(opt_key)
+                del st.session_state[confirm_group_del_key]
+                st.rerun()
+            if c2.button("取消删除选项组", key=f"cancel_del_group_{edit_index}"):
+                del st.session_state[confirm_group_del_key]
+                st.rerun()
+
         if st.button("💾 保存更改", type="primary"):
             new_name_trim = new_name.strip()
             if not new_name_trim:
@@ -1262,7 +1146,13 @@ elif page == "🧱 模板管理":
                 updated_combos = updated_combos[:COMBO_LIMIT_PER_TEMPLATE]
                 templates[edit_index]['name'] = new_name_trim
                 templates[edit_index]['combos'] = updated_combos
+                updated_groups = collect_option_groups(opt_key, groups)
+                if updated_groups:
+                    templates[edit_index]['options'] = updated_groups
+                else:
+                    templates[edit_index].pop('options', None)
                 save_templates(templates)
+                st.session_state.pop('__tpl_draft', None)
                 st.cache_resource.clear()
                 st.success(f"模板 '{new_name_trim}' 已保存！")
 
@@ -1432,7 +1322,7 @@ elif page == "🧱 模板管理":
                     args=(tpl['name'],)
                 )
             with c1:
-                st.markdown(f"<div class='tpl-name'>{tpl['name']} <span style='font-weight:normal;font-size:13px;color:var(--muted);'>({len(tpl.get('combos',[]))}组)</span></div>", unsafe_allow_html=True)
+                st.markdown(f"<div class='tpl-name'>{tpl['name']} <span style='font-weight:normal;font-size:13px;color:var(--muted);'>({template_size(tpl)[0]}组)</span></div>", unsafe_allow_html=True)
             with c2:
                 if st.button("编辑", key=f"grid_edit_{ti}", use_container_width=True):
                     st.session_state['tpl_manage_view'] = 'edit'
@@ -1551,7 +1441,44 @@ elif page == "🧱 模板管理":
                 st.error(f"导入失败：{e}")
         st.markdown('</div>', unsafe_allow_html=True)
 
+        # 从历史导出的组合装导入模板反向生成模板
+        st.markdown('<div class="card card-muted">', unsafe_allow_html=True)
+        if "ingest_uploader_key" not in st.session_state:
+            st.session_state["ingest_uploader_key"] = "ingest_uploader_1"
+        hist = st.file_uploader("🔁 从历史组合装导入模板（.xlsx / .csv）反向生成模板（内容相同的自动去重）", type=["xlsx", "xls", "csv"], key=st.session_state["ingest_uploader_key"])
+        if hist is not None:
+            cached = st.session_state.get("__ingest_result")
+            if cached is None or cached[0] != hist.file_id:
+                try:
+                    name = hist.name.rsplit(".", 1)[0]
+                    cached = (hist.file_id, templates_from_export(read_table(hist, hist.name), name))
+                except Exception as e:
+                    cached = (hist.file_id, e)
+                st.session_state["__ingest_result"] = cached
+            result = cached[1]
+            if isinstance(result, Exception):
+                st.error(f"解析失败：{result}")
+            else:
+                merged, added, skipped = merge_templates(templates, result.templates)
+                st.caption(f"{result.mains} 个主商品、{result.blocks} 个组合 → 识别出 {len(result.templates)} 个模板；"
+                           f"可新增 {len(added)} 个，{skipped} 个与已有模板重复或超出上限")
+                if result.unprefixed:
+                    st.warning(f"{result.unprefixed} 个组合推断不出前缀（组合商品编码不以商品编码结尾），前缀记为空")
+                if added:
+                    st.caption("将新增：" + preview_keys(added))
+                if st.button("➕ 添加到模板库", disabled=not added, key="ingest_add"):
+                    save_templates(merged)
+                    st.cache_resource.clear()
+                    st.session_state["ingest_uploader_key"] = f"ingest_uploader_{hash(str(time.time()))}"
+                    st.session_state.pop("__ingest_result", None)
+                    st.success(f"已新增 {len(added)} 个模板")
+                    st.rerun()
+        st.markdown('</div>', unsafe_allow_html=True)
+
 elif page == "📊 图表生成":
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from combo_core.charts import format_number_chinese, update_xaxis_ticks
 
     st.markdown("<div class='card-ghost'><div class='section-title'>📈 Excel 图表生成器（增强版）</div></div>", unsafe_allow_html=True)
 
@@ -1578,6 +1505,8 @@ elif page == "📊 图表生成":
         # Only clear the figure if the files have actually changed.
         if st.session_state.get('chart_df_keys') is not None and ordered_keys != st.session_state.get('chart_df_keys', []):
             st.session_state['last_fig'] = None
+            for key in st.session_state.get('chart_dfs', {}):
+                spill(f"chart_df:{key}", None)
             st.session_state['chart_dfs'] = {} # Also clear cached dataframes
 
         if 'chart_dfs' not in st.session_state:
@@ -1587,13 +1516,18 @@ elif page == "📊 图表生成":
             file_key = ordered_keys[i]
             if file_key not in st.session_state['chart_dfs']:
                 df = load_excel(uploaded_file)
+                # 数据本身放在会话外存储（可落盘），这里只留元信息
+                spill(f"chart_df:{file_key}", df)
                 st.session_state['chart_dfs'][file_key] = {
                     "name": uploaded_file.name,
-                    "df": df,
+                    "rows": len(df),
                     "cols": df.columns.tolist()
                 }
         
         current_keys_set = set(ordered_keys)
+        for key in st.session_state['chart_dfs']:
+            if key not in current_keys_set:
+                spill(f"chart_df:{key}", None)
         st.session_state['chart_dfs'] = {k: v for k, v in st.session_state['chart_dfs'].items() if k in current_keys_set}
         st.session_state['chart_df_keys'] = ordered_keys
         
@@ -1602,6 +1536,8 @@ elif page == "📊 图表生成":
     if st.button("🗑️ 清空所有文件和图表", use_container_width=True):
         st.session_state.uploader_key += 1
         if 'chart_dfs' in st.session_state:
+            for key in st.session_state['chart_dfs']:
+                spill(f"chart_df:{key}", None)
             del st.session_state['chart_dfs']
         if 'chart_df_keys' in st.session_state:
             del st.session_state['chart_df_keys']
@@ -1643,7 +1579,7 @@ elif page == "📊 图表生成":
             if selected_file_name:
                 selected_key = file_keys[file_names.index(selected_file_name)]
                 data = st.session_state['chart_dfs'][selected_key]
-                df, cols = data['df'], data['cols']
+                df, cols = spilled(f"chart_df:{selected_key}"), data['cols']
 
                 with st.expander("📋 预览数据", expanded=False):
                     st.dataframe(df.head(20), use_container_width=True)
@@ -2221,7 +2157,7 @@ elif page == "📊 图表生成":
                 longest_file_key = None
                 max_rows = -1
                 for key in ordered_keys:
-                    num_rows = len(st.session_state['chart_dfs'][key]['df'])
+                    num_rows = st.session_state['chart_dfs'][key]['rows']
                     if num_rows > max_rows:
                         max_rows = num_rows
                         longest_file_key = key
@@ -2264,7 +2200,7 @@ elif page == "📊 图表生成":
 
                 if st.button("📊 生成对比图表", key="gen_compare", use_container_width=True):
                     # Sort files by length (longest first) to control processing and legend order
-                    files_with_lengths = [(k, len(st.session_state['chart_dfs'][k]['df'])) for k in ordered_keys]
+                    files_with_lengths = [(k, st.session_state['chart_dfs'][k]['rows']) for k in ordered_keys]
                     sorted_files = sorted(files_with_lengths, key=lambda item: item[1], reverse=True)
                     sorted_keys = [item[0] for item in sorted_files]
 
@@ -2272,7 +2208,7 @@ elif page == "📊 图表生成":
                     source_order = []
                     for key in sorted_keys:
                         data = st.session_state['chart_dfs'][key]
-                        df_to_process = data['df']
+                        df_to_process = spilled(f"chart_df:{key}")
                         
                         # Ensure the required columns exist before processing
                         if x_axis in df_to_process.columns and y_axis in df_to_process.columns:
@@ -2331,7 +2267,7 @@ elif page == "📊 图表生成":
                         step = st.session_state.get("interval_step_multi", 2)
                         
                         # Use the x-axis from the longest dataframe as the standard for ticks
-                        x_axis_standard_df = st.session_state['chart_dfs'][longest_file_key]['df']
+                        x_axis_standard_df = spilled(f"chart_df:{longest_file_key}")
                         fig = update_xaxis_ticks(fig, x_axis_standard_df[x_axis], angle, threshold, step)
                         
                         fig.update_layout(
@@ -2431,6 +2367,9 @@ elif page == "📊 图表生成":
     st.markdown('</div>', unsafe_allow_html=True)
 
 elif page == "📱 抖音下载":
+    import re
+    import requests
+    from combo_core.douyin import parse_douyin_url, parse_douyin_url_method2, requests_with_retry
     st.markdown("""
         <div style='padding: 30px 0 20px 0;'>
             <h1 style='margin: 0 0 8px 0; font-size: 32px; font-weight: 600; color: var(--text); letter-spacing: -0.5px;'>
@@ -2495,7 +2434,6 @@ elif page == "📱 抖音下载":
     if parse_button and douyin_url_input:
         douyin_url = None
         
-        import re
         url_patterns = [
             r'https?://[^\s]+douyin\.com[^\s]*',
             r'v\.douyin\.com/[^\s]+',
@@ -2518,246 +2456,31 @@ elif page == "📱 抖音下载":
         
         with st.spinner("正在解析视频信息..."):
             try:
-                def parse_douyin_url(url):
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                        'Accept-Encoding': 'gzip, deflate, br',
-                        'Referer': 'https://www.douyin.com/'
-                    }
-                    
-                    # 使用重试机制获取重定向URL
-                    try:
-                        redirect_response = requests_with_retry(url, headers=headers, timeout=15, max_retries=2)
-                        final_url = redirect_response.url
-                    except Exception as e:
-                        st.error(f"❌ 获取重定向URL失败: {str(e)}")
-                        return None
-                    
-                    # 使用重试机制获取HTML内容
-                    try:
-                        html_response = requests_with_retry(final_url, headers=headers, timeout=15, max_retries=2)
-                        html_content = html_response.text
-                    except Exception as e:
-                        st.error(f"❌ 获取页面内容失败: {str(e)}")
-                        return None
-                    
-                    render_data_match = re.search(r'<script id="RENDER_DATA" type="application/json">([^<]+)</script>', html_content)
-                    if not render_data_match:
-                        return None
-                    
-                    import urllib.parse
-                    encoded_data = render_data_match.group(1)
-                    decoded_data = urllib.parse.unquote(encoded_data)
-                    data = json.loads(decoded_data)
-                    
-                    aweme_detail = None
-                    if '23' in data and 'aweme' in data['23'] and 'detail' in data['23']['aweme']:
-                        aweme_detail = data['23']['aweme']['detail']
-                    elif 'aweme' in data and 'detail' in data['aweme']:
-                        aweme_detail = data['aweme']['detail']
-                    
-                    if not aweme_detail:
-                        return None
-                    
-                    result = {
-                        'code': 200,
-                        'message': 'success',
-                        'data': {
-                            'awemeId': aweme_detail.get('awemeId', ''),
-                            'desc': aweme_detail.get('desc', ''),
-                            'create_time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(aweme_detail.get('createTime', 0))),
-                            'author_name': aweme_detail.get('authorInfo', {}).get('nickname', ''),
-                            'author': aweme_detail.get('authorInfo', {}).get('nickname', ''),
-                            'nickname': aweme_detail.get('authorInfo', {}).get('nickname', ''),
-                            'cover': '',
-                            'comment_count': aweme_detail.get('stats', {}).get('commentCount', 0),
-                            'like_count': aweme_detail.get('stats', {}).get('diggCount', 0),
-                            'digg_count': aweme_detail.get('stats', {}).get('diggCount', 0),
-                            'share_count': aweme_detail.get('stats', {}).get('shareCount', 0),
-                            'collect_count': aweme_detail.get('stats', {}).get('collectCount', 0)
-                        }
-                    }
-                    
-                    images = aweme_detail.get('images', [])
-                    if images:
-                        result['data']['type'] = 'image'
-                        result['data']['images'] = []
-                        for img in images:
-                            url_list = img.get('urlList', [])
-                            if url_list:
-                                result['data']['images'].append(url_list[0])
-                        if result['data']['images']:
-                            result['data']['cover'] = result['data']['images'][0]
-                    else:
-                        result['data']['type'] = 'video'
-                        
-                        video_info = aweme_detail.get('video', {})
-                        # 保存原始视频信息用于调试
-                        result['_raw_video_info'] = video_info
-                        video_url = None
-                        
-                        # 尝试多个字段路径获取视频URL - 返回所有可用URL
-                        video_urls = []
-
-                        # 方法1: playAddr数组
-                        play_addr = video_info.get('playAddr', [])
-                        if isinstance(play_addr, list) and len(play_addr) > 0:
-                            for addr_item in play_addr:
-                                if isinstance(addr_item, dict):
-                                    url = addr_item.get('src', '')
-                                elif isinstance(addr_item, str):
-                                    url = addr_item
-                                else:
-                                    url = ''
-                                if url:
-                                    video_urls.append(url.replace('playwm', 'play').replace('\\u002F', '/'))
-
-                        # 方法2: playApi字段
-                        play_api = video_info.get('playApi', '')
-                        if play_api:
-                            video_urls.append(play_api.replace('playwm', 'play').replace('\\u002F', '/'))
-
-                        # 方法3: bitRateList中提取所有URL
-                        bit_rate_list = video_info.get('bitRateList', [])
-                        if bit_rate_list:
-                            for rate_item in bit_rate_list:
-                                # 尝试从多个字段获取URL
-                                url_candidates = []
-
-                                if rate_item.get('playApi'):
-                                    url_candidates.append(rate_item['playApi'])
-
-                                if rate_item.get('playAddr'):
-                                    play_addr_item = rate_item['playAddr']
-                                    if isinstance(play_addr_item, list):
-                                        for addr in play_addr_item:
-                                            if isinstance(addr, dict):
-                                                url = addr.get('src', '')
-                                            elif isinstance(addr, str):
-                                                url = addr
-                                            else:
-                                                url = ''
-                                            if url:
-                                                url_candidates.append(url)
-                                    elif isinstance(play_addr_item, dict):
-                                        url = play_addr_item.get('src', '')
-                                        if url:
-                                            url_candidates.append(url)
-
-                                # 添加找到的所有URL
-                                for url in url_candidates:
-                                    clean_url = url.replace('playwm', 'play').replace('\\u002F', '/')
-                                    if clean_url and clean_url not in video_urls:
-                                        video_urls.append(clean_url)
-
-                        # 方法4: playAddrH265 或 playAddrH264
-                        for field in ['playAddrH265', 'playAddrH264', 'playAddrLowbr']:
-                            play_addr_h = video_info.get(field, [])
-                            if isinstance(play_addr_h, list) and play_addr_h:
-                                for addr_item in play_addr_h:
-                                    if isinstance(addr_item, dict):
-                                        url = addr_item.get('src', '')
-                                    elif isinstance(addr_item, str):
-                                        url = addr_item
-                                    else:
-                                        url = ''
-                                    if url:
-                                        clean_url = url.replace('playwm', 'play').replace('\\u002F', '/')
-                                        if clean_url and clean_url not in video_urls:
-                                            video_urls.append(clean_url)
-
-                        # 方法5: 直接的src或url字段
-                        for field in ['src', 'url']:
-                            url = video_info.get(field, '')
-                            if url:
-                                clean_url = url.replace('playwm', 'play').replace('\\u002F', '/')
-                                if clean_url and clean_url not in video_urls:
-                                    video_urls.append(clean_url)
-
-                        # 方法6: downloadAddr
-                        download_addr = video_info.get('downloadAddr', {})
-                        if isinstance(download_addr, dict):
-                            url_list = download_addr.get('urlList', [])
-                            if url_list:
-                                for url in url_list:
-                                    clean_url = url.replace('playwm', 'play').replace('\\u002F', '/')
-                                    if clean_url and clean_url not in video_urls:
-                                        video_urls.append(clean_url)
-                        elif isinstance(download_addr, str):
-                            clean_url = download_addr.replace('playwm', 'play').replace('\\u002F', '/')
-                            if clean_url and clean_url not in video_urls:
-                                video_urls.append(clean_url)
-
-                        # 确保所有URL都是完整的
-                        final_video_urls = []
-                        for url in video_urls:
-                            if not url.startswith('http'):
-                                url = 'https:' + url if url.startswith('//') else 'https://' + url
-                            if url not in final_video_urls:
-                                final_video_urls.append(url)
-
-                        # 使用多URL尝试机制
-                        if final_video_urls:
-                            best_url = None
-                            try:
-                                # 在Streamlit中运行异步函数
-                                import asyncio
-                                try:
-                                    loop = asyncio.get_event_loop()
-                                except RuntimeError:
-                                    loop = asyncio.new_event_loop()
-                                    asyncio.set_event_loop(loop)
-
-                                best_url = loop.run_until_complete(try_multiple_video_urls(final_video_urls))
-                            except Exception as e:
-                                st.warning(f"⚠️ 多URL尝试失败，使用第一个URL: {str(e)}")
-                                best_url = final_video_urls[0] if final_video_urls else None
-
-                            if best_url:
-                                result['data']['video_url'] = best_url
-                                result['data']['all_video_urls'] = final_video_urls  # 保存所有URL用于调试
-                        else:
-                            st.warning("⚠️ 未找到任何视频URL")
-                        
-                        # 获取封面
-                        cover_list = video_info.get('cover', {}).get('urlList', [])
-                        if not cover_list:
-                            cover_list = video_info.get('dynamicCover', {}).get('urlList', [])
-                        if not cover_list:
-                            cover_list = video_info.get('originCover', {}).get('urlList', [])
-                        
-                        if cover_list:
-                            result['data']['cover'] = cover_list[0]
-                    
-                    return result
-                
                 # 根据用户选择的模式进行解析
                 data = None
                 
                 if parse_mode == "线路1":
                     # 仅使用线路1
                     st.info("🔄 使用线路1 (HTML解析)...")
-                    data = parse_douyin_url(douyin_url)
+                    data = parse_douyin_url(douyin_url, st_notify)
                 elif parse_mode == "线路2":
                     # 仅使用线路2
                     st.info("🔄 使用线路2 (API解析)...")
-                    data = parse_douyin_url_method2(douyin_url)
+                    data = parse_douyin_url_method2(douyin_url, st_notify)
                 else:
                     # 自动模式：先尝试线路1，失败则切换线路2
                     st.info("🔄 自动模式：正在使用线路1解析...")
-                    data = parse_douyin_url(douyin_url)
+                    data = parse_douyin_url(douyin_url, st_notify)
                     
                     if not data:
                         st.info("🔄 线路1失败，切换到线路2...")
-                        data = parse_douyin_url_method2(douyin_url)
+                        data = parse_douyin_url_method2(douyin_url, st_notify)
                 
                 if data:
                     # 显示成功信息，包含使用的线路
                     route_info = "线路2 (API)" if "线路2" in data.get('message', '') else "线路1 (HTML)"
                     st.success(f"✅ 解析成功！({route_info})")
-                    st.session_state['douyin_data'] = data
+                    spill('douyin_data', data)
                     
                     # 检查视频URL是否获取成功
                     if data.get('data', {}).get('type') == 'video':
@@ -2785,8 +2508,8 @@ elif page == "📱 抖音下载":
                     st.code(traceback.format_exc())
     
     # 显示解析结果
-    if 'douyin_data' in st.session_state:
-        data = st.session_state['douyin_data']
+    data = spilled('douyin_data')
+    if data is not None:
         
         if 'code' in data and data['code'] != 200:
             with video_player_placeholder.container():
@@ -2968,7 +2691,8 @@ Accept-Language: zh-CN,zh;q=0.8</pre>
                                             img_response = requests_with_retry(
                                                 img_url, 
                                                 timeout=15,  # 图片使用较短超时
-                                                max_retries=2
+                                                max_retries=2,
+                                                notify=st_notify
                                             )
                                             if img_response.status_code == 200:
                                                 img_bytes = img_response.content
@@ -2996,7 +2720,7 @@ Accept-Language: zh-CN,zh;q=0.8</pre>
                                     for i, img_url in enumerate(images):
                                         try:
                                             # 使用带请求头的方式下载图片
-                                            img_response = requests_with_retry(img_url, timeout=30, max_retries=2)
+                                            img_response = requests_with_retry(img_url, timeout=30, max_retries=2, notify=st_notify)
                                             if img_response.status_code == 200:
                                                 img_bytes = img_response.content
                                                 zip_file.writestr(f"douyin_{i+1}.jpg", img_bytes)
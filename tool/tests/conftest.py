@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试直接导入 tool/ 下的 combo_core，不需要安装
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,164 @@
+"""Row-by-row reference for the generation engine, used by `test_equivalence.py`.
+
+`reference_rows` is the plain generator kept as the original `build_rows` wrote it (rules applied one `re.sub` at a
+time, no compiled rule sets). `check_case` builds one random case (including blank, text and fractional values) and
+compares:
+
+  frame      `build_frame` / `build_frame_pairwise` against the reference rows
+  compact    `materialize_frame` of the compact layout against the full frame
+  stream     the `iter_frames` batches (random batch size), concatenated, against the full frame
+  cache      a `GenerationCache` carried through random edits against a fresh generation after each edit (some
+             edits are first generated without the cache, so the cached run is a memo hit)
+"""
+import copy
+import random
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from combo_core.common import TEMPLATE_COLUMNS, _num
+from combo_core.engine import GenerationCache, build_frame, build_frame_pairwise, clear_result_cache, concat_frames, iter_frames, materialize_frame
+
+RULE_CHOICES = [[], [("abc", "")], [("ABC", "q"), ("-", "")], [("[0-9]+", "#"), ("(", "x")], [("a", "b"), ("b", "c"), ("C", "")]]
+
+
+def _reference_rules(body: str, rules, use_regex: bool, case_sensitive: bool) -> str:
+    flags = 0 if case_sensitive else re.IGNORECASE
+    for old, new in rules:
+        if old == "":
+            continue
+        if use_regex:
+            try:
+                body = re.sub(old, new, body, flags=flags)
+                continue
+            except re.error:
+                pass
+        body = body.replace(old, new) if case_sensitive else re.compile(re.escape(old), re.IGNORECASE).sub(new, body)
+    return body
+
+
+def reference_rows(main_products_df, combos, simplify_rules=None, use_regex=False, case_sensitive=True, apply_to_name=False, pairwise=False) -> List[Dict[str, Any]]:
+    """Rows as the original row-by-row `build_rows` (or, with `pairwise`, `build_rows_pairwise`) produced them."""
+    rules = simplify_rules or []
+    mains = [row for _, row in main_products_df.iterrows()]
+    if pairwise:
+        pairs = [(combos[i] if i < len(combos) else ("", []), [row]) for i, row in enumerate(mains)]
+    else:
+        pairs = [(combo, mains) for combo in combos]
+    rows = []
+    for (prefix, items), block_mains in pairs:
+        for main in block_mains:
+            code, spec = str(main.get("主商品编码", "")), str(main.get("主商品组合颜色规格", ""))
+            if not code or not spec:
+                continue
+            total = {c: sum(_num(it.get(c, 1.0), 1.0) * _num(it.get("数量", 1), 1) for it in items) for c in ["应占售价", "基本售价", "组合成本价"]}
+            row = {col: "" for col in TEMPLATE_COLUMNS}
+            row.update({
+                "组合商品编码": prefix + _reference_rules(code, rules, use_regex, case_sensitive),
+                "组合商品名称": prefix + (_reference_rules(spec, rules, use_regex, case_sensitive) if apply_to_name else spec),
+                "组合颜色规格": spec,
+                "商品编码": code,
+                "数量": _num(main.get("数量"), 1),
+                "应占售价": _num(main.get("应占售价"), 1.0) + total["应占售价"],
+                "基本售价": _num(main.get("基本售价"), 1.0) + total["基本售价"],
+                "组合成本价": _num(main.get("成本价"), 1.0) + total["组合成本价"],
+            })
+            rows.append(row)
+            for it in items:
+                sub = {col: "" for col in TEMPLATE_COLUMNS}
+                sub.update({"商品编码": it["商品编码"], "数量": _num(it.get("数量", 1), 1), "应占售价": _num(it.get("应占售价", 1.0), 1.0),
+                            "基本售价": _num(it.get("基本售价", 1.0), 1.0), "组合成本价": _num(it.get("组合成本价", 1.0), 1.0)})
+                rows.append(sub)
+    return rows
+
+
+def _value(r: random.Random):
+    return r.choice([1, 2, 1.0, 2.5, 0.1, 3, "", None, "x", "4", " 5 ", 1.0000000001, float("nan"), 7.25])
+
+
+def random_mains(r: random.Random, n: int) -> pd.DataFrame:
+    numeric = r.random() < 0.5
+    rows = []
+    for i in range(n):
+        row = {"主商品编码": r.choice([f"M{i:03d}_abc", "", f"ABC-{i}-xyz", "M001_abc"]), "主商品组合颜色规格": r.choice([f"深蓝色-{i}", "", "红色-abc"])}
+        for col in ["数量", "应占售价", "基本售价", "成本价"]:
+            row[col] = r.choice([1, 2, 0.5, 3.0]) if numeric else _value(r)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["主商品编码", "主商品组合颜色规格", "数量", "应占售价", "基本售价", "成本价"])
+
+
+def random_combos(r: random.Random, n: int) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    combos = []
+    for i in range(n):
+        items = []
+        for j in range(r.choice([0, 1, 2, 3])):
+            it = {"商品编码": f"S{i}_{j}"}
+            for col in ["数量", "应占售价", "基本售价", "组合成本价"]:
+                if r.random() < 0.8:
+                    it[col] = _value(r) if r.random() < 0.3 else r.choice([1, 2, 0.5, 1.0, 0.1])
+            items.append(it)
+        combos.append((r.choice(["", "DK_", "PU_", "ab"]), items))
+    return combos
+
+
+def _edit(r: random.Random, mains: pd.DataFrame, combos):
+    op = r.randrange(5)
+    if op == 0 and len(mains):
+        mains = mains.astype(object)
+        mains.iloc[r.randrange(len(mains)), r.randrange(2, 6)] = r.choice([2, 2.5, "", "x", 1.0])
+    elif op == 1 and combos:
+        combos = copy.deepcopy(combos)
+        prefix, items = combos[r.randrange(len(combos))]
+        items.append({"商品编码": "N", "数量": r.choice([1, 3, 1.5])})
+    elif op == 2 and len(mains) > 1:
+        mains = mains.iloc[r.sample(range(len(mains)), len(mains))].reset_index(drop=True)
+    elif op == 3 and len(mains):
+        mains = pd.concat([mains, mains.iloc[:2]], ignore_index=True)
+    else:
+        combos = combos[::-1]
+    return mains, combos
+
+
+def check_case(r: random.Random) -> Optional[str]:
+    """Runs one random case; returns a description of the first mismatch, or None."""
+    mains = random_mains(r, r.choice([0, 1, 3, 7]))
+    combos = random_combos(r, r.choice([0, 1, 2, 4]))
+    kw = dict(simplify_rules=r.choice(RULE_CHOICES), use_regex=r.random() < 0.5, case_sensitive=r.random() < 0.5, apply_to_name=r.random() < 0.5)
+    case = f"{len(mains)} mains × {len(combos)} combos, {kw}"
+
+    def same(got: pd.DataFrame, expected: pd.DataFrame, what: str, **options) -> Optional[str]:
+        try:
+            pd.testing.assert_frame_equal(got.reset_index(drop=True), expected.reset_index(drop=True), check_exact=True, **options)
+        except AssertionError as e:
+            return f"{what} ({case}): {e}"
+        return None
+
+    full = {}
+    for pairwise, build in ((False, build_frame), (True, build_frame_pairwise)):
+        expected = pd.DataFrame(reference_rows(mains, combos, pairwise=pairwise, **kw), columns=TEMPLATE_COLUMNS)
+        clear_result_cache()
+        full[build.__name__] = build(mains, combos, **kw)
+        failure = (same(full[build.__name__], expected, f"{build.__name__} vs reference")
+                   or same(materialize_frame(build(mains, combos, compact=True, **kw)), full[build.__name__], f"{build.__name__} compact"))
+        if failure:
+            return failure
+    batches = list(iter_frames(mains, combos, batch_rows=r.choice([1, 5, 50]), **kw))
+    # 批次里含小数的整数列会变成浮点，只比较取值
+    failure = same(materialize_frame(concat_frames(batches)), full["build_frame"], "iter_frames batches", check_dtype=False)
+    if failure:
+        return failure
+
+    cache = GenerationCache()
+    for _ in range(4):
+        mains, combos = _edit(r, mains, combos)
+        clear_result_cache()
+        if r.random() < 0.5:
+            build_frame(mains, combos, compact=True, **kw)  # 先由不带缓存的调用生成，带缓存的这次命中备忘
+        cached = build_frame(mains, combos, cache=cache, compact=True, **kw)
+        clear_result_cache()
+        failure = (same(cached, build_frame(mains, combos, compact=True, **kw), "GenerationCache after edit")
+                   or same(cache.frame, cached, "GenerationCache baseline after the run"))
+        if failure:
+            return failure
+    return None
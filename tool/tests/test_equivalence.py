@@ -0,0 +1,14 @@
+import os
+import random
+
+import pytest
+
+from reference import check_case
+
+# 随机用例数，默认够日常回归；改动展开代码时可用 COMBO_EQUIVALENCE_CASES=300 跑得更全
+CASES = int(os.environ.get("COMBO_EQUIVALENCE_CASES") or 60)
+
+
+@pytest.mark.parametrize("seed", range(CASES))
+def test_engine_matches_reference(seed):
+    assert check_case(random.Random(seed)) is None
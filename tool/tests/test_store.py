@@ -0,0 +1,77 @@
+import copy
+import json
+
+import pytest
+
+from combo_core import JsonTemplateFile, TemplateStore
+
+
+def _tpl(name, prefix="P"):
+    return {"name": name, "combos": [{"prefix": prefix, "items": [{"商品编码": f"{name}-1", "数量": 1}]}]}
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    path = tmp_path / "templates.json"
+    path.write_text(json.dumps({"templates": [_tpl("A"), _tpl("B")]}, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def test_load_does_not_create_db_and_first_save_migrates(tmp_path, legacy):
+    store = TemplateStore(str(tmp_path / "templates.db"))
+    templates, baseline = store.load()
+    assert [t["name"] for t in templates] == ["A", "B"]
+    assert not (tmp_path / "templates.db").exists()
+    templates[0]["combos"][0]["prefix"] = "A改"
+    store.save(templates, baseline)
+    reloaded, _ = TemplateStore(str(tmp_path / "templates.db")).load()
+    assert reloaded == templates
+
+
+def test_two_writers_on_one_store_keep_each_others_changes(tmp_path, legacy):
+    store = TemplateStore(str(tmp_path / "templates.db"))  # 页面中所有会话共用一个实例
+    a, a_base = store.load()
+    b, b_base = store.load()
+    b.append(_tpl("X"))
+    b_base = store.save(b, b_base)
+    a.append(_tpl("Y"))
+    store.save(a, a_base)
+    assert [t["name"] for t in store.load()[0]] == ["A", "B", "X", "Y"]
+
+
+def test_stale_writer_does_not_undo_edits_or_deletes(tmp_path, legacy):
+    store = TemplateStore(str(tmp_path / "templates.db"))
+    a, a_base = store.load()
+    b, b_base = store.load()
+    b[0]["combos"][0]["prefix"] = "B改"
+    del b[1]
+    store.save(b, b_base)
+    a = copy.deepcopy(a)
+    a.append(_tpl("Y"))
+    store.save(a, a_base)
+    final, _ = store.load()
+    assert [t["name"] for t in final] == ["A", "Y"]
+    assert final[0]["combos"][0]["prefix"] == "B改"
+
+
+def test_removed_template_is_deleted_and_duplicates_are_rejected(tmp_path, legacy):
+    store = TemplateStore(str(tmp_path / "templates.db"))
+    templates, baseline = store.load()
+    baseline = store.save(templates[1:], baseline)
+    assert [t["name"] for t in store.load()[0]] == ["B"]
+    with pytest.raises(ValueError):
+        store.save([_tpl("B"), _tpl("B")], baseline)
+
+
+def test_option_groups_round_trip(tmp_path):
+    store = TemplateStore(str(tmp_path / "templates.db"))
+    tpl = {"name": "选", "combos": [], "options": [{"name": "色", "choices": [{"prefix": "红", "items": [{"商品编码": "S1"}]}, {"prefix": "蓝", "items": []}]}]}
+    store.save([tpl], {})
+    assert store.load()[0] == [tpl]
+
+
+def test_json_file_keeps_the_same_interface(tmp_path, legacy):
+    library = JsonTemplateFile(str(legacy))
+    templates, baseline = library.load()
+    library.save(templates + [_tpl("Z")], baseline)
+    assert [t["name"] for t in library.load()[0]] == ["A", "B", "Z"]